@@ -0,0 +1,3 @@
+""" Benchmarks for the NER+L pipeline, run with:
+    python -m medcat.benchmarks --help
+"""
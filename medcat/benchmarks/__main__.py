@@ -0,0 +1,55 @@
+""" Run the benchmarks on a synthetic model, e.g.:
+    python -m medcat.benchmarks --concepts 20000 --docs 500 --output results.json
+"""
+import json
+import time
+import argparse
+import logging
+
+from medcat.cat import CAT
+from medcat.config import Config
+from medcat.benchmarks.synthetic import make_vocab, make_cdb, make_texts
+from medcat.benchmarks.runner import run_benchmarks, environment, MODES
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog='python -m medcat.benchmarks', description='Benchmark the MedCAT NER+L pipeline on a synthetic model.')
+    parser.add_argument('--concepts', type=int, default=5000, help='Number of concepts in the CDB')
+    parser.add_argument('--words', type=int, default=10000, help='Number of words in the Vocab')
+    parser.add_argument('--vector-size', type=int, default=300, help='Size of the word and context vectors')
+    parser.add_argument('--ambiguity', type=float, default=0.1, help='Fraction of concepts that share a name with another concept')
+    parser.add_argument('--docs', type=int, default=200, help='Number of documents to annotate')
+    parser.add_argument('--doc-length', type=int, default=200, help='Approximate length of a document in words')
+    parser.add_argument('--modes', nargs='+', default=MODES, choices=MODES, help='What to benchmark')
+    parser.add_argument('--nproc', type=int, default=2, help='Number of processes for the multiprocessing modes')
+    parser.add_argument('--spacy-model', default=None, help='spaCy model used by the pipeline, defaults to the one in the config')
+    parser.add_argument('--seed', type=int, default=13)
+    parser.add_argument('--output', default=None, help='Save the results as JSON into this file')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    config = Config()
+    if args.spacy_model is not None:
+        config.general['spacy_model'] = args.spacy_model
+
+    start = time.perf_counter()
+    vocab = make_vocab(n_words=args.words, vector_size=args.vector_size, seed=args.seed)
+    cdb = make_cdb(vocab, n_concepts=args.concepts, ambiguity=args.ambiguity, config=config, seed=args.seed)
+    texts = make_texts(cdb, vocab, n_docs=args.docs, doc_length=args.doc_length, seed=args.seed)
+    cat = CAT(cdb=cdb, config=config, vocab=vocab)
+    setup_seconds = time.perf_counter() - start
+
+    results = {'environment': environment(),
+               'params': vars(args),
+               'setup_seconds': setup_seconds,
+               'results': run_benchmarks(cat, texts, modes=args.modes, nproc=args.nproc)}
+
+    out = json.dumps(results, indent=2)
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            f.write(out)
+    print(out)
+
+
+if __name__ == '__main__':
+    main()
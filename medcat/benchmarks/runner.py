@@ -0,0 +1,159 @@
+""" Throughput, latency and memory measurements for the different ways of running a CAT.
+"""
+import os
+import time
+import platform
+import logging
+import tempfile
+import threading
+import psutil
+import numpy as np
+from typing import Callable, Dict, List, Optional
+
+from medcat import __version__
+from medcat.cat import CAT
+
+
+MODES = ['call', 'get_entities_multi_texts', 'multiprocessing', 'multiprocessing_pipe']
+
+log = logging.getLogger(__name__)
+
+
+class PeakRSS(object):
+    r''' Context manager that samples the resident memory of this process and all its children in a
+    background thread, `peak` is the highest value seen (in bytes).
+
+    Args:
+        interval (`float`, defaults to 0.05):
+            Seconds between two samples.
+    '''
+
+    def __init__(self, interval: float = 0.05) -> None:
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _rss(self) -> int:
+        process = psutil.Process()
+        rss = process.memory_info().rss
+        for child in process.children(recursive=True):
+            try:
+                rss += child.memory_info().rss
+            except psutil.Error:
+                # The child finished in the meantime
+                pass
+        return rss
+
+    def _sample(self) -> None:
+        while not self._stop.is_set():
+            self.peak = max(self.peak, self._rss())
+            self._stop.wait(self.interval)
+
+    def __enter__(self) -> "PeakRSS":
+        self.peak = self._rss()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.peak = max(self.peak, self._rss())
+
+
+def _stats(elapsed: float, n_docs: int, n_tokens: int, peak_rss: int, latencies: Optional[List[float]] = None) -> Dict:
+    out = {'docs': n_docs,
+           'seconds': elapsed,
+           'docs_per_sec': n_docs / elapsed if elapsed > 0 else None,
+           'tokens_per_sec': n_tokens / elapsed if elapsed > 0 else None,
+           'latency_p50_ms': None,
+           'latency_p99_ms': None,
+           'peak_rss_mb': peak_rss / 2**20}
+    if latencies:
+        out['latency_p50_ms'] = float(np.percentile(latencies, 50)) * 1000
+        out['latency_p99_ms'] = float(np.percentile(latencies, 99)) * 1000
+    return out
+
+
+def _measure(run: Callable[[], Optional[List[float]]], n_docs: int, n_tokens: int) -> Dict:
+    with PeakRSS() as rss:
+        start = time.perf_counter()
+        latencies = run()
+        elapsed = time.perf_counter() - start
+    return _stats(elapsed, n_docs, n_tokens, rss.peak, latencies)
+
+
+def run_benchmarks(cat: CAT, texts: List[str], modes: List[str] = MODES, nproc: int = 2,
+                   batch_size_chars: int = 1000000) -> Dict:
+    r''' Annotate `texts` once with each of the `modes` and measure it.
+
+    Args:
+        cat (`medcat.cat.CAT`):
+            The model to benchmark.
+        texts (`List[str]`):
+            Documents to annotate.
+        modes (`List[str]`, defaults to all of `MODES`):
+            `call` annotates the documents one by one with `CAT.__call__` (the only mode with per-document
+            latencies), the other modes are the CAT methods with the same name.
+        nproc (`int`, defaults to 2):
+            Number of processes for the multiprocessing modes.
+        batch_size_chars (`int`, defaults to 1000000):
+            Passed to `CAT.multiprocessing`.
+
+    Returns:
+        A dictionary: {mode: {'docs': .., 'seconds': .., 'docs_per_sec': .., 'tokens_per_sec': .., 'latency_p50_ms': ..,
+        'latency_p99_ms': .., 'peak_rss_mb': ..}, ...}, peak RSS includes the worker processes.
+    '''
+    unknown = set(modes) - set(MODES)
+    if unknown:
+        raise ValueError("Unknown benchmark modes: {}, available: {}".format(sorted(unknown), MODES))
+
+    tokenizer = cat.pipe.spacy_nlp.tokenizer
+    n_tokens = sum(len(tokenizer(text)) for text in texts)
+    data = list(enumerate(texts))
+
+    def call() -> List[float]:
+        latencies = []
+        for text in texts:
+            start = time.perf_counter()
+            cat(text)
+            latencies.append(time.perf_counter() - start)
+        return latencies
+
+    def get_entities_multi_texts() -> None:
+        cat.get_entities_multi_texts(texts, n_process=nproc)
+
+    def multiprocessing() -> None:
+        # Empty directory, otherwise already annotated documents from an earlier run would be skipped
+        with tempfile.TemporaryDirectory() as save_dir_path:
+            cat.multiprocessing(data, nproc=nproc, batch_size_chars=batch_size_chars, save_dir_path=save_dir_path)
+
+    def multiprocessing_pipe() -> None:
+        cat.multiprocessing_pipe(data, nproc=nproc)
+
+    runs: Dict[str, Callable] = {
+        'call': call,
+        'get_entities_multi_texts': get_entities_multi_texts,
+        'multiprocessing': multiprocessing,
+        'multiprocessing_pipe': multiprocessing_pipe,
+    }
+
+    results = {}
+    for mode in modes:
+        log.info("Running benchmark: %s on %s docs", mode, len(texts))
+        results[mode] = _measure(runs[mode], len(texts), n_tokens)
+        log.info("%s: %.1f docs/sec", mode, results[mode]['docs_per_sec'] or 0)
+
+    return results
+
+
+def environment() -> Dict:
+    r''' Details of the machine and versions, stored with the results so that runs can be compared.
+    '''
+    return {'medcat_version': __version__,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'memory_total_mb': psutil.virtual_memory().total / 2**20}
@@ -0,0 +1,133 @@
+""" Synthetic models and texts used by the benchmarks, everything is generated from a seed so
+that two runs with the same parameters annotate exactly the same documents.
+"""
+import numpy as np
+from typing import Dict, List, Optional
+
+from medcat.cdb import CDB
+from medcat.config import Config
+from medcat.vocab import Vocab
+
+
+_SYLLABLES = ['ab', 'ac', 'al', 'an', 'ar', 'bi', 'bro', 'car', 'cho', 'cy', 'de', 'di', 'do', 'em', 'en', 'fi',
+              'ga', 'gen', 'he', 'hy', 'id', 'in', 'ka', 'la', 'le', 'lo', 'ma', 'me', 'mi', 'mo', 'na', 'ne',
+              'no', 'ol', 'om', 'on', 'or', 'pa', 'pe', 'pro', 'ra', 're', 'ri', 'sa', 'se', 'si', 'ta', 'te',
+              'ti', 'to', 'tra', 'ur', 'va', 've', 'vi', 'xa', 'zo']
+_TEMPLATES = ["Patient with {} and {} was seen in clinic today.",
+              "History of {}, no {} reported.",
+              "Started on {} for {}, to be reviewed in 2 weeks.",
+              "{} was ruled out. Known {} since 2015.",
+              "Admitted with suspected {} . Previous {} , stable."]
+
+
+def _words(n: int, rng: np.random.RandomState) -> List[str]:
+    words: List[str] = []
+    seen = set()
+    while len(words) < n:
+        word = "".join(rng.choice(_SYLLABLES, size=rng.randint(2, 5)))
+        if word not in seen:
+            seen.add(word)
+            words.append(word)
+    return words
+
+
+def make_vocab(n_words: int = 10000, vector_size: int = 300, seed: int = 13) -> Vocab:
+    r''' Vocab with `n_words` random words with random vectors and Zipf distributed counts.
+
+    Args:
+        n_words (`int`, defaults to 10000):
+            Number of words.
+        vector_size (`int`, defaults to 300):
+            Size of the word vectors.
+        seed (`int`, defaults to 13):
+            Seed for the random generator.
+    '''
+    rng = np.random.RandomState(seed)
+    vocab = Vocab()
+    for rank, word in enumerate(_words(n_words, rng)):
+        vocab.add_word(word, cnt=int(1000000 / (rank + 1)) + 1, vec=rng.rand(vector_size) - 0.5)
+    vocab.make_unigram_table(table_size=min(100000000, n_words * 1000))
+
+    return vocab
+
+
+def make_cdb(vocab: Vocab, n_concepts: int = 5000, ambiguity: float = 0.1, config: Optional[Config] = None, seed: int = 13) -> CDB:
+    r''' CDB with `n_concepts` concepts, each has 1-3 names built from the words in the vocab and trained
+    (random) context vectors, so that both NER and the disambiguation in the linker are used.
+
+    Args:
+        vocab (`medcat.vocab.Vocab`):
+            Vocab from `make_vocab`.
+        n_concepts (`int`, defaults to 5000):
+            Number of concepts.
+        ambiguity (`float`, defaults to 0.1):
+            Fraction of concepts that share a name with the previous concept.
+        config (`medcat.config.Config`, optional):
+            Config for the CDB, a default one is created if not set.
+        seed (`int`, defaults to 13):
+            Seed for the random generator.
+    '''
+    rng = np.random.RandomState(seed)
+    config = config if config is not None else Config()
+    cdb = CDB(config=config)
+    words = list(vocab.vocab.keys())
+    vector_size = vocab.vectors.shape[1]
+    context_types = list(config.linking['context_vector_sizes'].keys())
+
+    prev_name = None
+    for i in range(n_concepts):
+        cui = "S{:07d}".format(i)
+        raw_names = [" ".join(rng.choice(words, size=rng.randint(1, 4))) for _ in range(rng.randint(1, 4))]
+        if prev_name is not None and rng.rand() < ambiguity:
+            raw_names.append(prev_name)
+        prev_name = raw_names[0]
+
+        names: Dict = {}
+        for raw_name in raw_names:
+            tokens = raw_name.split(" ")
+            snames = set(config.general['separator'].join(tokens[:j]) for j in range(1, len(tokens) + 1))
+            names[config.general['separator'].join(tokens)] = {'tokens': tokens, 'snames': snames, 'raw_name': raw_name,
+                                                               'is_upper': False}
+        cdb.add_concept(cui=cui, names=names, ontologies=set(), name_status='P' if i % 3 == 0 else 'A',
+                        type_ids={'T{:03d}'.format(i % 50)}, description='')
+        cdb.update_context_vector(cui=cui, vectors={ct: rng.rand(vector_size) - 0.5 for ct in context_types})
+        # Above the threshold, so the context similarity is used for linking
+        cdb.cui2count_train[cui] = config.linking['train_count_threshold'] + 1
+
+    return cdb
+
+
+def make_texts(cdb: CDB, vocab: Vocab, n_docs: int = 1000, doc_length: int = 200, seed: int = 13) -> List[str]:
+    r''' Clinical-like documents built from sentence templates, concept names and words from the vocab.
+
+    Args:
+        cdb (`medcat.cdb.CDB`):
+            CDB from `make_cdb`, concept names are taken from it.
+        vocab (`medcat.vocab.Vocab`):
+            Vocab from `make_vocab`.
+        n_docs (`int`, defaults to 1000):
+            Number of documents.
+        doc_length (`int`, defaults to 200):
+            Approximate length of a document in words.
+        seed (`int`, defaults to 13):
+            Seed for the random generator.
+    '''
+    rng = np.random.RandomState(seed)
+    names = sorted(name.replace(cdb.config.general['separator'], " ") for name in cdb.name2cuis.keys())
+    words = list(vocab.vocab.keys())
+    # Frequent words are more likely, same as in real text
+    p = np.array([vocab.count(word) for word in words], dtype=np.float64)
+    p /= p.sum()
+
+    texts = []
+    for _ in range(n_docs):
+        parts: List[str] = []
+        n_words = 0
+        while n_words < doc_length:
+            sentence = _TEMPLATES[rng.randint(len(_TEMPLATES))].format(*rng.choice(names, size=2))
+            filler = " ".join(rng.choice(words, size=rng.randint(3, 12), p=p)).capitalize() + "."
+            parts.extend([sentence, filler])
+            n_words += len(sentence.split(" ")) + len(filler.split(" "))
+        texts.append(" ".join(parts))
+
+    return texts
@@ -6,13 +6,12 @@ import json
 import logging
 import math
 import time
+import queue
 import psutil
-from time import sleep
 from copy import deepcopy
-from multiprocess import Process, Manager, cpu_count
-from multiprocess.queues import Queue
-from multiprocess.synchronize import Lock
-from typing import Union, List, Tuple, Optional, Dict, Iterable, Set
+from multiprocess import Pool, Process, cpu_count
+from multiprocess import Pipe as ProcessPipe
+from typing import Union, List, Tuple, Optional, Dict, Iterable, Iterator, Set, Any, cast
 from itertools import islice, chain, repeat
 from datetime import date
 from tqdm.autonotebook import tqdm, trange
@@ -27,14 +26,16 @@ from medcat.cdb import CDB
 from medcat.utils.matutils import intersect_nonempty_set
 from medcat.utils.loggers import add_handlers
 from medcat.utils.data_utils import make_mc_train_test, get_false_positives
-from medcat.utils.normalizers import BasicSpellChecker
+from medcat.utils.normalizers import BasicSpellChecker, SymSpellChecker
+from medcat.utils.symspell import DeleteIndex
 from medcat.utils.checkpoint import Checkpoint, CheckpointConfig, CheckpointManager
 from medcat.utils.helpers import tkns_from_doc, get_important_config_parameters
 from medcat.utils.hasher import Hasher
+from medcat.utils.context_vector_store import MmapMode
 from medcat.ner.vocab_based_ner import NER
 from medcat.linking.context_based_linker import Linker
 from medcat.utils.filters import get_project_filters, check_filters
-from medcat.preprocessing.cleaners import prepare_name
+from medcat.preprocessing.cleaners import PreparedNameCache
 from medcat.meta_cat import MetaCAT
 from medcat.utils.meta_cat.data_utils import json_to_fake_spacy
 from medcat.config import Config
@@ -42,6 +43,10 @@ from medcat.vocab import Vocab
 from medcat.utils.decorators import deprecated
 
 
+# How often (in seconds) the worker processes are checked while waiting for their results
+MP_POLL_SECONDS = 1
+
+
 class CAT(object):
     r'''
     The main MedCAT class used to annotate documents, it is built on top of spaCy
@@ -107,8 +112,11 @@ class CAT(object):
                              name='skip_and_punct',
                              additional_fields=['is_punct'])
 
-        spell_checker = BasicSpellChecker(cdb_vocab=self.cdb.vocab, config=config, data_vocab=self.vocab)
-        self.pipe.add_token_normalizer(spell_checker=spell_checker, config=config)
+        if config.general.get('spell_checker', 'basic') == 'symspell':
+            self._spell_checker = SymSpellChecker(cdb_vocab=self.cdb.vocab, config=config, data_vocab=self.vocab)
+        else:
+            self._spell_checker = BasicSpellChecker(cdb_vocab=self.cdb.vocab, config=config, data_vocab=self.vocab)
+        self.pipe.add_token_normalizer(spell_checker=self._spell_checker, config=config)
 
         # Add NER
         self.ner = NER(self.cdb, config)
@@ -125,6 +133,9 @@ class CAT(object):
         # Set max document length
         self.pipe.spacy_nlp.max_length = config.preprocessing.get('max_document_length', 1000000)
 
+        # Names prepared with the pipeline for add_and_train_concept and unlink_concept_name
+        self._name_cache = PreparedNameCache(config.preprocessing.get('name_cache_size', 100000))
+
     @deprecated(message="Replaced with cat.pipe.spacy_nlp.")
     def get_spacy_nlp(self) -> Language:
         ''' Returns the spacy pipeline with MedCAT
@@ -182,17 +193,22 @@ class CAT(object):
             version['medcat_version'] = __version__
             self.log.warning("Please consider updating [description, performance, location, ontology] in cat.config.version")
 
-    def create_model_pack(self, save_dir_path: str, model_pack_name: str = DEFAULT_MODEL_PACK_NAME) -> str:
+    def create_model_pack(self, save_dir_path: str, model_pack_name: str = DEFAULT_MODEL_PACK_NAME, mmap_vectors: bool = False) -> str:
         r''' Will crete a .zip file containing all the models in the current running instance
         of MedCAT. This is not the most efficient way, for sure, but good enough for now.
 
         model_pack_name - an id will be appended to this name
+        mmap_vectors - if True the vocab and CDB vectors are saved as .npy files that are memory-mapped
+            on load, processes on one host that load the same model pack will then share the vectors
 
         returns:
             Model pack name
         '''
         # Spacy model always should be just the name, but during loading it can be reset to path
         self.config.general['spacy_model'] = os.path.basename(self.config.general['spacy_model'])
+        if mmap_vectors:
+            # Done before versioning as it changes the CDB hash
+            self.cdb.compact_context_vectors()
         # Versioning
         self._versioning()
         model_pack_name += "_{}".format(self.config.version['id'])
@@ -212,14 +228,18 @@ class CAT(object):
 
         # Save the CDB
         cdb_path = os.path.join(save_dir_path, "cdb.dat")
-        self.cdb.save(cdb_path)
+        self.cdb.save(cdb_path, mmap_vectors=mmap_vectors)
 
         # Save the Vocab
         vocab_path = os.path.join(save_dir_path, "vocab.dat")
         if self.vocab is None:
             raise ValueError("Model pack creation is failed due to the missing 'vocab'")
         else:
-            self.vocab.save(vocab_path)
+            self.vocab.save(vocab_path, mmap_vectors=mmap_vectors)
+
+        # Save the spell check index, so that it does not have to be built on load
+        if isinstance(self._spell_checker, SymSpellChecker):
+            self._spell_checker.get_index().save(os.path.join(save_dir_path, "spell_check_index.dat"))
 
         # Save all meta_cats
         for comp in self.pipe.spacy_nlp.components:
@@ -240,7 +260,7 @@ class CAT(object):
         return model_pack_name
 
     @classmethod
-    def load_model_pack(cls, zip_path: str, meta_cat_config_dict: Optional[Dict] = None) -> "CAT":
+    def load_model_pack(cls, zip_path: str, meta_cat_config_dict: Optional[Dict] = None, mmap_mode: Optional[MmapMode] = 'c') -> "CAT":
         r"""Load everything within the 'model pack', i.e. the CDB, config, vocab and any MetaCAT models
         (if present)
 
@@ -250,6 +270,9 @@ class CAT(object):
             meta_cat_config_dict:
                 A config dict that will overwrite existing configs in meta_cat.
                 e.g. meta_cat_config_dict = {'general': {'device': 'cpu'}}
+            mmap_mode:
+                For model packs created with `mmap_vectors=True`, the mode used to memory-map the vectors.
+                The default is copy-on-write, None loads the vectors into memory.
         """
         from medcat.cdb import CDB
         from medcat.vocab import Vocab
@@ -268,14 +291,17 @@ class CAT(object):
 
         # Load the CDB
         cdb_path = os.path.join(model_pack_path, "cdb.dat")
-        cdb = CDB.load(cdb_path)
+        if not os.path.exists(cdb_path) and os.path.isdir(os.path.join(model_pack_path, "cdb")):
+            # Sectioned CDB, see medcat.utils.cdb_sections
+            cdb_path = os.path.join(model_pack_path, "cdb")
+        cdb = CDB.load(cdb_path, mmap_mode=mmap_mode)
 
         # Modify the config to contain full path to spacy model
         cdb.config.general['spacy_model'] = os.path.join(model_pack_path, os.path.basename(cdb.config.general['spacy_model']))
 
         # Load Vocab
         vocab_path = os.path.join(model_pack_path, "vocab.dat")
-        vocab = Vocab.load(vocab_path)
+        vocab = Vocab.load(vocab_path, mmap_mode=mmap_mode)
 
         # Find meta models in the model_pack
         meta_paths = [os.path.join(model_pack_path, path) for path in os.listdir(model_pack_path) if path.startswith('meta_')]
@@ -285,6 +311,12 @@ class CAT(object):
                                           config_dict=meta_cat_config_dict))
 
         cat = cls(cdb=cdb, config=cdb.config, vocab=vocab, meta_cats=meta_cats)
+
+        # Load the spell check index if it was saved
+        index_path = os.path.join(model_pack_path, "spell_check_index.dat")
+        if isinstance(cat._spell_checker, SymSpellChecker) and os.path.exists(index_path):
+            cat._spell_checker.index = DeleteIndex.load(index_path)
+
         cls.log.info(cat.get_model_card()) # Print the model card
         return cat
 
@@ -314,6 +346,21 @@ class CAT(object):
             text = self._get_trimmed_text(str(text))
             return self.pipe(text)
 
+    def _call_cached(self, text: str, doc_cache: Optional[Dict]) -> Optional[Doc]:
+        r''' Same as `self(text)`, but if `doc_cache` is set the preprocessed document is taken from it
+        (or added to it) and only the NER and linking are run, see `Pipe.preprocess`.
+        '''
+        if doc_cache is None:
+            return self(text)
+
+        self.config.linking['train'] = False
+        text = self._get_trimmed_text(str(text))
+        if not text:
+            return None
+        if text not in doc_cache:
+            doc_cache[text] = self.pipe.preprocess(text)
+        return self.pipe.annotate(doc_cache[text])
+
     def _print_stats(self,
                      data: Dict,
                      epoch: int = 0,
@@ -321,7 +368,8 @@ class CAT(object):
                      use_overlaps: bool = False,
                      use_cui_doc_limit: bool = False,
                      use_groups: bool = False,
-                     extra_cui_filter: Optional[Set] = None) -> Tuple:
+                     extra_cui_filter: Optional[Set] = None,
+                     doc_cache: Optional[Dict] = None) -> Tuple:
         r''' TODO: Refactor and make nice
         Print metrics on a dataset (F1, P, R), it will also print the concepts that have the most FP,FN,TP.
 
@@ -343,6 +391,8 @@ class CAT(object):
                 If True concepts that have groups will be combined and stats will be reported on groups.
             extra_cui_filter(Optional[Set]):
                 This filter will be intersected with all other filters, or if all others are not set then only this one will be used.
+            doc_cache (Optional[Dict]):
+                If set, documents are preprocessed only once and kept here (text to the preprocessed document), see `train_supervised`.
 
         Returns:
             fps (dict):
@@ -411,7 +461,7 @@ class CAT(object):
                     else:
                         filters['cuis'] = {'empty'}
 
-                spacy_doc: Doc = self(doc['text'])
+                spacy_doc: Doc = self._call_cached(doc['text'], doc_cache)
 
                 if use_overlaps:
                     p_anns = spacy_doc._.ents
@@ -568,7 +618,9 @@ class CAT(object):
               fine_tune: bool = True,
               progress_print: int = 1000,
               checkpoint: Optional[Checkpoint] = None,
-              is_resumed: bool = False) -> None:
+              is_resumed: bool = False,
+              nproc: int = 1,
+              sync_every: int = 10000) -> None:
         """ Runs training on the data, note that the maximum length of a line
         or document is 1M characters. Anything longer will be trimmed.
 
@@ -586,6 +638,13 @@ class CAT(object):
                 The MedCAT checkpoint object
             is_resumed (bool):
                 If True resume the previous training; If False, start a fresh new training.
+            nproc (int):
+                If larger than 1 the training is done in rounds of `sync_every` lines. In each round the lines
+                are split into `nproc` shards, every shard is used to train a copy of the CDB in a worker process
+                and the training from all copies is merged back (see `CDB.merge_training_deltas`). The result
+                is not the same as with one process, but close for large datasets.
+            sync_every (int):
+                Number of lines in one round of multiprocess training, the CDB copies are merged after every round.
         """
         if not fine_tune:
             self.log.info("Removing old training data!")
@@ -594,18 +653,14 @@ class CAT(object):
 
         latest_trained_step = checkpoint.count if checkpoint is not None else 0
         epochal_data_iterator = chain.from_iterable(repeat(data_iterator, nepochs))
+        if nproc > 1:
+            self._train_multiprocessing(islice(epochal_data_iterator, latest_trained_step, None), latest_trained_step,
+                                        progress_print, checkpoint, nproc, sync_every)
+            self.config.linking['train'] = False
+            return
+
         for line in islice(epochal_data_iterator, latest_trained_step, None):
-            if line is not None and line:
-                # Convert to string
-                line = str(line).strip()
-
-                try:
-                    _ = self(line, do_train=True)
-                except Exception as e:
-                    self.log.warning("LINE: '%s...' \t WAS SKIPPED", line[0:100])
-                    self.log.warning("BECAUSE OF: %s", str(e))
-            else:
-                self.log.warning("EMPTY LINE WAS DETECTED AND SKIPPED")
+            self._train_line(line)
 
             latest_trained_step += 1
             if latest_trained_step % progress_print == 0:
@@ -615,6 +670,73 @@ class CAT(object):
 
         self.config.linking['train'] = False
 
+    def _train_line(self, line: Any) -> None:
+        if line is not None and line:
+            # Convert to string
+            line = str(line).strip()
+
+            try:
+                _ = self(line, do_train=True)
+            except Exception as e:
+                self.log.warning("LINE: '%s...' \t WAS SKIPPED", line[0:100])
+                self.log.warning("BECAUSE OF: %s", str(e))
+        else:
+            self.log.warning("EMPTY LINE WAS DETECTED AND SKIPPED")
+
+    def _train_multiprocessing(self,
+                               lines: Iterator,
+                               latest_trained_step: int,
+                               progress_print: int,
+                               checkpoint: Optional[Checkpoint],
+                               nproc: int,
+                               sync_every: int) -> None:
+        r""" Unsupervised training in rounds, see `train` with `nproc` > 1.
+        """
+        # One worker per shard for the whole run, each with a copy of the CDB that is brought up to date with
+        #the merged training from the last round before it trains on its next shard.
+        workers = []
+        try:
+            for _ in range(nproc):
+                conn, worker_conn = ProcessPipe()
+                worker = Process(target=_mp_train_worker, args=(self, worker_conn), daemon=True)
+                worker.start()
+                workers.append((worker, conn))
+
+            state = None
+            while True:
+                round_lines = list(islice(lines, sync_every))
+                if not round_lines:
+                    break
+                shard_size = -(-len(round_lines) // nproc)
+                for i, (_, conn) in enumerate(workers):
+                    conn.send((state, round_lines[i * shard_size:(i + 1) * shard_size]))
+                deltas = []
+                for worker, conn in workers:
+                    while not conn.poll(MP_POLL_SECONDS):
+                        self._check_workers([worker])
+                    delta = conn.recv()
+                    if isinstance(delta, BaseException):
+                        raise delta
+                    deltas.append(delta)
+                self.cdb.merge_training_deltas(deltas)
+                state = self.cdb.get_training_state(set(cui for delta in deltas for cui in delta['cuis']),
+                                                    set(name for delta in deltas for name in delta['names']))
+
+                previous_step = latest_trained_step
+                latest_trained_step += len(round_lines)
+                if latest_trained_step // progress_print > previous_step // progress_print:
+                    self.log.info("DONE: %s", str(latest_trained_step))
+                if checkpoint is not None and checkpoint.steps is not None and \
+                        latest_trained_step // checkpoint.steps > previous_step // checkpoint.steps:
+                    checkpoint.save(cdb=self.cdb, count=latest_trained_step)
+        finally:
+            for worker, conn in workers:
+                if worker.is_alive():
+                    conn.send(None)
+                worker.join(timeout=MP_POLL_SECONDS)
+                if worker.is_alive():
+                    worker.terminate()
+
     def add_cui_to_group(self, cui: str, group_name: str) -> None:
         r"""
         Ads a CUI to a group, will appear in cdb.addl_info['cui2group']
@@ -652,7 +774,7 @@ class CAT(object):
         if preprocessed_name:
             names = {name: 'nothing'}
         else:
-            names = prepare_name(name, self.pipe.spacy_nlp, {}, self.config)
+            names = self._name_cache.prepare_name(name, self.pipe.spacy_nlp, {}, self.config)
 
         # If full unlink find all CUIs
         if self.config.general.get('full_unlink', False):
@@ -698,7 +820,7 @@ class CAT(object):
             \*\*other:
                 Refer to medcat.cat.cdb.CDB.add_concept
         """
-        names = prepare_name(name, self.pipe.spacy_nlp, {}, self.config)
+        names = self._name_cache.prepare_name(name, self.pipe.spacy_nlp, {}, self.config)
         # Only if not negative, otherwise do not add the new name if in fact it should not be detected
         if do_add_concept and not negative:
             self.cdb.add_concept(cui=cui, names=names, ontologies=ontologies, name_status=name_status, type_ids=type_ids, description=description,
@@ -736,7 +858,8 @@ class CAT(object):
                          train_from_false_positives: bool = False,
                          extra_cui_filter: Optional[Set] = None,
                          checkpoint: Optional[Checkpoint] = None,
-                         is_resumed: bool = False) -> Tuple:
+                         is_resumed: bool = False,
+                         cache_docs: bool = False) -> Tuple:
         r""" TODO: Refactor, left from old
         Run supervised training on a dataset from MedCATtrainer. Please take care that this is more a simulated
         online training then supervised.
@@ -781,6 +904,10 @@ class CAT(object):
                 The MedCAT CheckpointST object
             is_resumed (bool):
                 If True resume the previous training; If False, start a fresh new training.
+            cache_docs (bool):
+                If True each document is tokenized, tagged and normalized only once and kept in memory, in later
+                epochs and when printing stats only the NER and linking are run again. Faster for many epochs, but
+                spelling fixes to words that were added to the CDB during training are not applied.
         Returns:
             fp (dict):
                 False positives for each CUI
@@ -806,6 +933,8 @@ class CAT(object):
         filters = self.config.linking['filters']
 
         fp = fn = tp = p = r = f1 = examples = {}
+        # Text to the preprocessed document
+        doc_cache: Optional[Dict] = {} if cache_docs else None
         with open(data_path) as f:
             data = json.load(f)
         cui_counts = {}
@@ -823,7 +952,8 @@ class CAT(object):
                                                                            use_cui_doc_limit=use_cui_doc_limit,
                                                                            use_overlaps=use_overlaps,
                                                                            use_groups=use_groups,
-                                                                           extra_cui_filter=extra_cui_filter)
+                                                                           extra_cui_filter=extra_cui_filter,
+                                                                           doc_cache=doc_cache)
         if reset_cui_count:
             # Get all CUIs
             cuis = []
@@ -869,7 +999,7 @@ class CAT(object):
 
                 for idx_doc in trange(current_document, len(project['documents']), initial=current_document, total=len(project['documents']), desc='Document', leave=False):
                     doc = project['documents'][idx_doc]
-                    spacy_doc: Doc = self(doc['text'])
+                    spacy_doc: Doc = self._call_cached(doc['text'], doc_cache)
 
                     # Compatibility with old output where annotations are a list
                     doc_annotations = self._get_doc_annotations(doc)
@@ -918,7 +1048,8 @@ class CAT(object):
                                                                                use_cui_doc_limit=use_cui_doc_limit,
                                                                                use_overlaps=use_overlaps,
                                                                                use_groups=use_groups,
-                                                                               extra_cui_filter=extra_cui_filter)
+                                                                               extra_cui_filter=extra_cui_filter,
+                                                                               doc_cache=doc_cache)
 
         # Set the filters again
         self.config.linking['filters'] = _filters
@@ -1073,17 +1204,22 @@ class CAT(object):
                         separate_nn_components: bool = True,
                         out_split_size_chars: Optional[int] = None,
                         save_dir_path: str = os.path.abspath(os.getcwd()),
-                        min_free_memory=0.1) -> Dict:
+                        min_free_memory=0.1,
+                        max_in_flight: Optional[int] = None) -> Dict:
         r""" Run multiprocessing for inference, if out_save_path and out_split_size_chars is used this will also continue annotating
         documents if something is saved in that directory.
 
+        The documents are annotated by a pool of worker processes that stays alive for the whole call, the input is
+        consumed lazily and at most `max_in_flight` internal batches are waiting in the pool at any time.
+
         Args:
             data:
                 Iterator or array with format: [(id, text), (id, text), ...]
             nproc (`int`, defaults to 8):
                 Number of processors
             batch_size_chars (`int`, defaults to 1000000):
-                Size of a batch in number of characters, this should be around: NPROC * average_document_length * 200
+                Size of a batch in number of characters, this should be around: NPROC * average_document_length * 200.
+                The NN components are run and the output is checked for splitting once per batch.
             separate_nn_components (`bool`, defaults to True):
                 If set the medcat pipe will be broken up into NN and not-NN components and
                 they will be run sequentially. This is useful as the NN components
@@ -1096,9 +1232,11 @@ class CAT(object):
             save_dir_path(`str`, defaults to the current working directory):
                 Where to save the annotated documents if splitting.
             min_free_memory(`float`, defaults to 0.1):
-                If set a process will not start unless there is at least this much RAM memory left,
+                If set no new work will be sent to the workers unless there is at least this much RAM memory left,
                 should be a range between [0, 1] meaning how much of the memory has to be free. Helps when annotating
                 very large datasets because spacy is not the best with memory management and multiprocessing.
+            max_in_flight (`int`, optional):
+                Maximum number of internal batches sent to the workers and not yet collected, defaults to 2*nproc.
 
         Returns:
             A dictionary: {id: doc_json, id2: doc_json2, ...}, in case out_split_size_chars is used
@@ -1131,26 +1269,40 @@ class CAT(object):
             annotated_ids = []
             part_counter = 0
 
-        docs = {}
+        docs: Dict = {}
+        _docs: Dict = {} # Docs of the current batch, the NN components are run on these
+        _id2text: Dict = {}
+        _chars = 0
         _start_time = time.time()
         _batch_counter = 0 # Used for splitting the output, counts batches inbetween saves
-        for batch in self._batch_generator(data, batch_size_chars, skip_ids=set(annotated_ids)):
+
+        batches = self._batch_generator(data, internal_batch_size_chars, skip_ids=set(annotated_ids))
+        results = self._mp_imap(batches, nproc=nproc, only_cui=only_cui, addl_info=addl_info,
+                                min_free_memory=min_free_memory, ordered=False, max_in_flight=max_in_flight)
+        # The final empty item is there to flush the last (not full) batch
+        for last, (batch, batch_docs) in chain(zip(repeat(False), results), [(True, ([], {}))]):
+            _docs.update(batch_docs)
+            _chars += sum(len(str(text)) for _, text in batch)
+            if nn_components:
+                # We need this for the json_to_fake_spacy
+                _id2text.update({k:v for k,v in batch})
+            if _chars < batch_size_chars and not (last and _docs):
+                continue
+
             self.log.info("Annotated until now: %s docs; Current BS: %s docs; Elapsed time: %.2f minutes",
-                          len(annotated_ids),
-                          len(batch),
+                          len(annotated_ids) + len(_docs),
+                          len(_docs),
                           (time.time() - _start_time)/60)
             try:
-                _docs = self._multiprocessing_batch(data=batch,
-                                                    nproc=nproc,
-                                                    only_cui=only_cui,
-                                                    batch_size_chars=internal_batch_size_chars,
-                                                    addl_info=addl_info,
-                                                    nn_components=nn_components,
-                                                    min_free_memory=min_free_memory)
+                # If we have separate GPU components now we pipe that
+                if nn_components:
+                    try:
+                        self._run_nn_components(_docs, nn_components, id2text=_id2text)
+                    except Exception as e:
+                        self.log.warning(e, exc_info=True, stack_info=True)
                 docs.update(_docs)
                 annotated_ids.extend(_docs.keys())
                 _batch_counter += 1
-                del _docs
                 if out_split_size_chars is not None and (_batch_counter * batch_size_chars) > out_split_size_chars:
                     # Save to file and reset the docs 
                     part_counter = self._save_docs_to_file(docs=docs,
@@ -1164,6 +1316,9 @@ class CAT(object):
             except Exception as e:
                 self.log.warning("Failed an outer batch in the multiprocessing script")
                 self.log.warning(e, exc_info=True, stack_info=True)
+            _docs = {}
+            _id2text = {}
+            _chars = 0
 
         # Save the last batch
         if out_split_size_chars is not None and len(docs) > 0:
@@ -1182,75 +1337,99 @@ class CAT(object):
 
         return docs
 
-    def _multiprocessing_batch(self,
-                               data: Union[List[Tuple], Iterable[Tuple]],
-                               nproc: int = 8,
-                               batch_size_chars: int = 1000000,
-                               only_cui: bool = False,
-                               addl_info: List[str] = [],
-                               nn_components: List = [],
-                               min_free_memory: int = 0) -> Dict:
-        r""" Run multiprocessing on one batch
+    def _mp_imap(self,
+                 batches: Iterable[List[Tuple]],
+                 nproc: int = 2,
+                 only_cui: bool = False,
+                 addl_info: List[str] = [],
+                 min_free_memory: float = 0,
+                 ordered: bool = True,
+                 max_in_flight: Optional[int] = None) -> Iterator[Tuple[List[Tuple], Dict]]:
+        r""" Annotate batches of documents in a pool of worker processes. The pool is created once and stays alive until
+        the input is exhausted (or the generator is closed), the input is consumed lazily.
 
         Args:
-            data:
-                Iterator or array with format: [(id, text), (id, text), ...]
-            nproc (`int`, defaults to 8):
-                Number of processors
-            batch_size_chars (`int`, defaults to 1000000):
-                Size of a batch in number of characters
-
-        Returns:
-            A dictionary: {id: doc_json, id2: doc_json2, ...}
+            batches:
+                Iterable of batches, each with format: [(id, text), (id, text), ...]
+            nproc (`int`, defaults to 2):
+                Number of worker processes.
+            min_free_memory (`float`, defaults to 0):
+                No new batches are sent to the workers while less than this fraction of the RAM is free, unless the
+                workers have nothing to do.
+            ordered (`bool`, defaults to True):
+                If True the results are yielded in the order of the input batches, otherwise as soon as they are done.
+            max_in_flight (`int`, optional):
+                Maximum number of batches sent to the workers and not yet yielded, defaults to 2*nproc.
+
+        Yields:
+            Tuples (batch, {id: doc_json, id2: doc_json2, ...}), one for every input batch.
         """
-        # Create the input output for MP
-        with Manager() as manager:
-            out_list = manager.list()
-            lock = manager.Lock()
-            in_q = manager.Queue(maxsize=10*nproc)
-
-            id2text = {}
-            for batch in self._batch_generator(data, batch_size_chars):
-                if nn_components:
-                    # We need this for the json_to_fake_spacy
-                    id2text.update({k:v for k,v in batch})
-                in_q.put(batch)
+        max_in_flight = max_in_flight if max_in_flight is not None else 2 * nproc
+        # Filled by the result handler thread of the pool
+        done: queue.Queue = queue.Queue()
+        pending: Dict[int, List[Tuple]] = {}
+        finished: Dict[int, Dict] = {}
+        batches = iter(batches)
+        n_submitted = 0
+        n_yielded = 0
+        exhausted = False
+
+        with Pool(nproc, initializer=_mp_init, initargs=(self,)) as pool:
+            # The workers never exit on their own, if one does its task is lost and would never be done
+            workers = list(pool._pool)
+            while True:
+                while not exhausted and len(pending) < max_in_flight and not (pending and self._low_memory(min_free_memory)):
+                    batch = next(batches, None)
+                    if batch is None:
+                        exhausted = True
+                        break
+                    pending[n_submitted] = batch
+                    pool.apply_async(_mp_annotate, (batch, only_cui, addl_info),
+                                     callback=lambda out, i=n_submitted: done.put((i, out)),
+                                     error_callback=lambda e, i=n_submitted: done.put((i, e)))
+                    n_submitted += 1
+                if not pending:
+                    break
 
-            # Final data point for workers
-            for _ in range(nproc):
-                in_q.put(None)
-            sleep(2)
-
-            # Create processes
-            procs = []
-            for i in range(nproc):
-                p = Process(target=self._mp_cons,
-                            kwargs={'in_q': in_q,
-                                    'out_list': out_list,
-                                    'pid': i,
-                                    'only_cui': only_cui,
-                                    'addl_info': addl_info,
-                                    'min_free_memory': min_free_memory,
-                                    'lock': lock})
-                p.start()
-                procs.append(p)
-
-            # Join processes
-            for p in procs:
-                p.join()
-
-            docs = {}
-            # Covnerts a touple into a dict
-            docs.update({k:v for k,v in out_list})
-
-        # If we have separate GPU components now we pipe that
-        if nn_components:
+                i, out = self._mp_get(done, workers)
+                if isinstance(out, BaseException):
+                    self.log.warning("Failed a batch of %s documents in the multiprocessing pool", len(pending[i]))
+                    self.log.warning(out, exc_info=out)
+                    out = {}
+                finished[i] = out
+
+                if ordered:
+                    while n_yielded in finished:
+                        yield pending.pop(n_yielded), finished.pop(n_yielded)
+                        n_yielded += 1
+                else:
+                    yield pending.pop(i), finished.pop(i)
+
+    @classmethod
+    def _mp_get(cls, done: queue.Queue, workers: List) -> Any:
+        r''' Next result from `done`, fails instead of waiting forever if one of the `workers` died (see `_check_workers`).
+        '''
+        while True:
             try:
-                self._run_nn_components(docs, nn_components, id2text=id2text)
-            except Exception as e:
-                self.log.warning(e, exc_info=True, stack_info=True)
+                return done.get(timeout=MP_POLL_SECONDS)
+            except queue.Empty:
+                cls._check_workers(workers)
 
-        return docs
+    @staticmethod
+    def _check_workers(workers: List) -> None:
+        r''' Raises a RuntimeError if one of the `workers` exited (e.g. it was killed by the OOM killer), its task is lost.
+        '''
+        for worker in workers:
+            if worker.exitcode is not None:
+                raise RuntimeError("A worker process (PID: {}) exited unexpectedly with exit code {}, most likely it was "
+                                   "killed because the machine ran out of memory".format(worker.pid, worker.exitcode))
+
+    @staticmethod
+    def _low_memory(min_free_memory: float) -> bool:
+        if not min_free_memory:
+            return False
+        memory = psutil.virtual_memory()
+        return memory.available / memory.total < min_free_memory
 
     def multiprocessing_pipe(self,
                              in_data: Union[List[Tuple], Iterable[Tuple]],
@@ -1304,36 +1483,53 @@ class CAT(object):
 
         return out
 
-    def _mp_cons(self, in_q: Queue, out_list: List, min_free_memory: int, lock: Lock, pid: int = 0, only_cui: bool = False, addl_info: List = []) -> None:
-        out: List = []
+    def multiprocessing_pipe_stream(self,
+                                    in_data: Iterable[Tuple],
+                                    nproc: Optional[int] = None,
+                                    batch_size: int = 16,
+                                    only_cui: bool = False,
+                                    addl_info: List[str] = [],
+                                    ordered: bool = True,
+                                    max_in_flight: Optional[int] = None) -> Iterator[Tuple]:
+        r""" Streaming variant of `multiprocessing_pipe`, NOT FOR TRAINING. The input is consumed lazily and only
+        a bounded number of documents is in memory at any time, so the input can be larger than the RAM.
 
-        while True:
-            if not in_q.empty():
-                if psutil.virtual_memory().available / psutil.virtual_memory().total < min_free_memory:
-                    with lock:
-                        out_list.extend(out)
-                    # Stop a process if there is not enough memory left
-                    break
+        Args:
+            in_data:
+                Any iterable with format: [(id, text), (id, text), ...], ids should be unique
+            nproc (`int`, optional):
+                Number of worker processes, defaults to the number of CPUs - 1.
+            batch_size (`int`, defaults to 16):
+                Number of documents sent to a worker at once.
+            ordered (`bool`, defaults to True):
+                If True the output is in the same order as the input, otherwise documents are yielded as
+                soon as they are annotated.
+            max_in_flight (`int`, optional):
+                Maximum number of batches sent to the workers and not yet yielded, defaults to 2*nproc.
+
+        Yields:
+            Tuples (id, doc_json), documents that failed get an empty output.
+        """
+        if nproc == 0:
+            raise ValueError("nproc cannot be set to zero")
+        n_process = nproc if nproc is not None else max(cpu_count() - 1, 1)
 
-                data = in_q.get()
-                if data is None:
-                    with lock:
-                        out_list.extend(out)
-                    break
+        self.pipe.spacy_nlp.max_length = self.config.preprocessing.get('max_document_length', 1000000)
+        if self._meta_cats:
+            # Same as in multiprocessing, torch multithreading does not play well with the worker processes
+            import torch
+            torch.set_num_threads(1)
 
-                for i_text, text in data:
-                    try:
-                        # Annotate document
-                        doc = self.get_entities(text=text, only_cui=only_cui, addl_info=addl_info)
-                        out.append((i_text, doc))
-                    except Exception as e:
-                        self.log.warning("PID: %s failed one document in _mp_cons, running will continue normally. \n" +
-                                         "Document length in chars: %s, and ID: %s", pid, len(str(text)), i_text)
-                        self.log.warning(str(e))
-        sleep(2)
+        data = iter(in_data)
+        batches = iter(lambda: list(islice(data, batch_size)), [])
+        for batch, docs in self._mp_imap(batches, nproc=n_process, only_cui=only_cui, addl_info=addl_info,
+                                         ordered=ordered, max_in_flight=max_in_flight):
+            for i_text, _ in batch:
+                out = docs.get(i_text)
+                yield i_text, out if out is not None else self._doc_to_out(None, only_cui, addl_info)
 
     def _doc_to_out(self,
-                    doc: Doc,
+                    doc: Optional[Doc],
                     only_cui: bool,
                     addl_info: List[str],
                     out_with_text: bool = False) -> Dict:
@@ -1444,3 +1640,48 @@ class CAT(object):
 
     def destroy_pipe(self):
         self.pipe.destroy()
+
+
+# The CAT instance used by the worker processes of `CAT._mp_imap`, set once per worker by `_mp_init`
+_mp_cat: Optional[CAT] = None
+
+
+def _mp_init(cat: CAT) -> None:
+    global _mp_cat
+    _mp_cat = cat
+
+
+def _mp_train_worker(cat: CAT, conn: Any) -> None:
+    r''' Worker of `CAT._train_multiprocessing`, gets (state, lines) from `conn` until it gets None. The state from
+    `CDB.get_training_state` is set before training on the lines, the training is sent back as a delta.
+    '''
+    while True:
+        task = conn.recv()
+        if task is None:
+            break
+        state, lines = task
+        try:
+            if state is not None:
+                cat.cdb.set_training_state(state)
+            cui2count_train = dict(cat.cdb.cui2count_train)
+            name2count_train = dict(cat.cdb.name2count_train)
+            cat.cdb.track_updates()
+            for line in lines:
+                cat._train_line(line)
+            conn.send(cat.cdb.get_training_delta(cui2count_train, name2count_train))
+        except Exception as e:
+            conn.send(e)
+
+
+def _mp_annotate(batch: List[Tuple], only_cui: bool, addl_info: List[str]) -> Dict:
+    cat = cast(CAT, _mp_cat)
+    out: Dict = {}
+    for i_text, text in batch:
+        try:
+            # Annotate document
+            out[i_text] = cat.get_entities(text=text, only_cui=only_cui, addl_info=addl_info)
+        except Exception as e:
+            cat.log.warning("PID: %s failed one document in _mp_annotate, running will continue normally. \n" +
+                            "Document length in chars: %s, and ID: %s", os.getpid(), len(str(text)), i_text)
+            cat.log.warning(str(e))
+    return out
@@ -1,16 +1,19 @@
 """ Representation class for CDB data
 """
+import os
 import dill
 import json
 import logging
 import aiofiles
 import numpy as np
-from typing import Dict, Set, Optional, List, Union, cast
+from typing import Dict, Set, Optional, List, Union, Iterable, MutableMapping, cast
 from functools import partial
 
 from medcat import __version__
 from medcat.utils.hasher import Hasher
 from medcat.utils.matutils import unitvec
+from medcat.utils.context_vector_store import ContextVectorStore, MmapMode
+from medcat.utils import cdb_sections
 from medcat.utils.ml_utils import get_lr_linking
 from medcat.config import Config, weighted_average, workers
 
@@ -32,7 +35,8 @@ class CDB(object):
             From cui to all sub-names assigned to it. Only used for subsetting.
         cui2context_vectors (`Dict[str, Dict[str, np.array]]`):
             From cui to a dictionary of different kinds of context vectors. Normally you would have here
-            a short and a long context vector - they are calculated separately.
+            a short and a long context vector - they are calculated separately. If `config.general['compact_context_vectors']`
+            is set this is a `ContextVectorStore` instead, which is accessed the same way.
         cui2count_train (`Dict[str, int]`):
             From CUI to the number of training examples seen.
         cui2tags (`Dict[str, List[str]]`):
@@ -52,6 +56,8 @@ class CDB(object):
             Stores all the words tha appear in this CDB and the count for each one.
     """
     log = logging.getLogger(__name__)
+    # Number of context vector updates per CUI, only counted after `track_updates`
+    _cui2updates: Optional[Dict] = None
 
     def __init__(self, config: Config) -> None:
         self.config = config
@@ -62,7 +68,7 @@ class CDB(object):
 
         self.cui2names: Dict = {}
         self.cui2snames: Dict = {}
-        self.cui2context_vectors: Dict = {}
+        self.cui2context_vectors: MutableMapping = self._empty_context_vectors()
         self.cui2count_train: Dict = {}
         self.cui2info: Dict = {}
         self.cui2tags: Dict = {} # Used to add custom tags to CUIs
@@ -86,6 +92,21 @@ class CDB(object):
         self.vocab: Dict = {} # Vocabulary of all words ever in our cdb
         self._optim_params = None
 
+    def __getattr__(self, name: str):
+        # Only called for attributes that are not set, for a lazily loaded CDB (see `medcat.utils.cdb_sections`)
+        #these can be in a section that was not loaded yet.
+        section = cdb_sections.section_of(self, name)
+        if section is None:
+            raise AttributeError("'{}' object has no attribute '{}'".format(type(self).__name__, name))
+        cdb_sections.load_section(self, section)
+
+        return self.__dict__[name]
+
+    def __setattr__(self, name: str, value) -> None:
+        # The new value replaces whatever is still on disk for a lazily loaded CDB
+        cdb_sections.discard(self, name)
+        super().__setattr__(name, value)
+
     def get_name(self, cui: str) -> str:
         r''' Returns preferred name if it exists, otherwise it will return
         the logest name assigend to the concept.
@@ -330,7 +351,7 @@ class CDB(object):
             # Get the right context
             if context_type in self.cui2context_vectors[cui]:
                 cv = self.cui2context_vectors[cui][context_type]
-                similarity = np.dot(unitvec(cv), unitvec(vector))
+                similarity = np.dot(self._unit_context_vector(cui, context_type), unitvec(vector))
 
                 # Get the learning rate if None
                 if lr is None:
@@ -348,9 +369,9 @@ class CDB(object):
                 self.log.debug("Updated vector embedding.\n" +
                         "CUI: %s, Context Type: %s, Similarity: %.2f, Is Negative: %s, LR: %.5f, b: %.3f", cui, context_type,
                             similarity, negative, lr, b)
-                cv = self.cui2context_vectors[cui][context_type]
-                similarity_after = np.dot(unitvec(cv), unitvec(vector))
-                self.log.debug("Similarity before vs after: %.5f vs %.5f", similarity, similarity_after)
+                if self.log.isEnabledFor(logging.DEBUG):
+                    similarity_after = np.dot(self._unit_context_vector(cui, context_type), unitvec(vector))
+                    self.log.debug("Similarity before vs after: %.5f vs %.5f", similarity, similarity_after)
             else:
                 if negative:
                     self.cui2context_vectors[cui][context_type] = -1 * vector
@@ -364,20 +385,59 @@ class CDB(object):
         if not negative:
             # Increase counter only for positive examples
             self.cui2count_train[cui] += 1
+        if self._cui2updates is not None:
+            self._cui2updates[cui] = self._cui2updates.get(cui, 0) + 1
+
+    def _unit_context_vector(self, cui: str, context_type: str) -> np.ndarray:
+        if isinstance(self.cui2context_vectors, ContextVectorStore):
+            # Uses the cached norm
+            return self.cui2context_vectors.unit_vector(cui, context_type)
+        return unitvec(self.cui2context_vectors[cui][context_type])
+
+    def _empty_context_vectors(self) -> MutableMapping:
+        if self.config.general.get('compact_context_vectors', False) or \
+           isinstance(getattr(self, 'cui2context_vectors', None), ContextVectorStore):
+            return ContextVectorStore()
+        return {}
+
+    def compact_context_vectors(self) -> None:
+        r''' Move the context vectors into a `ContextVectorStore` - one float32 matrix per context type
+        with cached norms. Access stays the same as for the dict, this is also done automatically on
+        create/load if `config.general['compact_context_vectors']` is set.
+        '''
+        if not isinstance(self.cui2context_vectors, ContextVectorStore):
+            self.cui2context_vectors = ContextVectorStore(self.cui2context_vectors)
 
-    def save(self, path: str) -> None:
+    def save(self, path: str, mmap_vectors: bool = False) -> None:
         r''' Saves model to file (in fact it saves variables of this class).
 
         Args:
             path (`str`):
                 Path to a file where the model will be saved
+            mmap_vectors (`bool`, defaults to `False`):
+                If True the context vectors are compacted (see `compact_context_vectors`) and saved as .npy
+                files into `<path without extension>_vectors/`, next to `path`. On load they are memory-mapped,
+                so that all processes using the same files share one copy of the vectors.
         '''
-        with open(path, 'wb') as f:
-            # No idea how to this correctly
-            to_save = {}
-            to_save['config'] = self.config.__dict__
-            to_save['cdb'] = {k:v for k,v in self.__dict__.items() if k != 'config'}
-            dill.dump(to_save, f)
+        cdb_sections.load_all(self)
+        store = None
+        if mmap_vectors:
+            self.compact_context_vectors()
+            store = cast(ContextVectorStore, self.cui2context_vectors)
+            vectors_dir = os.path.splitext(path)[0] + "_vectors"
+            store.save_matrices(vectors_dir)
+            store.matrices_dir = os.path.basename(vectors_dir)
+
+        try:
+            with open(path, 'wb') as f:
+                # No idea how to this correctly
+                to_save = {}
+                to_save['config'] = self.config.__dict__
+                to_save['cdb'] = {k:v for k,v in self.__dict__.items() if k != 'config'}
+                dill.dump(to_save, f)
+        finally:
+            if store is not None:
+                store.matrices_dir = None
 
     async def save_async(self, path: str) -> None:
         r''' Async version of saving model to file (in fact it saves variables of this class).
@@ -386,6 +446,7 @@ class CDB(object):
             path (`str`):
                 Path to a file where the model will be saved
         '''
+        cdb_sections.load_all(self)
         async with aiofiles.open(path, 'wb') as f:
             to_save = {
                 'config': self.config.__dict__,
@@ -393,16 +454,36 @@ class CDB(object):
             }
             await f.write(dill.dumps(to_save))
 
+    def save_sections(self, dir_path: str) -> None:
+        r''' Save the CDB into a directory using the sectioned format (see `medcat.utils.cdb_sections`), much
+        faster to save and load than `save`. Name maps, CUI maps, context vectors and addl_info are in
+        separate files, and `CDB.load` on the directory reads them lazily.
+
+        Args:
+            dir_path (`str`):
+                Directory where the CDB will be saved.
+        '''
+        cdb_sections.load_all(self)
+        cdb_sections.save(self, dir_path)
+
     @classmethod
-    def load(cls, path: str, config_dict: Optional[Dict] = None) -> "CDB":
+    def load(cls, path: str, config_dict: Optional[Dict] = None, mmap_mode: Optional[MmapMode] = 'c', lazy: bool = True) -> "CDB":
         r''' Load and return a CDB. This allows partial loads in probably not the right way at all.
 
         Args:
             path (`str`):
-                Path to a `cdb.dat` from which to load data.
+                Path to a `cdb.dat` from which to load data, or to a directory created with `save_sections`.
             config_dict:
                 A dictionary that will be used to overwrite existing fields in the config of this CDB
+            mmap_mode (`str`, optional, defaults to `c`):
+                Only used if the CDB was saved with `mmap_vectors=True` or with `save_sections`, the mode used for
+                memory-mapping the context vectors. The default is copy-on-write, None loads the vectors into memory.
+            lazy (`bool`, defaults to `True`):
+                Only used for CDBs saved with `save_sections`, if True each section is loaded when first needed.
         '''
+        if cdb_sections.is_sectioned(path):
+            return cdb_sections.load(cls, path, config_dict=config_dict, lazy=lazy, mmap_mode=mmap_mode)
+
         with open(path, 'rb') as f:
             # Again no idea
             data = dill.load(f)
@@ -418,10 +499,18 @@ class CDB(object):
                 if k in data['cdb']:
                     cdb.__dict__[k] = data['cdb'][k]
 
+            # Context vectors saved with mmap_vectors=True are in separate files
+            if isinstance(cdb.cui2context_vectors, ContextVectorStore) and cdb.cui2context_vectors.matrices_dir is not None:
+                cdb.cui2context_vectors.load_matrices(os.path.join(os.path.dirname(path), cdb.cui2context_vectors.matrices_dir),
+                                                      mmap_mode=mmap_mode)
+
             # Overwrite the config with new data
             if config_dict is not None:
                 cdb.config.merge_config(config_dict)
 
+            if cdb.config.general.get('compact_context_vectors', False):
+                cdb.compact_context_vectors()
+
         return cdb
 
     def import_training(self, cdb: "CDB", overwrite: bool = True) -> None:
@@ -450,6 +539,118 @@ class CDB(object):
                 # Increase the vector count
                 self.cui2count_train[cui] = self.cui2count_train.get(cui, 0) + cdb.cui2count_train[cui]
 
+    def track_updates(self) -> None:
+        r''' Start counting the updates (positive and negative) of the context vectors of each CUI, the counts
+        are used by `get_training_delta` and restart with every call.
+        '''
+        self._cui2updates = {}
+
+    def get_training_delta(self, cui2count_train: Dict, name2count_train: Dict) -> Dict:
+        r''' Training done since the counts were `cui2count_train` and `name2count_train` (copies of the
+        same fields from earlier), used to merge the training of several copies of a CDB with `merge_training_deltas`.
+        A CUI is considered trained if its count changed or, after `track_updates`, if its context vectors were
+        updated. With `devalue_linked_concepts` the concepts that share a name with it are included.
+
+        Args:
+            cui2count_train (`Dict`):
+                Earlier copy of `cdb.cui2count_train`.
+            name2count_train (`Dict`):
+                Earlier copy of `cdb.name2count_train`.
+
+        Returns:
+            A dictionary: {'cuis': {cui: {'count': <count increase>, 'updates': <number of updates>,
+            'vectors': {context_type: vector, ...}, 'average_confidence': <float or None>}, ...},
+            'names': {name: <count increase>, ...}}. Without `track_updates` the number of updates is the count increase.
+        '''
+        cuis = set(cui for cui, cnt in self.cui2count_train.items() if cnt != cui2count_train.get(cui, 0))
+        cui2updates = self._cui2updates
+        if cui2updates is not None:
+            cuis.update(cui2updates.keys())
+        if self.config.linking.get('devalue_linked_concepts', False):
+            for cui in list(cuis):
+                for name in self.cui2names.get(cui, []):
+                    cuis.update(self.name2cuis.get(name, []))
+
+        delta: Dict = {'cuis': {}, 'names': {}}
+        for cui in cuis:
+            count = self.cui2count_train.get(cui, 0) - cui2count_train.get(cui, 0)
+            delta['cuis'][cui] = {'count': count,
+                                  'updates': cui2updates.get(cui, 0) if cui2updates is not None else count,
+                                  'vectors': {context_type: np.array(vector) for context_type, vector
+                                              in self.cui2context_vectors.get(cui, {}).items()},
+                                  'average_confidence': self.cui2average_confidence.get(cui)}
+        for name, cnt in self.name2count_train.items():
+            if cnt != name2count_train.get(name, 0):
+                delta['names'][name] = cnt - name2count_train.get(name, 0)
+
+        return delta
+
+    def merge_training_deltas(self, deltas: List[Dict]) -> None:
+        r''' Merge the training done on copies of this CDB (see `get_training_delta`). Context vectors of a CUI
+        are the average of the vectors from each copy weighted by how many times they were updated in that copy
+        (an equal weight if the number of updates is not known), counts are summed.
+
+        Args:
+            deltas (`List[Dict]`):
+                Outputs of `get_training_delta` on copies of this CDB.
+        '''
+        cuis: Dict = {}
+        for delta in deltas:
+            for cui, cui_delta in delta['cuis'].items():
+                cuis.setdefault(cui, []).append(cui_delta)
+            for name, cnt in delta['names'].items():
+                self.name2count_train[name] = self.name2count_train.get(name, 0) + cnt
+
+        for cui, cui_deltas in cuis.items():
+            weights = np.array([cui_delta.get('updates', cui_delta['count']) for cui_delta in cui_deltas], dtype=np.float64)
+            if weights.sum() <= 0:
+                weights = np.ones(len(cui_deltas))
+
+            if cui not in self.cui2context_vectors:
+                self.cui2context_vectors[cui] = {}
+            context_types = set(context_type for cui_delta in cui_deltas for context_type in cui_delta['vectors'])
+            for context_type in context_types:
+                inds = [i for i, cui_delta in enumerate(cui_deltas) if context_type in cui_delta['vectors']]
+                ct_weights = weights[inds] if weights[inds].sum() > 0 else np.ones(len(inds))
+                vectors = np.array([cui_deltas[i]['vectors'][context_type] for i in inds])
+                self.cui2context_vectors[cui][context_type] = np.average(vectors, axis=0, weights=ct_weights)
+
+            inds = [i for i, cui_delta in enumerate(cui_deltas) if cui_delta['average_confidence'] is not None]
+            if inds:
+                confidences = [cui_deltas[i]['average_confidence'] for i in inds]
+                conf_weights = weights[inds] if weights[inds].sum() > 0 else np.ones(len(inds))
+                self.cui2average_confidence[cui] = float(np.average(confidences, weights=conf_weights))
+            self.cui2count_train[cui] = self.cui2count_train.get(cui, 0) + int(sum(cui_delta['count'] for cui_delta in cui_deltas))
+
+    def get_training_state(self, cuis: Iterable[str], names: Iterable[str]) -> Dict:
+        r''' The trained fields of `cuis` and `names`, used to bring copies of this CDB up to date with
+        `set_training_state` (e.g. after `merge_training_deltas`).
+
+        Returns:
+            A dictionary: {'cuis': {cui: {'count': <count>, 'vectors': {context_type: vector, ...},
+            'average_confidence': <float or None>}, ...}, 'names': {name: <count>, ...}}
+        '''
+        state: Dict = {'cuis': {}, 'names': {}}
+        for cui in cuis:
+            state['cuis'][cui] = {'count': self.cui2count_train.get(cui, 0),
+                                  'vectors': {context_type: np.array(vector) for context_type, vector
+                                              in self.cui2context_vectors.get(cui, {}).items()},
+                                  'average_confidence': self.cui2average_confidence.get(cui)}
+        for name in names:
+            state['names'][name] = self.name2count_train.get(name, 0)
+
+        return state
+
+    def set_training_state(self, state: Dict) -> None:
+        r''' Overwrite the trained fields with the ones from `get_training_state`.
+        '''
+        for cui, cui_state in state['cuis'].items():
+            self.cui2count_train[cui] = cui_state['count']
+            self.cui2context_vectors[cui] = dict(cui_state['vectors'])
+            if cui_state['average_confidence'] is not None:
+                self.cui2average_confidence[cui] = cui_state['average_confidence']
+        self.name2count_train.update(state['names'])
+
     def reset_cui_count(self, n: int = 10) -> None:
         r''' Reset the CUI count for all concepts that received training, used when starting new unsupervised training
         or for suppervised with annealing.
@@ -470,7 +671,7 @@ class CDB(object):
         potentially added during supervised/online learning.
         '''
         self.cui2count_train = {}
-        self.cui2context_vectors = {}
+        self.cui2context_vectors = self._empty_context_vectors()
         self.reset_concept_similarity()
 
     def filter_by_cui(self, cuis_to_keep: Union[List[str], Set[str]]) -> None:
@@ -537,7 +738,10 @@ class CDB(object):
         self.name2cuis2status = new_name2cuis2status
         self.cui2names = new_cui2names
         self.cui2snames = new_cui2snames
-        self.cui2context_vectors = new_cui2context_vectors
+        if isinstance(self.cui2context_vectors, ContextVectorStore):
+            self.cui2context_vectors = ContextVectorStore(new_cui2context_vectors)
+        else:
+            self.cui2context_vectors = new_cui2context_vectors
         self.cui2count_train = new_cui2count_train
         self.cui2tags = new_cui2tags
         self.cui2type_ids = new_cui2type_ids
@@ -686,12 +890,13 @@ or download the compatible model."""
             )
 
     def get_hash(self):
+        cdb_sections.load_all(self)
         hasher = Hasher()
 
+        # Everything is hashed as it is, nothing is serialized (see `medcat.utils.hasher.update_structure`)
         for k,v in self.__dict__.items():
-            if k in ['cui2countext_vectors', 'name2cuis']:
-                hasher.update(v, length=False)
-            elif k != 'config':
-                hasher.update(v, length=True)
+            if k != 'config':
+                hasher.update_bytes(k.encode())
+                hasher.update_structure(v)
 
         return hasher.hexdigest()
@@ -1,19 +1,22 @@
 import pandas
-import numpy as np
-import datetime
+import time
 import logging
 import re
-from typing import Optional, List, Dict
+from typing import Optional, List, Dict, Iterable, cast
+from multiprocess import Pool
+from spacy.language import Language
+from spacy.util import minibatch
 
 from medcat.pipe import Pipe
 from medcat.cdb import CDB
 from medcat.config import Config
 from medcat.preprocessing.tokenizers import spacy_split_all
-from medcat.preprocessing.cleaners import prepare_name
+from medcat.preprocessing.cleaners import prepare_name_from_doc, add_prepared_names, PreparedNameCache
 from medcat.preprocessing.taggers import tag_skip_and_punct
 from medcat.utils.loggers import add_handlers
 
 PH_REMOVE = re.compile("(\s)\([a-zA-Z]+[^\)\(]*\)($)")
+NAME_STATUS_OPTIONS = {'A', 'P', 'N'}
 
 
 class CDBMaker(object):
@@ -49,6 +52,9 @@ class CDBMaker(object):
                              name='skip_and_punct',
                              additional_fields=['is_punct'])
 
+        # Names prepared for all CSVs
+        self._name_cache = PreparedNameCache(config.preprocessing.get('name_cache_size', 100000))
+
     def prepare_csvs(self,
                      csv_paths: List[str],
                      sep: str = ',',
@@ -56,9 +62,16 @@ class CDBMaker(object):
                      escapechar: Optional[str] = None,
                      index_col: bool = False,
                      full_build: bool = False,
-                     only_existing_cuis: bool = False, **kwargs) -> CDB:
+                     only_existing_cuis: bool = False,
+                     n_process: int = 1,
+                     batch_size: int = 10000,
+                     chunk_size: Optional[int] = 100000, **kwargs) -> CDB:
         r''' Compile one or multiple CSVs into a CDB.
 
+        The CSVs are read in chunks of `chunk_size` rows, so the memory used does not depend on the size of a CSV.
+        Every distinct name in a chunk is sent through the spacy pipeline only once, in batches and if `n_process` > 1
+        in parallel. The concepts are then added in the order of the rows, so the CDB is always the same.
+
         Args:
             csv_paths (`List[str]`):
                 An array of paths to the csv files that should be processed
@@ -78,6 +91,12 @@ class CDBMaker(object):
             only_existing_cuis (`bool`, defaults to False):
                 If True no new CUIs will be added, but only linked names will be extended. Mainly used when
                 enriching names of a CDB (e.g. SNOMED with UMLS terms).
+            n_process (`int`, defaults to 1):
+                Number of processes used to prepare the names.
+            batch_size (`int`, defaults to 10000):
+                Number of names sent through the spacy pipeline (or to a process) at once.
+            chunk_size (`int`, optional, defaults to 100000):
+                Number of rows read from a CSV at once, if None the whole CSV is read at once.
         Return:
             `medcat.cdb.CDB` with the new concepts added.
 
@@ -89,93 +108,153 @@ class CDBMaker(object):
         '''
 
         useful_columns = ['cui', 'name', 'ontologies', 'name_status', 'type_ids', 'description']
-        name_status_options = {'A', 'P', 'N'}
 
         for csv_path in csv_paths:
+            self.log.info("Started importing concepts from: {}".format(csv_path))
             # Read CSV, everything is converted to strings
-            df = pandas.read_csv(csv_path, sep=sep, encoding=encoding, escapechar=escapechar, index_col=index_col, dtype=str, **kwargs)
-            df = df.fillna('')
+            chunks = pandas.read_csv(csv_path, sep=sep, encoding=encoding, escapechar=escapechar, index_col=index_col,
+                                     dtype=str, chunksize=chunk_size, **kwargs)
+            if chunk_size is None:
+                chunks = [chunks]
 
-            # Find which columns to use from the CSV
-            cols: List = []
-            col2ind = {}
-            for col in list(df.columns):
-                if str(col).lower().strip() in useful_columns:
-                    col2ind[str(col).lower().strip()] = len(cols)
-                    cols.append(col)
+            n_rows = 0
+            start = time.perf_counter()
+            for df in chunks:
+                df = df.fillna('')
 
-            self.log.info("Started importing concepts from: {}".format(csv_path))
-            _time = None # Used to check speed
-            _logging_freq = np.ceil(len(df[cols]) / 100)
-            for row_id, row in enumerate(df[cols].values):
-                if row_id % _logging_freq == 0:
-                    # Print some stats
-                    if _time is None:
-                        # Add last time if it does not exist
-                        _time = datetime.datetime.now()
-                    # Get current time
-                    ctime = datetime.datetime.now()
-                    # Get time difference
-                    timediff = ctime - _time
-                    self.log.info("Current progress: {:.0f}% at {:.3f}s per {} rows".format(
-                        (row_id / len(df)) * 100, timediff.microseconds/10**6 + timediff.seconds, (len(df[cols]) // 100)))
-                    # Set previous time to current time
-                    _time = ctime
-
-                # This must exist
-                cui = row[col2ind['cui']].strip().upper()
-
-                if not only_existing_cuis or (only_existing_cuis and cui in self.cdb.cui2names):
-                    if 'ontologies' in col2ind:
-                        ontologies = set([ontology.strip() for ontology in row[col2ind['ontologies']].upper().split(self.cnf_cm['multi_separator']) if
-                                         len(ontology.strip()) > 0])
-                    else:
-                        ontologies = set()
-
-                    if 'name_status' in col2ind:
-                        name_status = row[col2ind['name_status']].strip().upper()
-
-                        # Must be allowed
-                        if name_status not in name_status_options:
-                            name_status = 'A'
-                    else:
-                        # Defaults to A - meaning automatic
-                        name_status = 'A'
-
-                    if 'type_ids' in col2ind:
-                        type_ids = set([type_id.strip() for type_id in row[col2ind['type_ids']].upper().split(self.cnf_cm['multi_separator']) if
-                                        len(type_id.strip()) > 0])
-                    else:
-                        type_ids = set()
-
-                    # Get the ones that do not need any changing
-                    if 'description' in col2ind:
-                        description = row[col2ind['description']].strip()
-                    else:
-                        description = ""
-
-                    # We can have multiple versions of a name
-                    names: Dict = {} # {'name': {'tokens': [<str>], 'snames': [<str>]}}
-
-                    raw_names = [raw_name.strip() for raw_name in row[col2ind['name']].split(self.cnf_cm['multi_separator']) if
-                                 len(raw_name.strip()) > 0]
-                    for raw_name in raw_names:
-                        raw_name = raw_name.strip()
-                        prepare_name(raw_name, self.pipe.spacy_nlp, names, self.config)
-
-                        if self.config.cdb_maker.get('remove_parenthesis', 0) > 0 and name_status == 'P':
-                            # Should we remove the content in parenthesis from primary names and add them also
-                            raw_name = PH_REMOVE.sub(" ", raw_name).strip()
-                            if len(raw_name) >= self.config.cdb_maker['remove_parenthesis']:
-                                prepare_name(raw_name, self.pipe.spacy_nlp, names, self.config)
-
-                    self.cdb.add_concept(cui=cui, names=names, ontologies=ontologies, name_status=name_status, type_ids=type_ids,
-                                         description=description, full_build=full_build)
-                    # DEBUG
-                    self.log.debug("\n\n**** Added\n CUI: %s\n Names: %s\n Ontologies: %s\n Name status: %s\n Type IDs: %s\n Description: %s\n Is full build: %s",
-                                   cui, names, ontologies, name_status, type_ids, description, full_build)
+                # Find which columns to use from the CSV
+                cols: List = []
+                col2ind = {}
+                for col in list(df.columns):
+                    if str(col).lower().strip() in useful_columns:
+                        col2ind[str(col).lower().strip()] = len(cols)
+                        cols.append(col)
+
+                self._add_rows(df[cols].values, col2ind, full_build=full_build, only_existing_cuis=only_existing_cuis,
+                               n_process=n_process, batch_size=batch_size)
+                n_rows += len(df)
+                self.log.info("Current progress: {} rows at {:.0f} rows per second".format(
+                              n_rows, n_rows / max(time.perf_counter() - start, 1e-9)))
 
         return self.cdb
 
+    def _add_rows(self, rows: Iterable, col2ind: Dict, full_build: bool, only_existing_cuis: bool, n_process: int,
+                  batch_size: int) -> None:
+        # Only adding concepts changes the CDB, so the rows can be parsed and filtered upfront
+        concepts = [concept for concept in (self._parse_row(row, col2ind) for row in rows)
+                    if not only_existing_cuis or concept['cui'] in self.cdb.cui2names]
+
+        raw_names = list(dict.fromkeys(raw_name for concept in concepts for raw_name in concept['raw_names']))
+        self.log.debug("Preparing %s distinct names", len(raw_names))
+        raw_name2names = self._prepare_raw_names(raw_names, n_process=n_process, batch_size=batch_size)
+
+        for concept in concepts:
+            # We can have multiple versions of a name
+            names: Dict = {} # {'name': {'tokens': [<str>], 'snames': [<str>]}}
+            for raw_name in concept['raw_names']:
+                add_prepared_names(names, raw_name2names[raw_name])
+
+            self.cdb.add_concept(cui=concept['cui'], names=names, ontologies=concept['ontologies'],
+                                 name_status=concept['name_status'], type_ids=concept['type_ids'],
+                                 description=concept['description'], full_build=full_build)
+            # DEBUG
+            self.log.debug("\n\n**** Added\n CUI: %s\n Names: %s\n Ontologies: %s\n Name status: %s\n Type IDs: %s\n Description: %s\n Is full build: %s",
+                           concept['cui'], names, concept['ontologies'], concept['name_status'], concept['type_ids'],
+                           concept['description'], full_build)
+
+    def _parse_row(self, row: List, col2ind: Dict) -> Dict:
+        # This must exist
+        cui = row[col2ind['cui']].strip().upper()
+
+        if 'ontologies' in col2ind:
+            ontologies = set([ontology.strip() for ontology in row[col2ind['ontologies']].upper().split(self.cnf_cm['multi_separator']) if
+                             len(ontology.strip()) > 0])
+        else:
+            ontologies = set()
+
+        if 'name_status' in col2ind:
+            name_status = row[col2ind['name_status']].strip().upper()
+
+            # Must be allowed
+            if name_status not in NAME_STATUS_OPTIONS:
+                name_status = 'A'
+        else:
+            # Defaults to A - meaning automatic
+            name_status = 'A'
+
+        if 'type_ids' in col2ind:
+            type_ids = set([type_id.strip() for type_id in row[col2ind['type_ids']].upper().split(self.cnf_cm['multi_separator']) if
+                            len(type_id.strip()) > 0])
+        else:
+            type_ids = set()
+
+        # Get the ones that do not need any changing
+        if 'description' in col2ind:
+            description = row[col2ind['description']].strip()
+        else:
+            description = ""
+
+        raw_names = []
+        for raw_name in row[col2ind['name']].split(self.cnf_cm['multi_separator']):
+            raw_name = raw_name.strip()
+            if len(raw_name) > 0:
+                raw_names.append(raw_name)
+
+                if self.config.cdb_maker.get('remove_parenthesis', 0) > 0 and name_status == 'P':
+                    # Should we remove the content in parenthesis from primary names and add them also
+                    raw_name = PH_REMOVE.sub(" ", raw_name).strip()
+                    if len(raw_name) >= self.config.cdb_maker['remove_parenthesis']:
+                        raw_names.append(raw_name)
+
+        return {'cui': cui, 'ontologies': ontologies, 'name_status': name_status, 'type_ids': type_ids,
+                'description': description, 'raw_names': raw_names}
+
+    def _prepare_raw_names(self, raw_names: List[str], n_process: int = 1, batch_size: int = 10000) -> Dict[str, Dict]:
+        r''' The output of `prepare_name` with empty `names` for each raw name, names that are not in the
+        name cache are prepared and added to it.
+        '''
+        self._name_cache.check(self.config)
+        raw_name2names: Dict[str, Dict] = {}
+        for raw_name in raw_names:
+            prepared = self._name_cache.get(raw_name)
+            if prepared is not None:
+                raw_name2names[raw_name] = prepared
+
+        batches = list(minibatch([raw_name for raw_name in raw_names if raw_name not in raw_name2names], size=batch_size))
+        if n_process > 1 and len(batches) > 1:
+            # Worker processes are forked, so they get the current pipeline without it being pickled
+            with Pool(n_process, initializer=_init_worker, initargs=(self.pipe.spacy_nlp, self.config)) as pool:
+                prepared_batches = zip(batches, pool.imap(_prepare_worker_batch, batches))
+                self._add_prepared(prepared_batches, raw_name2names)
+        else:
+            prepared_batches = ((batch, _prepare_batch(batch, self.pipe.spacy_nlp, self.config)) for batch in batches)
+            self._add_prepared(prepared_batches, raw_name2names)
+        return raw_name2names
+
+    def _add_prepared(self, prepared_batches: Iterable, raw_name2names: Dict[str, Dict]) -> None:
+        for batch, batch_names in prepared_batches:
+            for raw_name, prepared in zip(batch, batch_names):
+                raw_name2names[raw_name] = prepared
+                self._name_cache.put(raw_name, prepared)
+
     def destroy_pipe(self) -> None:
         self.pipe.destroy()
+
+
+def _prepare_batch(raw_names: List[str], nlp: Language, config: Config) -> List[Dict]:
+    return [prepare_name_from_doc(sc_name, raw_name, {}, config) for raw_name, sc_name in zip(raw_names, nlp.pipe(raw_names))]
+
+
+# The spacy pipeline and config used by the worker processes of `CDBMaker._prepare_raw_names`
+_worker_nlp: Optional[Language] = None
+_worker_config: Optional[Config] = None
+
+
+def _init_worker(nlp: Language, config: Config) -> None:
+    global _worker_nlp, _worker_config
+    _worker_nlp = nlp
+    _worker_config = config
+
+
+def _prepare_worker_batch(raw_names: List[str]) -> List[Dict]:
+    return _prepare_batch(raw_names, cast(Language, _worker_nlp), cast(Config, _worker_config))
@@ -182,10 +182,19 @@ class Config(ConfigMixin):
                 'spell_check_deep': False,
                 # Spelling will not be checked for words with length less than this
                 'spell_check_len_limit': 7,
+                # Spell checker to use: `basic` generates all edits of a word and checks them against the CDB vocab,
+                #`symspell` looks the word up in a precomputed index of deletes of the CDB vocab (much faster, the
+                #index is built once and saved with the model pack).
+                'spell_checker': 'basic',
+                # Size of the LRU cache for spelling fixes (misspelled word to its normalized fix), 0 disables it
+                'spell_check_cache_size': 100000,
                 # If set to True functions like get_entities and get_json will return nested_entities and overlaps
                 'show_nested_entities': False,
                 # When unlinking a name from a concept should we do full_unlink (means unlink a name from all concepts, not just the one in question)
                 'full_unlink': False,
+                # If True the CDB keeps context vectors in a ContextVectorStore (one float32 matrix per context type
+                #with cached norms) instead of a dict of dicts, this lowers memory usage and speeds up similarity.
+                'compact_context_vectors': False,
                 # Number of workers used by a parallelizable pipeline component
                 'workers': workers(),
                 # Should the labels of entities (shown in displacy) be pretty or just 'concept'. Slows down the annotation pipeline
@@ -202,6 +211,9 @@ class Config(ConfigMixin):
                     'steps': None,
                     # When training the maximum checkpoints will be kept on the disk
                     "max_to_keep": 1,
+                    # Every full_every-th checkpoint is a full CDB, the ones in between only have what changed since the
+                    #last full one (much smaller and faster to save for large CDBs)
+                    "full_every": 1,
                 },
                 }
 
@@ -220,6 +232,12 @@ class Config(ConfigMixin):
                 'max_document_length': 1000000,
                 # Should specific word types be normalized: e.g. running -> run
                 'do_not_normalize': {'VBD', 'VBG', 'VBN', 'VBP', 'JJS', 'JJR'},
+                # The tagger and the token normalizer cache their result for every distinct word (lexeme), the caches are
+                #emptied once they reach this size. 0 disables them.
+                'lexeme_cache_size': 1000000,
+                # Names prepared for concepts (e.g. in supervised training or when building a CDB) are cached for this
+                #many distinct raw names, so that each is processed by spacy only once. 0 disables the cache.
+                'name_cache_size': 100000,
                 }
 
         self.ner: Dict[str, Any] = {
@@ -235,6 +253,9 @@ class Config(ConfigMixin):
                 'upper_case_limit_len': 4,
                 # Try reverse word order for short concepts (2 words max), e.g. heart disease -> disease heart
                 'try_reverse_word_order': False,
+                # Match names by walking a token level trie compiled from cdb.snames instead of probing
+                #cdb.snames for every extension. Faster for large CDBs, but uses more memory. The output is the same.
+                'use_name_trie': False,
                 }
 
         self.linking: Dict[str, Any] = {
@@ -260,6 +281,9 @@ class Config(ConfigMixin):
                 'train_count_threshold': 1,
                 # Do we want to calculate context similarity even for concepts that are not ambigous.
                 'always_calculate_similarity': False,
+                # If True all entities in a document that have to be disambiguated are disambiguated at once, the similarities
+                #for all candidates are then calculated with one matrix multiplication per context type.
+                'batch_disambiguation': False,
                 # Weights for a weighted average
                 #'weighted_average_function': partial(weighted_average, factor=0.02),
                 'weighted_average_function': partial(weighted_average, factor=0.0004),
@@ -3,7 +3,7 @@ import logging
 
 from enum import Enum, auto
 from spacy.tokens import Span, Doc
-from typing import Optional, List, Dict
+from typing import Optional, List, Dict, Tuple
 from medcat.utils.filters import check_filters
 from medcat.linking.vector_context_model import ContextModel
 from medcat.pipeline.pipe_runner import PipeRunner
@@ -64,6 +64,11 @@ class Linker(PipeRunner):
         cnf_l = self.config.linking
         linked_entities = []
 
+        if self.stats is not None:
+            self.stats.count('entities', len(doc._.ents))
+            for entity in doc._.ents:
+                self.stats.observe('candidates_per_entity', len(entity._.link_candidates or []))
+
         if cnf_l["train"]:
             # Run training
             for entity in doc._.ents:
@@ -91,7 +96,9 @@ class Linker(PipeRunner):
                                     entity._.context_similarity = 1
                                     linked_entities.append(entity)
         else:
-            for entity in doc._.ents:
+            # With batch_disambiguation everything that needs disambiguation is done upfront for the whole doc
+            disambiguated = self._disambiguate_doc(doc) if cnf_l.get('batch_disambiguation', False) else {}
+            for ind, entity in enumerate(doc._.ents):
                 self.log.debug("Linker started with entity: %s", entity)
                 # Check does it have a detected name
                 if entity._.link_candidates is not None:
@@ -110,7 +117,9 @@ class Linker(PipeRunner):
                                 do_disambiguate = True
 
                             if do_disambiguate:
-                                cui, context_similarity = self.context_model.disambiguate(cuis, entity, name, doc)
+                                if self.stats is not None:
+                                    self.stats.count('disambiguations')
+                                cui, context_similarity = disambiguated.get(ind) or self.context_model.disambiguate(cuis, entity, name, doc)
                             else:
                                 cui = cuis[0]
                                 if self.config.linking['always_calculate_similarity']:
@@ -119,7 +128,10 @@ class Linker(PipeRunner):
                                     context_similarity = 1 # Direct link, no care for similarity
                     else:
                         # No name detected, just disambiguate
-                        cui, context_similarity = self.context_model.disambiguate(entity._.link_candidates, entity, 'unk-unk', doc)
+                        if self.stats is not None:
+                            self.stats.count('disambiguations')
+                        cui, context_similarity = disambiguated.get(ind) or \
+                            self.context_model.disambiguate(entity._.link_candidates, entity, 'unk-unk', doc)
 
                     # Add the annotation if it exists and if above threshold and in filters
                     if cui and check_filters(cui, self.config.linking['filters']):
@@ -141,6 +153,37 @@ class Linker(PipeRunner):
 
         return doc
 
+    def _disambiguate_doc(self, doc: Doc) -> Dict[int, Tuple]:
+        r''' Find all entities in the doc that have to be disambiguated (same rules as in `__call__`) and
+        disambiguate them in one batch.
+
+        Returns:
+            Dict[int, Tuple]:
+                Index of the entity in `doc._.ents` to the (cui, context_similarity) tuple.
+        '''
+        cnf_l = self.config.linking
+        inds = []
+        to_disamb = []
+        for ind, entity in enumerate(doc._.ents):
+            cuis = entity._.link_candidates
+            if cuis is None:
+                continue
+
+            if entity._.detected_name is not None:
+                name = entity._.detected_name
+                if len(cuis) == 0:
+                    continue
+                if len(name) >= cnf_l['disamb_length_limit'] and len(cuis) == 1 and \
+                   self.cdb.name2cuis2status[name][cuis[0]] not in {'N', 'PD'}:
+                    continue
+            else:
+                name = 'unk-unk'
+
+            inds.append(ind)
+            to_disamb.append((cuis, entity, name))
+
+        return dict(zip(inds, self.context_model.disambiguate_batch(to_disamb, doc)))
+
     def _map_ents_to_groups(self, doc: Doc) -> None:
         for ent in doc.ents:
             ent._.cui = self.cdb.addl_info['cui2group'].get(ent._.cui, ent._.cui)
@@ -1,9 +1,11 @@
 import numpy as np
 import logging
-from typing import Tuple, Dict, List, Union
+import weakref
+from typing import Tuple, Dict, List, Optional, Union
 from spacy.tokens import Span, Doc
 from medcat.utils.matutils import unitvec
 from medcat.utils.filters import check_filters
+from medcat.utils.context_vector_store import ContextVectorStore
 from medcat.cdb import CDB
 from medcat.vocab import Vocab
 from medcat.config import Config
@@ -24,6 +26,17 @@ class ContextModel(object):
         self.cdb = cdb
         self.vocab = vocab
         self.config = config
+        # Weak reference to the last document with its index (see `get_doc_index`) and memoized context vectors,
+        #and weights for each position in a context window
+        self._doc_cache: Tuple = (None, 0, None, None)
+        self._step_weights_cache: Dict = {}
+
+    def __getstate__(self) -> Dict:
+        # The weak reference can not be pickled, the caches are rebuilt anyway
+        state = dict(self.__dict__)
+        state['_doc_cache'] = (None, 0, None, None)
+        state['_step_weights_cache'] = {}
+        return state
 
     def get_context_tokens(self, entity: Span, doc: Doc, size: int) -> Tuple:
         r''' Get context tokens for an entity, this will skip anything that
@@ -47,43 +60,119 @@ class ContextModel(object):
 
         return tokens_left, tokens_center, tokens_right
 
+    def get_doc_index(self, doc: Doc) -> Tuple[np.ndarray, np.ndarray]:
+        r''' For every token in the doc the row of its vector in `vocab.vectors` (-1 if there is none) and
+        can it be used as context (the same filter as in `get_context_tokens`). Calculated once per document,
+        the index of the last document is kept.
+
+        Args:
+            doc
+        '''
+        return self._get_doc_cache(doc)[0]
+
+    def _get_doc_cache(self, doc: Doc) -> Tuple[Tuple[np.ndarray, np.ndarray], Dict]:
+        r''' The index of the doc and the memo of context vectors calculated for entities in this doc.
+        '''
+        doc_ref, n_vectors, cached_index, cached_memo = self._doc_cache
+        if doc_ref is not None and doc_ref() is doc and n_vectors == len(self.vocab.vec_index2word):
+            return cached_index, cached_memo
+
+        vec_inds = np.full(len(doc), -1, dtype=np.int64)
+        is_context = np.zeros(len(doc), dtype=bool)
+        for tkn in doc:
+            ind = self.vocab.vec_index(tkn.lower_)
+            if ind is not None:
+                vec_inds[tkn.i] = ind
+            is_context[tkn.i] = not tkn._.to_skip and not tkn.is_stop and not tkn.is_digit and not tkn.is_punct
+
+        index = (vec_inds, is_context)
+        memo: Dict = {}
+        self._doc_cache = (weakref.ref(doc), len(self.vocab.vec_index2word), index, memo)
+        return index, memo
+
+    def _step_weights(self, size: int) -> np.ndarray:
+        weighted_average_function = self.config.linking['weighted_average_function']
+        key = (weighted_average_function, size)
+        if key not in self._step_weights_cache:
+            self._step_weights_cache[key] = np.array([weighted_average_function(step) for step in range(size)], dtype=np.float64)
+        return self._step_weights_cache[key]
+
     def get_context_vectors(self, entity: Span, doc: Doc, cui=None) -> Dict:
         r''' Given an entity and the document it will return the context representation for the
         given entity.
 
+        Vectors are memoized per document, so disambiguation, similarity and training of the same entity
+        calculate them once. The only exception is when the center is randomly replaced with a name of the `cui`.
+
         Args:
             entity
             doc
         '''
         vectors = {}
+        index, memo = self._get_doc_cache(doc)
+        entity_inds = tuple(tkn.i for tkn in entity)
+        ignore_center = self.config.linking['context_ignore_center_tokens']
 
         for context_type in self.config.linking['context_vector_sizes'].keys():
             size = self.config.linking['context_vector_sizes'][context_type]
-            tokens_left, tokens_center, tokens_right = self.get_context_tokens(entity, doc, size)
-
-            values = []
-            # Add left
-            values.extend([self.config.linking['weighted_average_function'](step) * self.vocab.vec(tkn.lower_)
-                           for step, tkn in enumerate(tokens_left) if tkn.lower_ in self.vocab and self.vocab.vec(tkn.lower_) is not None])
 
-            if not self.config.linking['context_ignore_center_tokens']:
-                # Add center
+            new_tokens_center = None
+            if not ignore_center:
                 if cui is not None and random.random() > self.config.linking['random_replacement_unsupervised'] and self.cdb.cui2names.get(cui, []):
                     new_tokens_center = random.choice(list(self.cdb.cui2names[cui])).split(self.config.general['separator'])
-                    values.extend([self.vocab.vec(tkn) for tkn in new_tokens_center if tkn in self.vocab and self.vocab.vec(tkn) is not None])
-                else:
-                    values.extend([self.vocab.vec(tkn.lower_) for tkn in tokens_center if tkn.lower_ in self.vocab and self.vocab.vec(tkn.lower_) is not None])
 
-            # Add right
-            values.extend([self.config.linking['weighted_average_function'](step) * self.vocab.vec(tkn.lower_)
-                           for step, tkn in enumerate(tokens_right) if tkn.lower_ in self.vocab and self.vocab.vec(tkn.lower_) is not None])
+            if new_tokens_center is None:
+                key = (entity_inds, size, ignore_center, self.config.linking['weighted_average_function'])
+                if key not in memo:
+                    memo[key] = self._context_vector(entity_inds, index, size, ignore_center)
+                vector = memo[key]
+            else:
+                center_inds = np.array([self.vocab.vec_index(tkn) for tkn in new_tokens_center
+                                        if self.vocab.vec_index(tkn) is not None], dtype=np.int64)
+                vector = self._context_vector(entity_inds, index, size, ignore_center, center_inds=center_inds)
 
-            if len(values) > 0:
-                value = np.average(values, axis=0)
-                vectors[context_type] = value
+            if vector is not None:
+                # A copy, the memoized vector must not change
+                vectors[context_type] = vector.copy()
 
         return vectors
 
+    def _context_vector(self, entity_inds: Tuple[int, ...], index: Tuple[np.ndarray, np.ndarray], size: int,
+                        ignore_center: bool, center_inds: Optional[np.ndarray] = None) -> Optional[np.ndarray]:
+        r''' Weighted average of the vectors in the context window of `size` around the entity, None if
+        there are no vectors. If `center_inds` is not set the entity tokens are used for the center.
+        '''
+        vec_inds, is_context = index
+        start_ind = entity_inds[0]
+        end_ind = entity_inds[-1]
+        step_weights = self._step_weights(size)
+
+        # Context tokens on the left, the first one is the closest to the center, and on the right
+        left = np.arange(start_ind - 1, max(0, start_ind - size) - 1, -1)
+        left = left[is_context[left]]
+        right = np.arange(end_ind + 1, min(len(vec_inds), end_ind + 1 + size))
+        right = right[is_context[right]]
+
+        # The weight of a token depends on its position among the context tokens, also the ones without vectors
+        left_inds = vec_inds[left]
+        left_weights = step_weights[:len(left)][left_inds >= 0]
+        right_inds = vec_inds[right]
+        right_weights = step_weights[:len(right)][right_inds >= 0]
+
+        if ignore_center:
+            center_inds = np.array([], dtype=np.int64)
+        elif center_inds is None:
+            center_inds = vec_inds[list(entity_inds)]
+
+        inds = np.concatenate([left_inds[left_inds >= 0], center_inds[center_inds >= 0], right_inds[right_inds >= 0]])
+        if len(inds) == 0:
+            return None
+        weights = np.concatenate([left_weights, np.ones(int(np.sum(center_inds >= 0))), right_weights])
+        # The vocab keeps float32, the averages are calculated in float64
+        values = self.vocab.vectors[inds].astype(np.float64) * weights[:, np.newaxis]
+
+        return np.average(values, axis=0)
+
     def similarity(self, cui: str, entity: Span, doc: Doc) -> float:
         r''' Calculate the similarity between the learnt context for this CUI and the context
         in the given `doc`.
@@ -114,7 +203,11 @@ class ContextModel(object):
                 # Can be that a certain context_type does not exist for a cui/context
                 if context_type in vectors and context_type in cui_vectors:
                     weight = self.config.linking['context_vector_weights'][context_type]
-                    s = np.dot(unitvec(vectors[context_type]), unitvec(cui_vectors[context_type]))
+                    if isinstance(self.cdb.cui2context_vectors, ContextVectorStore):
+                        # Norms are cached in the store
+                        s = np.dot(unitvec(vectors[context_type]), self.cdb.cui2context_vectors.unit_vector(cui, context_type))
+                    else:
+                        s = np.dot(unitvec(vectors[context_type]), unitvec(cui_vectors[context_type]))
                     similarity += weight * s
 
                     # DEBUG
@@ -124,6 +217,103 @@ class ContextModel(object):
         else:
             return -1
 
+    def similarities(self, cuis: List, vectors_list: List[Dict]) -> np.ndarray:
+        r''' Vectorised `_similarity`, calculates the similarity between the learnt context of every CUI
+        and every provided context with one matrix multiplication per context type.
+
+        Args:
+            cuis (List[str]):
+                CUIs for which the similarities are calculated.
+            vectors_list (List[Dict]):
+                Context vectors as returned by `get_context_vectors`, usually one for each entity.
+
+        Returns:
+            np.ndarray:
+                Similarities of shape (len(vectors_list), len(cuis)). CUIs without context vectors or
+                with less than `train_count_threshold` training examples have a similarity of -1.
+        '''
+        sims = np.zeros((len(vectors_list), len(cuis)))
+
+        for context_type, weight in self.config.linking['context_vector_weights'].items():
+            # Can be that a certain context_type does not exist for a cui/context
+            ent_inds = [i for i, vectors in enumerate(vectors_list) if context_type in vectors]
+            cui_inds = [i for i, cui in enumerate(cuis) if context_type in self.cdb.cui2context_vectors.get(cui, {})]
+
+            if ent_inds and cui_inds:
+                ent_matrix = _unit_rows([vectors_list[i][context_type] for i in ent_inds])
+                if isinstance(self.cdb.cui2context_vectors, ContextVectorStore):
+                    cui_matrix = self.cdb.cui2context_vectors.unit_matrix([cuis[i] for i in cui_inds], context_type)
+                else:
+                    cui_matrix = _unit_rows([self.cdb.cui2context_vectors[cuis[i]][context_type] for i in cui_inds])
+                sims[np.ix_(ent_inds, cui_inds)] += weight * ent_matrix.dot(cui_matrix.T)
+
+        threshold = self.config.linking['train_count_threshold']
+        invalid = [i for i, cui in enumerate(cuis) if not self.cdb.cui2context_vectors.get(cui, {}) or
+                   self.cdb.cui2count_train.get(cui, 0) < threshold]
+        sims[:, invalid] = -1
+
+        return sims
+
+    def disambiguate_batch(self, entities: List[Tuple[List, Span, str]], doc: Doc) -> List[Tuple]:
+        r''' Same as `disambiguate`, but for all the provided entities from one document at once. The context
+        vectors for all candidate CUIs are stacked and the similarities calculated in one go, the output
+        is the same as calling `disambiguate` for each entity.
+
+        Args:
+            entities (List[Tuple[List, Span, str]]):
+                A tuple of (cuis, entity, name) for every entity that has to be disambiguated.
+            doc (Doc):
+                The document the entities come from.
+
+        Returns:
+            List[Tuple]:
+                A tuple of (cui, similarity) for each entity, in the same order as the input.
+        '''
+        filters = self.config.linking['filters']
+        if self.config.linking['filter_before_disamb']:
+            entities = [([cui for cui in cuis if check_filters(cui, filters)], entity, name) for cuis, entity, name in entities]
+
+        # Every candidate CUI gets one column in the similarity matrix
+        cui2col: Dict = {}
+        for cuis, _, _ in entities:
+            for cui in cuis:
+                cui2col.setdefault(cui, len(cui2col))
+
+        vectors_list = [self.get_context_vectors(entity, doc) if cuis else {} for cuis, entity, _ in entities]
+        all_similarities = self.similarities(list(cui2col.keys()), vectors_list)
+
+        out: List[Tuple] = []
+        for row, (cuis, entity, name) in enumerate(entities):
+            if cuis: # Maybe none are left after filtering
+                similarities = self._prefer(cuis, all_similarities[row, [cui2col[cui] for cui in cuis]], name)
+                mx = int(np.argmax(similarities))
+                # DEBUG
+                self.log.debug("Similarities: %s", list(zip(cuis, similarities)))
+                out.append((cuis[mx], float(similarities[mx])))
+            else:
+                out.append((None, 0))
+
+        return out
+
+    def _prefer(self, cuis: List, similarities: np.ndarray, name: str) -> np.ndarray:
+        r''' Vectorised `prefer_primary_name` and `prefer_frequent_concepts` adjustments from `disambiguate`.
+        '''
+        prefer_primary_name = self.config.linking.get('prefer_primary_name', 0)
+        if prefer_primary_name > 0:
+            statuses = self.cdb.name2cuis2status.get(name, {})
+            is_primary = np.array([statuses.get(cui, '') in {'P', 'PD'} for cui in cuis]) & (similarities > 0)
+            similarities = np.where(is_primary, np.minimum(0.99, similarities + similarities * prefer_primary_name), similarities)
+
+        prefer_frequent_concepts = self.config.linking.get('prefer_frequent_concepts', 0)
+        if prefer_frequent_concepts > 0:
+            cnts = np.array([self.cdb.cui2count_train.get(cui, 0) for cui in cuis])
+            m = cnts.min() if cnts.min() > 0 else 1
+            # np.maximum only to avoid log10(0) warnings, those scales are not used
+            scales = np.where(cnts > 10, np.log10(np.maximum(cnts, 1) / m) * prefer_frequent_concepts, 0)
+            similarities = np.minimum(0.99, similarities + similarities * scales)
+
+        return similarities
+
     def disambiguate(self, cuis: List, entity: Span, name: str, doc: Doc) -> Tuple:
         vectors = self.get_context_vectors(entity, doc)
         filters = self.config.linking['filters']
@@ -225,16 +415,26 @@ class ContextModel(object):
     def train_using_negative_sampling(self, cui: str) -> None:
         vectors = {}
 
-        # Get vectors for each context type
-        for context_type in self.config.linking['context_vector_sizes'].keys():
-            size = self.config.linking['context_vector_sizes'][context_type]
-            # While it should be size*2 it is already too many negative examples, so we leave it at size
-            inds = self.vocab.get_negative_samples(size, ignore_punct_and_num=self.config.linking['negative_ignore_punct_and_num'])
-            values = [self.vocab.vec(self.vocab.index2word[ind]) for ind in inds]
-            if len(values) > 0:
-                vectors[context_type] = np.average(values, axis=0)
+        # Get vectors for each context type, the samples for all of them are drawn at once
+        context_types = list(self.config.linking['context_vector_sizes'].keys())
+        # While it should be size*2 it is already too many negative examples, so we leave it at size
+        sizes = [self.config.linking['context_vector_sizes'][context_type] for context_type in context_types]
+        samples = self.vocab.get_negative_samples_batch(sizes, ignore_punct_and_num=self.config.linking['negative_ignore_punct_and_num'])
+        for context_type, inds in zip(context_types, samples):
+            if len(inds) > 0:
+                vectors[context_type] = np.average(self.vocab.vectors[inds].astype(np.float64), axis=0)
             # Debug
             self.log.debug("Updating CUI: %s, with %s negative words", cui, len(inds))
 
         # Do the update for all context types
         self.cdb.update_context_vector(cui=cui, vectors=vectors, negative=True)
+
+
+def _unit_rows(vectors: List) -> np.ndarray:
+    r''' Stack the vectors into a matrix and normalize each row, zero vectors are left as they are.
+    '''
+    matrix = np.array(vectors, dtype=np.float64)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+
+    return matrix / norms
@@ -0,0 +1,84 @@
+import logging
+from typing import Dict, List, Optional, Set, Tuple
+
+
+class NameTrie(object):
+    r''' Token level trie compiled from all the subnames (`cdb.snames`) of a CDB. Every subname
+    is a node and a node has a child for each token that can be appended to it (with the separator)
+    so that the result is again a subname. This removes the need to build separator-joined strings
+    and probe `cdb.snames` for every extension step during NER.
+
+    Args:
+        snames (`Set[str]`):
+            All subnames from the CDB, usually `cdb.snames`.
+        separator (`str`):
+            Separator used to join tokens of a name, usually `config.general['separator']`.
+        reverse (`bool`, defaults to `False`):
+            If True the reverse edges (token + separator + name) are also compiled, needed
+            only when `config.ner['try_reverse_word_order']` is used.
+    '''
+    log = logging.getLogger(__name__)
+
+    def __init__(self, snames: Set[str], separator: str, reverse: bool = False) -> None:
+        self.separator = separator
+        self.reverse = reverse
+        # Node ID to subname and back
+        self.names: List[str] = list(snames)
+        self.name2node: Dict[str, int] = {name: node for node, name in enumerate(self.names)}
+        # (node, token) -> node for name + separator + token and token + separator + name
+        self.children: Dict[Tuple[int, str], int] = {}
+        self.reverse_children: Dict[Tuple[int, str], int] = {}
+
+        # Used to detect changes in the snames after the trie was compiled
+        self._snames = snames
+        self._snames_len = len(snames)
+
+        self._compile()
+
+    def _compile(self) -> None:
+        self.log.info("Compiling the name trie for %s subnames", len(self.names))
+        sep = self.separator
+        sep_len = len(sep)
+        # Tokens repeat a lot across names, keep only one copy of each
+        tokens: Dict[str, str] = {}
+
+        for node, name in enumerate(self.names):
+            # A token can in theory contain the separator, so every split point is considered
+            ind = name.find(sep)
+            while ind != -1:
+                head = name[:ind]
+                tail = name[ind + sep_len:]
+
+                parent = self.name2node.get(head)
+                if parent is not None:
+                    tail = tokens.setdefault(tail, tail)
+                    self.children[(parent, tail)] = node
+
+                if self.reverse:
+                    parent = self.name2node.get(tail)
+                    if parent is not None:
+                        head = tokens.setdefault(head, head)
+                        self.reverse_children[(parent, head)] = node
+
+                ind = name.find(sep, ind + 1)
+
+    def is_compiled_for(self, snames: Set[str], reverse: bool = False) -> bool:
+        r''' Check is this trie up to date for the provided snames. The CDB only ever
+        adds subnames, so the size is enough to detect a change.
+        '''
+        return self._snames is snames and self._snames_len == len(snames) and (self.reverse or not reverse)
+
+    def root(self, token: str) -> Optional[int]:
+        r''' Node for a name starting with `token`, or None if no subname starts with it.
+        '''
+        return self.name2node.get(token)
+
+    def child(self, node: int, token: str) -> Optional[int]:
+        r''' Node for `name + separator + token`, where `name` is the name of the `node`.
+        '''
+        return self.children.get((node, token))
+
+    def reverse_child(self, node: int, token: str) -> Optional[int]:
+        r''' Node for `token + separator + name`, where `name` is the name of the `node`.
+        '''
+        return self.reverse_children.get((node, token))
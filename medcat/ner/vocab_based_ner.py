@@ -1,6 +1,8 @@
 import logging
+from typing import List, Optional, Tuple
 from spacy.tokens import Doc
 from medcat.ner.vocab_based_annotator import maybe_annotate_name
+from medcat.ner.name_trie import NameTrie
 from medcat.pipeline.pipe_runner import PipeRunner
 from medcat.cdb import CDB
 from medcat.config import Config
@@ -18,6 +20,7 @@ class NER(PipeRunner):
     def __init__(self, cdb: CDB, config: Config) -> None:
         self.config = config
         self.cdb = cdb
+        self._name_trie: Optional[NameTrie] = None
         super().__init__(self.config.general['workers'])
 
     # Override
@@ -32,6 +35,9 @@ class NER(PipeRunner):
             doc (`spacy.tokens.Doc`):
                 Spacy document with detected entities.
         '''
+        if self.config.ner.get('use_name_trie', False):
+            return self._call_with_name_trie(doc)
+
         # Just take the tokens we need
         _doc = [tkn for tkn in doc if not tkn._.to_skip]
         for i in range(len(_doc)):
@@ -86,3 +92,77 @@ class NER(PipeRunner):
                         break
 
         return doc
+
+    def get_name_trie(self) -> NameTrie:
+        r''' Returns the name trie for the current CDB, it will be (re)compiled if the
+        subnames in the CDB changed since the last call.
+        '''
+        reverse = self.config.ner.get('try_reverse_word_order', False)
+        if self._name_trie is None or not self._name_trie.is_compiled_for(self.cdb.snames, reverse=reverse) or \
+                self._name_trie.separator != self.config.general['separator']:
+            self._name_trie = NameTrie(self.cdb.snames, separator=self.config.general['separator'], reverse=reverse)
+
+        return self._name_trie
+
+    def _call_with_name_trie(self, doc: Doc) -> Doc:
+        r''' Same as `__call__`, but the names are matched in one left to right pass over the tokens by walking
+        the compiled name trie. Every token that starts a subname opens a cursor (its start and trie node), each
+        token then moves all open cursors one step and the ones that can not be extended are closed. The matches
+        are annotated in the same order as in `__call__` (by start, then end), so the output is identical.
+        '''
+        trie = self.get_name_trie()
+        names = trie.names
+        name2cuis = self.cdb.name2cuis
+        max_skip_tokens = self.config.ner['max_skip_tokens']
+        try_reverse = self.config.ner.get('try_reverse_word_order', False)
+
+        _doc = [tkn for tkn in doc if not tkn._.to_skip]
+        # (start, end, name) for every name found, start and end are positions in _doc
+        matches: List[Tuple[int, int, str]] = []
+        # (start, node) of the names that can still be extended
+        cursors: List[Tuple[int, int]] = []
+
+        for j, tkn in enumerate(_doc):
+            name_versions = (tkn._.norm, tkn.lower_)
+            if j > 0 and tkn.i - _doc[j - 1].i - 1 > max_skip_tokens:
+                # Do not allow to skip more than limit
+                cursors = []
+
+            open_cursors = []
+            for start, node in cursors:
+                child = None
+                name_reverse = None
+                for name_version in name_versions:
+                    child = trie.child(node, name_version)
+                    if child is not None:
+                        break
+
+                    if try_reverse:
+                        reverse_child = trie.reverse_child(node, name_version)
+                        if reverse_child is not None:
+                            name_reverse = names[reverse_child]
+
+                if child is not None:
+                    open_cursors.append((start, child))
+                    if names[child] in name2cuis:
+                        matches.append((start, j, names[child]))
+                elif name_reverse is not None:
+                    # The name in reverse order is only annotated, extending continues from the name as it was
+                    open_cursors.append((start, node))
+                    if name_reverse in name2cuis:
+                        matches.append((start, j, name_reverse))
+
+            for name_version in name_versions:
+                root = trie.root(name_version)
+                if root is not None:
+                    open_cursors.append((j, root))
+                    if names[root] in name2cuis and not tkn.is_stop:
+                        matches.append((j, j, names[root]))
+                    break
+            cursors = open_cursors
+
+        matches.sort(key=lambda match: (match[0], match[1]))
+        for start, end, name in matches:
+            maybe_annotate_name(name, _doc[start:end + 1], doc, self.cdb, self.config)
+
+        return doc
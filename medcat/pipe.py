@@ -1,22 +1,26 @@
+import time
 import types
 import spacy
 import gc
 import logging
-from typing import List, Optional, Union, Iterable, Callable
+from typing import List, Optional, Union, Iterable, Iterator, Callable, cast
 from multiprocessing import cpu_count
-from spacy.tokens import Token, Doc, Span
+from multiprocess import Pool
+from spacy.tokens import Token, Doc, Span, DocBin
 from spacy.tokenizer import Tokenizer
 from spacy.language import Language
-from spacy.util import raise_error
+from spacy.util import raise_error, minibatch
+from spacy.errors import Errors
 from tqdm.autonotebook import tqdm
 from medcat.linking.context_based_linker import Linker
 from medcat.meta_cat import MetaCAT
 from medcat.ner.vocab_based_ner import NER
 from medcat.utils.normalizers import TokenNormalizer, BasicSpellChecker
+from medcat.utils.lru_cache import LRUCache
 from medcat.utils.loggers import add_handlers
 from medcat.config import Config
 from medcat.pipeline.pipe_runner import PipeRunner
-from medcat.preprocessing.taggers import tag_skip_and_punct
+from medcat.pipeline.pipe_stats import PipeStats
 
 
 class Pipe(object):
@@ -41,9 +45,12 @@ class Pipe(object):
         if config.preprocessing['stopwords'] is not None:
             self._nlp.Defaults.stop_words = set(config.preprocessing['stopwords'])
         self._nlp.tokenizer = tokenizer(self._nlp, config)
+        # The spacy components, MedCAT components are added after this
+        self._spacy_components = list(self._nlp.pipe_names)
         # Set max document length
         self._nlp.max_length = config.preprocessing.get('max_document_length', 1000000)
         self.config = config
+        self._stats: Optional[PipeStats] = None
         # Set log level
         self.log.setLevel(self.config.general['log_level'])
 
@@ -71,8 +78,10 @@ class Pipe(object):
         for field in additional_fields:
             Token.set_extension(field, default=False, force=True)
 
-    def add_token_normalizer(self, config: Config, name: Optional[str] = None, spell_checker: Optional[BasicSpellChecker] = None) -> None:
-        token_normalizer = TokenNormalizer(config=config, spell_checker=spell_checker)
+    def add_token_normalizer(self, config: Config, name: Optional[str] = None, spell_checker: Optional[BasicSpellChecker] = None,
+                             cache: Optional[LRUCache] = None) -> None:
+        token_normalizer = TokenNormalizer(config=config, spell_checker=spell_checker, cache=cache,
+                                           nlp=self._nlp, components=self._spacy_components)
         component_name = spacy.util.get_object_name(token_normalizer)
         name = name if name is not None else component_name
         Language.component(name=component_name, func=token_normalizer)
@@ -81,6 +90,23 @@ class Pipe(object):
         # Add custom fields needed for this usecase
         Token.set_extension('norm', default=None, force=True)
 
+    def prewarm_spell_check_cache(self, texts: Iterable[str]) -> int:
+        r''' Fill the spelling fix cache of the token normalizer with the most frequent words from `texts`
+        (see `TokenNormalizer.prewarm`).
+
+        Args:
+            texts (`Iterable[str]`):
+                A corpus similar to the documents that will be annotated.
+
+        Returns:
+            The number of words added to the cache.
+        '''
+        for _, component in self._nlp.pipeline:
+            if isinstance(component, TokenNormalizer):
+                tokenizer = self._nlp.tokenizer
+                return component.prewarm(token.text for text in texts for token in tokenizer(text))
+        raise ValueError("The pipeline has no token normalizer")
+
     def add_ner(self, ner: NER, name: Optional[str] = None) -> None:
         r''' Add NER from CAT to the pipeline, will also add the necessary fields
         to the document and Span objects.
@@ -137,8 +163,10 @@ class Pipe(object):
                 The input sequence of texts to process.
             n_process (`int`):
                 The number of processes running in parallel. Defaults to max(mp.cpu_count() - 1, 1).
+                If negative config.general['workers'] processes are used, each running the whole pipeline on batches of texts.
             batch_size (`int`):
-                The number of texts to buffer. Defaults to 1000.
+                The number of texts to buffer. Defaults to 1000. If n_process is negative, the number of texts sent to a
+                worker at once.
             total (`int`):
                 The number of texts in total.
 
@@ -157,34 +185,50 @@ class Pipe(object):
         n_process = n_process if n_process is not None else max(cpu_count() - 1, 1)
         batch_size = batch_size if batch_size is not None else 1000
 
-        # If n_process < 0, multiprocessing will be either conducted inside pipeline components based on the con(when
-        # 'parallel' is set to True) or not happen at all (when 'parallel' is set to False). Otherwise, multiprocessing
-        # will be conducted at the pipeline level, i.e., texts will be processed sequentially by each pipeline component.
+        # If n_process < 0, texts are sent in batches to a pool of config.general['workers'] processes, each of them
+        # runs the whole pipeline and sends back all the docs of a batch at once. Otherwise, multiprocessing will be
+        # conducted by spaCy at the pipeline level.
         if n_process < 0:
-            inner_parallel = True
-            n_process = 1
-        else:
-            inner_parallel = False
-
-        component_cfg = {
-            tag_skip_and_punct.name: {  # type: ignore
-                'parallel': inner_parallel
-            },
-            TokenNormalizer.name: {
-                'parallel': inner_parallel
-            },
-            NER.name: {
-                'parallel': inner_parallel
-            },
-            Linker.name: {
-                'parallel': inner_parallel
-            }
-        }
+            return self._batch_inner_parallel(texts, self.config.general['workers'], batch_size)
 
         return self._nlp.pipe(texts,    # type: ignore
                              n_process=n_process,
-                             batch_size=batch_size,
-                             component_cfg=component_cfg)
+                             batch_size=batch_size)
+
+    def _batch_inner_parallel(self, texts: Iterable[str], workers: int, batch_size: int) -> Iterator[Doc]:
+        # Worker processes are forked, so they get the current pipeline without it being pickled
+        with Pool(workers, initializer=_init_worker, initargs=(self._nlp,)) as pool:
+            for doc_bin_bytes in pool.imap(_run_batch, minibatch(texts, size=batch_size)):
+                yield from DocBin().from_bytes(doc_bin_bytes).get_docs(self._nlp.vocab)
+
+    def enable_stats(self, stats: Optional[PipeStats] = None) -> PipeStats:
+        r''' Start recording the time spent in each pipeline component for each document and the counters
+        of MedCAT components. Only documents annotated through `__call__` are recorded, not the ones
+        from `batch_multi_process`.
+
+        Args:
+            stats (`medcat.pipeline.pipe_stats.PipeStats`, optional):
+                Where to record, e.g. to add hooks. A new one is created if not set.
+
+        Return:
+            medcat.pipeline.pipe_stats.PipeStats:
+                The object with the stats, also available as `pipe.stats`.
+        '''
+        self._stats = stats if stats is not None else PipeStats()
+        for _, component in self._nlp.components:
+            if isinstance(component, PipeRunner):
+                component.stats = self._stats
+        return self._stats
+
+    def disable_stats(self) -> None:
+        self._stats = None
+        for _, component in self._nlp.components:
+            if isinstance(component, PipeRunner):
+                component.stats = None
+
+    @property
+    def stats(self) -> Optional[PipeStats]:
+        return self._stats
 
     def set_error_handler(self, error_handler: Callable) -> None:
         self._nlp.set_error_handler(error_handler)
@@ -212,14 +256,85 @@ class Pipe(object):
     def _ensure_serializable(doc: Doc) -> Doc:
         return PipeRunner.serialize_entities(doc)
 
+    def _run_components(self, doc: Doc, pipeline: List) -> Doc:
+        # Same as the component loop of Language.__call__, with each component timed if stats are enabled
+        for name, proc in pipeline:
+            start = time.perf_counter()
+            try:
+                doc = proc(doc)
+            except Exception as e:
+                error_handler = proc.get_error_handler() if hasattr(proc, 'get_error_handler') else self._nlp.default_error_handler
+                error_handler(name, proc, [doc], e)
+            if not isinstance(doc, Doc):
+                raise ValueError(Errors.E005.format(name=name, returned_type=type(doc)))
+            if self._stats is not None:
+                self._stats.record_time(name, doc, time.perf_counter() - start)
+        return doc
+
+    def _call_with_stats(self, text: str) -> Doc:
+        # Same as Language.__call__ but each component is timed
+        stats = cast(PipeStats, self._stats)
+        start = time.perf_counter()
+        doc = self._nlp.make_doc(text)
+        stats.record_time('tokenizer', doc, time.perf_counter() - start)
+
+        doc = self._run_components(doc, self._nlp.pipeline)
+
+        stats.count('docs')
+        stats.count('tokens', len(doc))
+        return doc
+
+    def _split_index(self) -> int:
+        # Position of the first component that depends on the CDB or a model (NER, linker, meta annotations)
+        for i, (_, component) in enumerate(self._nlp.pipeline):
+            if isinstance(component, (NER, Linker, MetaCAT)):
+                return i
+        return len(self._nlp.pipeline)
+
+    def preprocess(self, text: str) -> Doc:
+        r''' Run only the preprocessing part of the pipeline on a text: the tokenizer, spacy components, tagger
+        and token normalizer. The output can be annotated (also many times) with `annotate`, which together is
+        the same as calling the pipe with the text.
+
+        The output depends only on the config, except for spelling fixes where words added to the CDB
+        vocab after preprocessing are not taken into account.
+
+        Args:
+            text (`str`):
+                The text to preprocess.
+
+        Return:
+            spacy.tokens.Doc:
+                A document without entities.
+        '''
+        doc = self._nlp.make_doc(text)
+        return self._run_components(doc, self._nlp.pipeline[:self._split_index()])
+
+    def annotate(self, doc: Doc) -> Doc:
+        r''' Run the rest of the pipeline (NER, linker and meta annotations) on a copy of a document from `preprocess`,
+        the preprocessed document is not changed.
+
+        Args:
+            doc (`spacy.tokens.Doc`):
+                Output of `preprocess`.
+
+        Return:
+            spacy.tokens.Doc:
+                A new document with the extracted entities.
+        '''
+        return self._run_components(doc.copy(), self._nlp.pipeline[self._split_index():])
+
+    def _call(self, text: str) -> Doc:
+        return self._nlp(text) if self._stats is None else self._call_with_stats(text)
+
     def __call__(self, text: Union[str, Iterable[str]]) -> Union[Doc, List[Doc]]:
         if isinstance(text, str):
-            return self._nlp(text) if len(text) > 0 else None
+            return self._call(text) if len(text) > 0 else None
         elif isinstance(text, Iterable):
             docs = []
             for t in text if isinstance(text, types.GeneratorType) else tqdm(text, total=len(list(text))):
                 try:
-                    doc = self._nlp(t) if isinstance(t, str) and len(t) > 0 else None
+                    doc = self._call(t) if isinstance(t, str) and len(t) > 0 else None
                 except Exception as e:
                     self.log.warning("Exception raised when processing text: %s", t[:50] + "..." if isinstance(t, str) else t)
                     self.log.warning(e, exc_info=True, stack_info=True)
@@ -229,3 +344,20 @@ class Pipe(object):
         else:
             self.log.error("The input text should be either a string or a sequence of strings but got: %s", type(text))
             return None
+
+
+# The spaCy pipeline used by the worker processes of `Pipe._batch_inner_parallel`
+_worker_nlp: Optional[Language] = None
+
+
+def _init_worker(nlp: Language) -> None:
+    global _worker_nlp
+    _worker_nlp = nlp
+
+
+def _run_batch(texts: List[str]) -> bytes:
+    # Entities are already serialized by the last pipeline component, failed docs are dropped by the pipe
+    doc_bin = DocBin(store_user_data=True)
+    for doc in cast(Language, _worker_nlp).pipe(texts):
+        doc_bin.add(doc)
+    return doc_bin.to_bytes()
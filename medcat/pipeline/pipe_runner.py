@@ -1,11 +1,11 @@
 import logging
-import gc
 from joblib import Parallel, delayed
-from typing import Iterable, Generator, Tuple, Callable, Union, Iterator
+from typing import Iterable, Generator, Tuple, Callable, Union, Iterator, Optional
 from spacy.tokens import Doc, Span
 from spacy.tokens.underscore import Underscore
 from spacy.pipeline import Pipe
 from spacy.util import minibatch
+from medcat.pipeline.pipe_stats import PipeStats
 
 
 class PipeRunner(Pipe):
@@ -14,6 +14,8 @@ class PipeRunner(Pipe):
     _execute = None
     _delayed = None
     _time_out_in_secs = 3600
+    # Set by `Pipe.enable_stats`, components can use it to increment counters
+    stats: Optional[PipeStats] = None
 
     def __init__(self, workers: int):
         self.workers = workers
@@ -61,8 +63,6 @@ class PipeRunner(Pipe):
             if hasattr(ent._, 'meta_anns') and ent._.meta_anns:
                 serializable['meta_anns'] = ent._.meta_anns
             new_ents.append(serializable)
-        doc._.ents.clear()
-        gc.collect()
         doc._.ents = new_ents
         return doc
 
@@ -80,8 +80,6 @@ class PipeRunner(Pipe):
             if 'meta_anns' in ent:
                 ent_span._.meta_anns = ent['meta_anns']
             new_ents.append(ent_span)
-        doc._.ents.clear()
-        gc.collect()
         doc._.ents = new_ents
         return doc
 
@@ -0,0 +1,115 @@
+import time
+import logging
+import numpy as np
+from collections import Counter, deque
+from typing import Callable, Deque, Dict, List, Optional
+from spacy.tokens import Doc
+
+
+class PipeStats(object):
+    r''' Timings and counters collected by a `medcat.pipe.Pipe` with instrumentation enabled (see `Pipe.enable_stats`).
+
+    Per component it records the wall time spent on each document, MedCAT components also increment counters
+    (`spell_check_fixes`, `entities`, `disambiguations`) and histograms (`candidates_per_entity`).
+
+    Args:
+        hooks (`List[Callable]`, optional):
+            Called as `hook(component_name, doc, seconds)` every time a component finishes a document.
+        max_samples (`int`, defaults to 10000):
+            Number of the most recent per document timings kept for each component, used for the percentiles.
+    '''
+    log = logging.getLogger(__name__)
+
+    def __init__(self, hooks: Optional[List[Callable]] = None, max_samples: int = 10000) -> None:
+        self.hooks = hooks if hooks is not None else []
+        self.max_samples = max_samples
+        self.reset()
+
+    def reset(self) -> None:
+        self.started = time.time()
+        self.counters: Counter = Counter()
+        self.histograms: Dict[str, Counter] = {}
+        # Component name to the number of documents and the total time, and the most recent timings
+        self.calls: Counter = Counter()
+        self.total_time: Dict[str, float] = {}
+        self.samples: Dict[str, Deque[float]] = {}
+
+    def record_time(self, component: str, doc: Optional[Doc], seconds: float) -> None:
+        self.calls[component] += 1
+        self.total_time[component] = self.total_time.get(component, 0) + seconds
+        if component not in self.samples:
+            self.samples[component] = deque(maxlen=self.max_samples)
+        self.samples[component].append(seconds)
+
+        for hook in self.hooks:
+            try:
+                hook(component, doc, seconds)
+            except Exception as e:
+                self.log.warning("Pipe stats hook failed for component %s", component)
+                self.log.warning(e, exc_info=True)
+
+    def count(self, name: str, n: int = 1) -> None:
+        self.counters[name] += n
+
+    def observe(self, name: str, value: int) -> None:
+        if name not in self.histograms:
+            self.histograms[name] = Counter()
+        self.histograms[name][value] += 1
+
+    def summary(self) -> Dict:
+        r''' Everything collected until now as a json serializable dictionary, times are in milliseconds.
+        '''
+        components = {}
+        for component, calls in self.calls.items():
+            samples = np.array(self.samples[component]) * 1000
+            components[component] = {'docs': calls,
+                                     'total_ms': self.total_time[component] * 1000,
+                                     'mean_ms': self.total_time[component] * 1000 / calls,
+                                     'p50_ms': float(np.percentile(samples, 50)),
+                                     'p99_ms': float(np.percentile(samples, 99)),
+                                     'max_ms': float(samples.max())}
+
+        histograms = {}
+        for name, histogram in self.histograms.items():
+            total = sum(histogram.values())
+            histograms[name] = {'count': total,
+                                'mean': sum(value * n for value, n in histogram.items()) / total,
+                                'max': max(histogram),
+                                'values': {str(value): n for value, n in sorted(histogram.items())}}
+
+        return {'seconds': time.time() - self.started,
+                'components': components,
+                'counters': dict(self.counters),
+                'histograms': histograms}
+
+    def to_prometheus(self, prefix: str = 'medcat') -> str:
+        r''' The stats in the Prometheus text exposition format.
+
+        Args:
+            prefix (`str`, defaults to `medcat`):
+                Prefix for all the metric names.
+        '''
+        lines = ["# TYPE {}_component_seconds summary".format(prefix)]
+        for component, calls in self.calls.items():
+            samples = np.array(self.samples[component])
+            for quantile in (0.5, 0.99):
+                lines.append('{}_component_seconds{{component="{}",quantile="{}"}} {}'.format(
+                             prefix, component, quantile, float(np.percentile(samples, quantile * 100))))
+            lines.append('{}_component_seconds_sum{{component="{}"}} {}'.format(prefix, component, self.total_time[component]))
+            lines.append('{}_component_seconds_count{{component="{}"}} {}'.format(prefix, component, calls))
+
+        for name, value in sorted(self.counters.items()):
+            lines.append("# TYPE {}_{}_total counter".format(prefix, name))
+            lines.append("{}_{}_total {}".format(prefix, name, value))
+
+        for name, histogram in sorted(self.histograms.items()):
+            lines.append("# TYPE {}_{} histogram".format(prefix, name))
+            cumulative = 0
+            for value, n in sorted(histogram.items()):
+                cumulative += n
+                lines.append('{}_{}_bucket{{le="{}"}} {}'.format(prefix, name, value, cumulative))
+            lines.append('{}_{}_bucket{{le="+Inf"}} {}'.format(prefix, name, cumulative))
+            lines.append("{}_{}_sum {}".format(prefix, name, sum(value * n for value, n in histogram.items())))
+            lines.append("{}_{}_count {}".format(prefix, name, cumulative))
+
+        return "\n".join(lines) + "\n"
@@ -2,9 +2,12 @@
 pretty much everything that is not a word.
 """
 import re
-from typing import Dict, Optional, List
+from typing import Dict, FrozenSet, Optional, List, Tuple
 from spacy.language import Language
+from spacy.tokens import Doc
 from medcat.config import Config
+from medcat.utils.lru_cache import LRUCache
+from medcat.utils.lexeme_cache import FrozenValues
 
 
 def prepare_name(raw_name: str, nlp: Language, names: Dict, config: Config) -> Dict:
@@ -25,7 +28,27 @@ def prepare_name(raw_name: str, nlp: Language, names: Dict, config: Config) -> D
             The new dictionary of prepared names.
     '''
     sc_name = nlp(raw_name)
+    return prepare_name_from_doc(sc_name, raw_name, names, config)
 
+
+def prepare_name_from_doc(sc_name: Doc, raw_name: str, names: Dict, config: Config) -> Dict:
+    r''' Same as `prepare_name`, but for a name that was already processed with the spacy pipeline,
+    e.g. in batches with `nlp.pipe`.
+
+    Args:
+        sc_name (`spacy.tokens.Doc`):
+            The output of `nlp(raw_name)`.
+        raw_name (`str`):
+            The name as it was sent to the pipeline.
+        names (`dict`):
+            Dictionary of existing names for this concept, see `prepare_name`.
+        config (`medcat.config.Config`):
+            Global config for medcat.
+
+    Return:
+        names (`dict`):
+            The new dictionary of prepared names.
+    '''
     for version in config.cdb_maker['name_versions']:
         tokens = None
         is_upper = sc_name.text.isupper()
@@ -63,6 +86,69 @@ def prepare_name(raw_name: str, nlp: Language, names: Dict, config: Config) -> D
     return names
 
 
+def add_prepared_names(names: Dict, prepared: Dict) -> Dict:
+    r''' Add name versions prepared for one raw name (an output of `prepare_name` with empty `names`) to `names`,
+    names that are already there are kept. The same as `prepare_name` would do, but the added names are copies.
+
+    Args:
+        names (`dict`):
+            Dictionary of existing names for a concept.
+        prepared (`dict`):
+            Names prepared from a raw name.
+
+    Return:
+        names (`dict`):
+            The new dictionary of prepared names.
+    '''
+    for name, name_info in prepared.items():
+        if name not in names:
+            # The CDB keeps (and extends) the snames set, so every concept gets its own
+            names[name] = dict(name_info, tokens=list(name_info['tokens']), snames=set(name_info['snames']))
+    return names
+
+
+class PreparedNameCache(LRUCache):
+    r''' Names prepared from a raw name with `prepare_name`, so that every raw name is sent through spacy only once.
+    The output of `prepare_name` depends only on the raw name and the config, the cache is emptied when any of
+    the config fields used for it changes (or explicitly with `clear`).
+
+    Args:
+        maxsize (`int`, optional, defaults to 100000):
+            Maximum number of raw names, 0 disables the cache and None means no limit.
+    '''
+
+    def __init__(self, maxsize: Optional[int] = 100000) -> None:
+        super().__init__(maxsize)
+        self.signature: Optional[Tuple] = None
+        self._stopwords = FrozenValues()
+
+    @staticmethod
+    def config_signature(config: Config, stopwords: Optional[FrozenSet] = None) -> Tuple:
+        cnf_p = config.preprocessing
+        if stopwords is None and cnf_p['stopwords'] is not None:
+            stopwords = frozenset(cnf_p['stopwords'])
+        return (config.general['spacy_model'], config.general['separator'], tuple(config.cdb_maker['name_versions']),
+                config.cdb_maker.get('min_letters_required', 0), cnf_p['min_len_normalize'],
+                tuple(sorted(cnf_p.get('do_not_normalize') or [])), cnf_p['skip_stopwords'],
+                tuple(sorted(cnf_p['words_to_skip'])), tuple(sorted(cnf_p['keep_punct'])), stopwords)
+
+    def check(self, config: Config) -> None:
+        r''' Empty the cache if the config used to prepare names changed. The stopwords are only copied again if the
+        set was replaced or its size changed (see `medcat.utils.lexeme_cache.FrozenValues`).
+        '''
+        signature = self.config_signature(config, self._stopwords(config.preprocessing['stopwords']))
+        if signature != self.signature:
+            self.clear()
+            self.signature = signature
+
+    def prepare_name(self, raw_name: str, nlp: Language, names: Dict, config: Config) -> Dict:
+        r''' Same as `prepare_name`, but the names prepared from `raw_name` are taken from the cache if possible.
+        '''
+        self.check(config)
+        prepared = self.get_or_compute(raw_name, lambda _: prepare_name(raw_name, nlp, {}, config))
+        return add_prepared_names(names, prepared)
+
+
 def basic_clean(text: str) -> str:
     """ Remove almost everything from text
 
@@ -1,7 +1,9 @@
+from typing import Tuple
 from spacy.language import Language
-from spacy.tokens import Doc
+from spacy.tokens import Doc, Token
 from medcat.config import Config
 from medcat.pipeline.pipe_runner import PipeRunner
+from medcat.utils.lexeme_cache import LexemeCache, FrozenValues
 
 
 def tag_skip_and_punct(nlp: Language, name: str, config: Config) -> "_Tagger":
@@ -28,22 +30,39 @@ class _Tagger(PipeRunner):
     def __init__(self, nlp: Language, name: str, config: Config) -> None:
         self.name = name
         self.config = config
+        # Token text to (is_punct, to_skip)
+        self._flags = LexemeCache(self.config.preprocessing.get('lexeme_cache_size', 1000000))
+        self._stopwords = FrozenValues()
         super().__init__(self.config.general['workers'])
 
+    def _get_flags(self, token: Token) -> Tuple[bool, bool]:
+        cnf_p = self.config.preprocessing
+        if self.config.punct_checker.match(token.lower_) and token.text not in cnf_p['keep_punct']:
+            # There can't be punct in a token if it also has text
+            return True, True
+        elif self.config.word_skipper.match(token.lower_):
+            # Skip if specific strings
+            return False, True
+        elif cnf_p['skip_stopwords'] and (token.is_stop if cnf_p['stopwords'] is None else token.lower_ in cnf_p['stopwords']):
+            return False, True
+        return False, False
+
     # Override
     def __call__(self, doc: Doc) -> Doc:
         # Make life easier
         cnf_p = self.config.preprocessing
+        flags = self._flags
+        flags.check((self.config.punct_checker.pattern, self.config.word_skipper.pattern,
+                     tuple(sorted(cnf_p['keep_punct'])), cnf_p['skip_stopwords'], self._stopwords(cnf_p['stopwords'])))
 
         for token in doc:
-            if self.config.punct_checker.match(token.lower_) and token.text not in cnf_p['keep_punct']:
-                # There can't be punct in a token if it also has text
+            token_flags = flags.get(token.orth)
+            if token_flags is None:
+                token_flags = flags.add(token.orth, self._get_flags(token))
+            is_punct, to_skip = token_flags
+            if is_punct:
                 token._.is_punct = True
-                token._.to_skip = True
-            elif self.config.word_skipper.match(token.lower_):
-                # Skip if specific strings
-                token._.to_skip = True
-            elif cnf_p['skip_stopwords'] and token.is_stop:
+            if to_skip:
                 token._.to_skip = True
 
         return doc
@@ -0,0 +1,236 @@
+""" Sectioned on-disk format for the CDB.
+
+Instead of one dill pickle of the whole `CDB.__dict__` the CDB is saved into a directory, every
+group of related attributes (a section) is in a separate file and a `manifest.json` describes
+what is where. Sections are plain pickles (much faster than dill), the context vectors are
+saved as .npy matrices if they are in a `ContextVectorStore` and loading can be lazy - a
+section is read only once one of its attributes is accessed.
+
+Convert an existing `cdb.dat`:
+    python -m medcat.utils.cdb_sections <path to cdb.dat> <output directory>
+"""
+import os
+import sys
+import json
+import dill
+import pickle
+import logging
+from typing import Dict, List, Optional, Type, cast
+
+from medcat import __version__
+from medcat.config import Config
+from medcat.utils.context_vector_store import ContextVectorStore, MmapMode
+
+
+FORMAT_NAME = 'medcat-cdb-sections'
+FORMAT_VERSION = 1
+MANIFEST_NAME = 'manifest.json'
+CONFIG_NAME = 'config.dat'
+CONTEXT_VECTORS_DIR = 'context_vectors'
+
+# Section name to the CDB attributes in it, everything not listed here ends up in `other`
+SECTIONS: Dict[str, List[str]] = {
+    'names': ['name2cuis', 'name2cuis2status', 'snames', 'name2count_train', 'name_isupper', 'vocab'],
+    'cuis': ['cui2names', 'cui2snames', 'cui2count_train', 'cui2info', 'cui2tags', 'cui2type_ids',
+             'cui2preferred_name', 'cui2average_confidence'],
+    'context_vectors': ['cui2context_vectors'],
+    'addl_info': ['addl_info'],
+}
+# These can contain anything, so dill is used instead of pickle
+DILL_SECTIONS = {'addl_info', 'other'}
+
+log = logging.getLogger(__name__)
+
+
+def save(cdb, dir_path: str) -> None:
+    r''' Save a CDB into `dir_path` using the sectioned format.
+
+    Args:
+        cdb (`medcat.cdb.CDB`):
+            The CDB to be saved.
+        dir_path (`str`):
+            Output directory, will be created if it does not exist.
+    '''
+    os.makedirs(dir_path, exist_ok=True)
+    data = {k: v for k, v in cdb.__dict__.items() if k != 'config'}
+
+    sections: Dict[str, List[str]] = {name: [attr for attr in attrs if attr in data] for name, attrs in SECTIONS.items()}
+    known = set(attr for attrs in sections.values() for attr in attrs)
+    sections['other'] = [attr for attr in data if attr not in known]
+
+    manifest: Dict = {'format': FORMAT_NAME,
+                      'format_version': FORMAT_VERSION,
+                      'medcat_version': __version__,
+                      'config': CONFIG_NAME,
+                      'sections': {}}
+
+    with open(os.path.join(dir_path, CONFIG_NAME), 'wb') as f:
+        dill.dump(cdb.config.__dict__, f)
+
+    for name, attrs in sections.items():
+        store = data.get('cui2context_vectors') if name == 'context_vectors' else None
+        if isinstance(store, ContextVectorStore):
+            # Matrices go into .npy files so that they can be memory-mapped on load
+            store.save_matrices(os.path.join(dir_path, CONTEXT_VECTORS_DIR))
+            store.matrices_dir = CONTEXT_VECTORS_DIR
+        try:
+            file_name = name + ('.dat' if name in DILL_SECTIONS else '.pickle')
+            with open(os.path.join(dir_path, file_name), 'wb') as f:
+                section = {attr: data[attr] for attr in attrs}
+                if name in DILL_SECTIONS:
+                    dill.dump(section, f)
+                else:
+                    pickle.dump(section, f, protocol=pickle.HIGHEST_PROTOCOL)
+        finally:
+            if isinstance(store, ContextVectorStore):
+                store.matrices_dir = None
+        manifest['sections'][name] = {'file': file_name, 'attributes': attrs}
+
+    # Written last, a directory without a manifest is not a valid CDB
+    with open(os.path.join(dir_path, MANIFEST_NAME), 'w') as f:
+        json.dump(manifest, f, indent=2)
+
+
+def is_sectioned(path: str) -> bool:
+    return os.path.isdir(path) and os.path.exists(os.path.join(path, MANIFEST_NAME))
+
+
+def read_manifest(dir_path: str) -> Dict:
+    with open(os.path.join(dir_path, MANIFEST_NAME)) as f:
+        manifest = json.load(f)
+
+    if manifest.get('format') != FORMAT_NAME:
+        raise ValueError("The directory {} does not contain a sectioned CDB".format(dir_path))
+    if manifest.get('format_version', 0) > FORMAT_VERSION:
+        raise ValueError("The CDB in {} was saved with format version {}, this version of MedCAT supports up to {}".format(
+                         dir_path, manifest['format_version'], FORMAT_VERSION))
+
+    return manifest
+
+
+def load(cls: Type, dir_path: str, config_dict: Optional[Dict] = None, lazy: bool = True, mmap_mode: Optional[MmapMode] = 'c'):
+    r''' Load a CDB saved with `save`.
+
+    Args:
+        cls:
+            The CDB class.
+        dir_path (`str`):
+            Directory with the sectioned CDB.
+        config_dict (`Dict`, optional):
+            A dictionary that will be used to overwrite existing fields in the config of this CDB.
+        lazy (`bool`, defaults to `True`):
+            If True a section is loaded only when one of its attributes is accessed for the first time.
+        mmap_mode (`str`, optional, defaults to `c`):
+            Mode used to memory-map the context vectors (only for a `ContextVectorStore`).
+    '''
+    manifest = read_manifest(dir_path)
+
+    with open(os.path.join(dir_path, manifest['config']), 'rb') as f:
+        config_data = dill.load(f)
+    cls._check_medcat_version(config_data)
+    config = cast(Config, Config.from_dict(config_data))
+    cls._ensure_backward_compatibility(config)
+
+    cdb = cls(config=config)
+    if config_dict is not None:
+        cdb.config.merge_config(config_dict)
+
+    # Once everything is loaded the attributes are put back into this order, the CDB hash depends on it
+    order = list(cdb.__dict__.keys())
+    pending = {}
+    for name, section in manifest['sections'].items():
+        for attr in section['attributes']:
+            # Remove the defaults, so that __getattr__ is triggered for them
+            cdb.__dict__.pop(attr, None)
+        pending[name] = section
+    cdb.__dict__['_cdb_sections'] = {'dir_path': dir_path, 'mmap_mode': mmap_mode, 'pending': pending, 'order': order}
+
+    # Small and needed for almost anything
+    load_section(cdb, 'other')
+    if not lazy:
+        load_all(cdb)
+
+    return cdb
+
+
+def load_section(cdb, name: str) -> None:
+    r''' Load one section of a lazily loaded CDB, does nothing if the section is already loaded.
+    '''
+    info = cdb.__dict__.get('_cdb_sections')
+    if info is None or name not in info['pending']:
+        return
+
+    section = info['pending'][name]
+    log.debug("Loading CDB section %s from %s", name, info['dir_path'])
+    with open(os.path.join(info['dir_path'], section['file']), 'rb') as f:
+        data = dill.load(f) if name in DILL_SECTIONS else pickle.load(f)
+
+    store = data.get('cui2context_vectors')
+    if isinstance(store, ContextVectorStore) and store.matrices_dir is not None:
+        store.load_matrices(os.path.join(info['dir_path'], store.matrices_dir), mmap_mode=info['mmap_mode'])
+    for attr, value in data.items():
+        # Anything set while the section was pending is newer than what is on disk
+        if attr not in cdb.__dict__:
+            cdb.__dict__[attr] = value
+
+    del info['pending'][name]
+    if not info['pending']:
+        del cdb.__dict__['_cdb_sections']
+        attrs = dict(cdb.__dict__)
+        cdb.__dict__.clear()
+        cdb.__dict__.update({k: attrs.pop(k) for k in info['order'] if k in attrs})
+        cdb.__dict__.update(attrs)
+
+    if 'cui2context_vectors' in data and cdb.config.general.get('compact_context_vectors', False):
+        cdb.compact_context_vectors()
+
+
+def load_all(cdb) -> None:
+    r''' Load all sections that were not loaded yet.
+    '''
+    info = cdb.__dict__.get('_cdb_sections')
+    if info is not None:
+        for name in list(info['pending'].keys()):
+            load_section(cdb, name)
+
+
+def section_of(cdb, attr: str) -> Optional[str]:
+    r''' Name of the not yet loaded section that contains `attr`, or None.
+    '''
+    info = cdb.__dict__.get('_cdb_sections')
+    if info is not None:
+        for name, section in info['pending'].items():
+            if attr in section['attributes']:
+                return name
+    return None
+
+
+def discard(cdb, attr: str) -> None:
+    r''' Remove `attr` from its not yet loaded section, used when the attribute is set before it was loaded.
+    '''
+    name = section_of(cdb, attr)
+    if name is not None:
+        section = cdb.__dict__['_cdb_sections']['pending'][name]
+        section['attributes'] = [a for a in section['attributes'] if a != attr]
+
+
+def convert(cdb_path: str, dir_path: str) -> None:
+    r''' Convert a `cdb.dat` into the sectioned format.
+
+    Args:
+        cdb_path (`str`):
+            Path to the existing `cdb.dat`.
+        dir_path (`str`):
+            Output directory.
+    '''
+    from medcat.cdb import CDB
+    cdb = CDB.load(cdb_path)
+    save(cdb, dir_path)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3:
+        print("Usage: python -m medcat.utils.cdb_sections <path to cdb.dat> <output directory>")
+        sys.exit(1)
+    logging.basicConfig(level=logging.INFO)
+    convert(sys.argv[1], sys.argv[2])
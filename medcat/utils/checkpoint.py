@@ -1,13 +1,24 @@
 import os
 import logging
 import time
+import dill
+import xxhash
+import numpy as np
 from dataclasses import dataclass
-from typing import List, Tuple, Optional, TypeVar, Type
+from typing import Any, Dict, List, Tuple, Optional, TypeVar, Type, cast
 from medcat.cdb import CDB
+from medcat.utils import cdb_sections
 from medcat.utils.decorators import check_positive
+from medcat.utils.hasher import update_structure
 
 T = TypeVar("T", bound="Checkpoint")
 
+DELTA_SUFFIX = "-delta"
+# CDB fields that are keyed by CUI and by name, a delta has the values of changed keys only
+CUI_FIELDS = ('cui2names', 'cui2snames', 'cui2context_vectors', 'cui2count_train', 'cui2info', 'cui2tags',
+              'cui2type_ids', 'cui2preferred_name', 'cui2average_confidence')
+NAME_FIELDS = ('name2cuis', 'name2cuis2status', 'name_isupper', 'name2count_train')
+
 
 class Checkpoint(object):
     r""" The base class of checkpoint objects
@@ -21,18 +32,29 @@ class Checkpoint(object):
         max_to_keep (int):
             The maximum number of checkpoints to keep
             (N.B.: A large number could result in error "no space left on device")
+        full_every (int):
+            Every `full_every`-th checkpoint is a full CDB, the ones in between are deltas: only the
+            concepts and names that changed since the last full checkpoint (see `save`). The full checkpoint
+            a delta needs is always kept, also if that is more than `max_to_keep` checkpoints.
     """
     DEFAULT_STEP = 1000
     DEFAULT_MAX_TO_KEEP = 1
+    DEFAULT_FULL_EVERY = 1
     log = logging.getLogger(__package__)
 
     @check_positive
-    def __init__(self, dir_path: str, *, steps: int = DEFAULT_STEP, max_to_keep: int = DEFAULT_MAX_TO_KEEP) -> None:
+    def __init__(self, dir_path: str, *, steps: int = DEFAULT_STEP, max_to_keep: int = DEFAULT_MAX_TO_KEEP,
+                 full_every: int = DEFAULT_FULL_EVERY) -> None:
         self._dir_path = os.path.abspath(dir_path)
         self._steps = steps
         self._max_to_keep = max_to_keep
+        self._full_every = full_every
         self._file_paths: List[str] = []
         self._count = 0
+        # The latest full checkpoint, the fingerprints of the CDB saved in it and the number of deltas since
+        self._base_path: Optional[str] = None
+        self._snapshot: Optional[Dict] = None
+        self._n_deltas = 0
         os.makedirs(self._dir_path, exist_ok=True)
 
     @property
@@ -53,6 +75,15 @@ class Checkpoint(object):
         check_positive(lambda _: ...)(value)    # [https://github.com/python/mypy/issues/1362]
         self._max_to_keep = value
 
+    @property
+    def full_every(self) -> int:
+        return self._full_every
+
+    @full_every.setter
+    def full_every(self, value: int) -> None:
+        check_positive(lambda _: ...)(value)    # [https://github.com/python/mypy/issues/1362]
+        self._full_every = value
+
     @property
     def count(self) -> int:
         return self._count
@@ -88,7 +119,9 @@ class Checkpoint(object):
 
     def save(self, cdb: CDB, count: int) -> None:
         r'''
-        Save the CDB as the latest checkpoint.
+        Save the CDB as the latest checkpoint. If `full_every` > 1 and this is not a full checkpoint, only
+        the concepts (context vectors, counts, names...) and names (CUIs, status...) that changed since the
+        last full checkpoint are saved.
 
         Args:
             cdb (medcat.CDB):
@@ -96,18 +129,39 @@ class Checkpoint(object):
             count (count):
                 The number of the finished steps
         '''
+        is_full = self._full_every == 1 or self._snapshot is None or self._n_deltas + 1 >= self._full_every
         ckpt_file_path = os.path.join(os.path.abspath(self._dir_path), "checkpoint-%s-%s" % (self.steps, count))
-        while len(self._file_paths) >= self._max_to_keep:
-            to_remove = self._file_paths.pop(0)
-            os.remove(to_remove)
-        cdb.save(ckpt_file_path)
+        if not is_full:
+            ckpt_file_path += DELTA_SUFFIX
+        self._remove_old(keep=None if is_full else self._base_path)
+
+        if is_full:
+            cdb.save(ckpt_file_path)
+            self._base_path = ckpt_file_path
+            self._n_deltas = 0
+            if self._full_every > 1:
+                self._snapshot = _take_snapshot(cdb)
+        else:
+            delta = _make_delta(cdb, cast(Dict, self._snapshot))
+            with open(ckpt_file_path, 'wb') as f:
+                dill.dump({'base': os.path.basename(cast(str, self._base_path)), 'delta': delta}, f)
+            self._n_deltas += 1
         self.log.debug("Checkpoint saved: %s", ckpt_file_path)
         self._file_paths.append(ckpt_file_path)
         self._count = count
 
+    def _remove_old(self, keep: Optional[str]) -> None:
+        while len(self._file_paths) >= self._max_to_keep:
+            removable = [file_path for file_path in self._file_paths if file_path != keep]
+            if not removable:
+                break
+            self._file_paths.remove(removable[0])
+            os.remove(removable[0])
+
     def restore_latest_cdb(self) -> CDB:
         r'''
-        Restore the CDB from the latest checkpoint.
+        Restore the CDB from the latest checkpoint, for a delta the full checkpoint it is based on is loaded
+        and the delta applied.
 
         Returns:
             cdb (medcat.CDB):
@@ -122,7 +176,21 @@ class Checkpoint(object):
         _, count = self._get_steps_and_count(latest_ckpt)
         self._file_paths = ckpt_file_paths
         self._count = count
-        return CDB.load(self._file_paths[-1])
+        # The next checkpoint will be a full one
+        self._snapshot = None
+
+        if not latest_ckpt.endswith(DELTA_SUFFIX):
+            self._base_path = latest_ckpt
+            return CDB.load(latest_ckpt)
+
+        with open(latest_ckpt, 'rb') as f:
+            data = dill.load(f)
+        self._base_path = os.path.join(self._dir_path, data['base'])
+        if not os.path.isfile(self._base_path):
+            raise Exception("The full checkpoint {} needed for {} was not found.".format(data['base'], latest_ckpt))
+        cdb = CDB.load(self._base_path)
+        _apply_delta(cdb, data['delta'])
+        return cdb
 
     @staticmethod
     def _get_ckpt_file_paths(dir_path: str) -> List[str]:
@@ -143,6 +211,7 @@ class CheckpointConfig(object):
     output_dir: str = "checkpoints"
     steps: int = Checkpoint.DEFAULT_STEP
     max_to_keep: int = Checkpoint.DEFAULT_MAX_TO_KEEP
+    full_every: int = Checkpoint.DEFAULT_FULL_EVERY
 
 
 class CheckpointManager(object):
@@ -173,7 +242,8 @@ class CheckpointManager(object):
         dir_path = dir_path or os.path.join(os.path.abspath(os.getcwd()), self.checkpoint_config.output_dir, self.name, str(int(time.time())))
         return Checkpoint(dir_path,
                           steps=self.checkpoint_config.steps,
-                          max_to_keep=self.checkpoint_config.max_to_keep)
+                          max_to_keep=self.checkpoint_config.max_to_keep,
+                          full_every=self.checkpoint_config.full_every)
 
     def get_latest_checkpoint(self, base_dir_path: Optional[str] = None) -> "Checkpoint":
         r'''
@@ -191,6 +261,7 @@ class CheckpointManager(object):
         checkpoint = Checkpoint.from_latest(dir_path=ckpt_dir_path)
         checkpoint.steps = self.checkpoint_config.steps
         checkpoint.max_to_keep = self.checkpoint_config.max_to_keep
+        checkpoint.full_every = self.checkpoint_config.full_every
         return checkpoint
 
     @classmethod
@@ -212,3 +283,98 @@ class CheckpointManager(object):
         ckpt_dir_paths.sort()
         ckpt_dir_path = os.path.abspath(os.path.join(base_dir_path, ckpt_dir_paths[-1]))
         return ckpt_dir_path
+
+
+def _key_fingerprints(cdb: CDB, fields: Tuple[str, ...]) -> Dict[Any, int]:
+    # For every key the hash of its values in all the fields
+    maps = [cdb.__dict__.get(field) or {} for field in fields]
+    keys: set = set()
+    for m in maps:
+        keys.update(m.keys())
+
+    fingerprints = {}
+    for key in keys:
+        hasher = xxhash.xxh64()
+        for m in maps:
+            if key in m:
+                hasher.update(b'1')
+                update_structure(hasher, m[key])
+            else:
+                hasher.update(b'0')
+        fingerprints[key] = hasher.intdigest()
+    return fingerprints
+
+
+def _is_other_field(field: str) -> bool:
+    # Private attributes (e.g. `_cdb_sections`, `_cui2updates`) are bookkeeping of the running CDB, not model data
+    return (field not in CUI_FIELDS and field not in NAME_FIELDS and field not in ('config', 'snames')
+            and not field.startswith('_'))
+
+
+def _other_fields(cdb: CDB) -> List[str]:
+    return [k for k in cdb.__dict__ if _is_other_field(k)]
+
+
+def _take_snapshot(cdb: CDB) -> Dict:
+    cdb_sections.load_all(cdb)
+    other = {}
+    for field in _other_fields(cdb):
+        hasher = xxhash.xxh64()
+        update_structure(hasher, cdb.__dict__[field])
+        other[field] = hasher.intdigest()
+    return {'cuis': _key_fingerprints(cdb, CUI_FIELDS),
+            'names': _key_fingerprints(cdb, NAME_FIELDS),
+            'snames': set(cdb.snames),
+            'other': other}
+
+
+def _changed_values(cdb: CDB, fields: Tuple[str, ...], fingerprints: Dict, old_fingerprints: Dict) -> Dict:
+    changed = {}
+    for key, fingerprint in fingerprints.items():
+        if old_fingerprints.get(key) != fingerprint:
+            values = {}
+            for field in fields:
+                m = cdb.__dict__.get(field) or {}
+                if key in m:
+                    value = m[key]
+                    if field == 'cui2context_vectors':
+                        # Copies, with a compact store these are views
+                        value = {context_type: np.array(vector) for context_type, vector in value.items()}
+                    values[field] = value
+            changed[key] = values
+    return changed
+
+
+def _make_delta(cdb: CDB, snapshot: Dict) -> Dict:
+    current = _take_snapshot(cdb)
+    return {'cuis': _changed_values(cdb, CUI_FIELDS, current['cuis'], snapshot['cuis']),
+            'removed_cuis': [cui for cui in snapshot['cuis'] if cui not in current['cuis']],
+            'names': _changed_values(cdb, NAME_FIELDS, current['names'], snapshot['names']),
+            'removed_names': [name for name in snapshot['names'] if name not in current['names']],
+            'snames_added': current['snames'] - snapshot['snames'],
+            'snames_removed': snapshot['snames'] - current['snames'],
+            'other': {field: cdb.__dict__[field] for field, fingerprint in current['other'].items()
+                      if snapshot['other'].get(field) != fingerprint}}
+
+
+def _apply_changes(cdb: CDB, fields: Tuple[str, ...], changed: Dict, removed: List) -> None:
+    for field in fields:
+        m = cdb.__dict__.get(field)
+        if m is None:
+            continue
+        for key in removed:
+            m.pop(key, None)
+        for key, values in changed.items():
+            if field in values:
+                m[key] = values[field]
+            else:
+                m.pop(key, None)
+
+
+def _apply_delta(cdb: CDB, delta: Dict) -> None:
+    cdb_sections.load_all(cdb)
+    _apply_changes(cdb, CUI_FIELDS, delta['cuis'], delta['removed_cuis'])
+    _apply_changes(cdb, NAME_FIELDS, delta['names'], delta['removed_names'])
+    cdb.snames.update(delta['snames_added'])
+    cdb.snames.difference_update(delta['snames_removed'])
+    cdb.__dict__.update({field: value for field, value in delta['other'].items() if _is_other_field(field)})
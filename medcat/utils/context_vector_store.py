@@ -0,0 +1,274 @@
+import os
+import logging
+import numpy as np
+from collections.abc import MutableMapping
+from typing import Dict, List, Literal, Optional, Iterator, Mapping
+
+
+# Modes `np.load` accepts for memory-mapping
+MmapMode = Literal['r+', 'r', 'w+', 'c']
+
+
+class ContextVectorStore(MutableMapping):
+    r''' Compact storage for the `cdb.cui2context_vectors` map. Instead of a dict of dicts with one
+    array per (cui, context_type), every context type has one contiguous matrix where each CUI
+    has a row. The norm of each row is cached and kept up to date on every assignment, so that unit
+    vectors for similarity calculations are a row lookup and a division.
+
+    Access is the same as for the old dict - `store[cui][context_type]` returns the vector (a read-only
+    view on the matrix row), and `store[cui][context_type] = vector` replaces it.
+
+    Args:
+        cui2context_vectors (`Mapping[str, Mapping[str, np.ndarray]]`, optional):
+            Initial content, usually an existing `cdb.cui2context_vectors`.
+        dtype (defaults to `np.float32`):
+            Data type of the stored vectors.
+    '''
+    log = logging.getLogger(__name__)
+
+    def __init__(self, cui2context_vectors: Optional[Mapping] = None, dtype=np.float32) -> None:
+        self.dtype = np.dtype(dtype)
+        # Row to CUI and back
+        self._cuis: List[str] = []
+        self._cui2row: Dict[str, int] = {}
+        # For every context type: the vectors, the norm of each row and is the row set for this context type
+        self._matrices: Dict[str, np.ndarray] = {}
+        self._norms: Dict[str, np.ndarray] = {}
+        self._masks: Dict[str, np.ndarray] = {}
+        self._capacity = 0
+        # If set the matrices are not pickled, they are in .npy files in a directory with this name (see `save_matrices`)
+        self.matrices_dir: Optional[str] = None
+
+        if cui2context_vectors is not None:
+            for cui, vectors in cui2context_vectors.items():
+                self[cui] = vectors
+
+    def __getitem__(self, cui: str) -> "CUIContextVectors":
+        if cui not in self._cui2row:
+            raise KeyError(cui)
+        return CUIContextVectors(self, cui)
+
+    def __setitem__(self, cui: str, vectors: Mapping) -> None:
+        if isinstance(vectors, CUIContextVectors):
+            # Views point into the matrices, copy before anything is overwritten
+            vectors = {context_type: np.array(vector) for context_type, vector in vectors.items()}
+
+        row = self._cui2row.get(cui)
+        if row is None:
+            row = self._add_row(cui)
+        else:
+            for context_type in self._masks:
+                self._unset(row, context_type)
+
+        for context_type, vector in vectors.items():
+            self.set_vector(cui, context_type, vector)
+
+    def __delitem__(self, cui: str) -> None:
+        row = self._cui2row.pop(cui)
+        last = len(self._cuis) - 1
+        last_cui = self._cuis.pop()
+
+        # Move the last row into the free one so that the rows stay contiguous
+        if row != last:
+            self._cuis[row] = last_cui
+            self._cui2row[last_cui] = row
+            for context_type, matrix in self._matrices.items():
+                matrix[row] = matrix[last]
+                self._norms[context_type][row] = self._norms[context_type][last]
+                self._masks[context_type][row] = self._masks[context_type][last]
+        for context_type in self._masks:
+            self._unset(last, context_type)
+
+    def __contains__(self, cui: object) -> bool:
+        return cui in self._cui2row
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(list(self._cuis))
+
+    def __len__(self) -> int:
+        return len(self._cuis)
+
+    def __repr__(self) -> str:
+        return "ContextVectorStore(cuis={}, context_types={})".format(len(self), list(self._matrices.keys()))
+
+    @property
+    def context_types(self) -> List[str]:
+        return list(self._matrices.keys())
+
+    def has_vector(self, cui: str, context_type: str) -> bool:
+        row = self._cui2row.get(cui)
+        return row is not None and context_type in self._masks and bool(self._masks[context_type][row])
+
+    def get_vector(self, cui: str, context_type: str) -> np.ndarray:
+        r''' Read-only view on the vector of this cui and context_type, raises KeyError if it does not exist.
+        '''
+        if not self.has_vector(cui, context_type):
+            raise KeyError(context_type)
+        vector = self._matrices[context_type][self._cui2row[cui]]
+        vector.flags.writeable = False
+
+        return vector
+
+    def set_vector(self, cui: str, context_type: str, vector: np.ndarray) -> None:
+        r''' Set the vector of this cui and context_type, the cui is added if it does not exist.
+        '''
+        row = self._cui2row.get(cui)
+        if row is None:
+            row = self._add_row(cui)
+
+        vector = np.asarray(vector, dtype=self.dtype)
+        if context_type not in self._matrices:
+            self._matrices[context_type] = np.zeros((self._capacity, len(vector)), dtype=self.dtype)
+            self._norms[context_type] = np.zeros(self._capacity, dtype=self.dtype)
+            self._masks[context_type] = np.zeros(self._capacity, dtype=bool)
+
+        self._matrices[context_type][row] = vector
+        self._norms[context_type][row] = np.linalg.norm(self._matrices[context_type][row])
+        self._masks[context_type][row] = True
+
+    def del_vector(self, cui: str, context_type: str) -> None:
+        if not self.has_vector(cui, context_type):
+            raise KeyError(context_type)
+        self._unset(self._cui2row[cui], context_type)
+
+    def get_norm(self, cui: str, context_type: str) -> float:
+        if not self.has_vector(cui, context_type):
+            raise KeyError(context_type)
+        return float(self._norms[context_type][self._cui2row[cui]])
+
+    def unit_vector(self, cui: str, context_type: str) -> np.ndarray:
+        r''' Same as `unitvec(store[cui][context_type])` but using the cached norm, zero vectors are returned as they are.
+        '''
+        vector = self.get_vector(cui, context_type)
+        norm = self._norms[context_type][self._cui2row[cui]]
+
+        return vector / norm if norm > 0 else vector
+
+    def unit_matrix(self, cuis: List[str], context_type: str) -> np.ndarray:
+        r''' Unit vectors for all the provided cuis stacked into a matrix of shape (len(cuis), dim). All cuis must have
+        a vector for this context type.
+        '''
+        rows = [self._cui2row[cui] for cui in cuis]
+        if not self._masks[context_type][rows].all():
+            raise KeyError(context_type)
+        norms = self._norms[context_type][rows]
+        norms = np.where(norms > 0, norms, 1)
+
+        return self._matrices[context_type][rows] / norms[:, np.newaxis]
+
+    def to_dict(self) -> Dict:
+        r''' Convert back into the dict of dicts format (vectors are copied).
+        '''
+        return {cui: {context_type: np.array(vector) for context_type, vector in self[cui].items()} for cui in self._cuis}
+
+    def save_matrices(self, dir_path: str) -> None:
+        r''' Save the matrix of each context type into a separate `<context_type>.npy` file in `dir_path`.
+        If the store is pickled while `matrices_dir` is set the matrices are left out, and `load_matrices`
+        has to be called after unpickling.
+
+        Args:
+            dir_path (`str`):
+                Directory where the matrices will be saved.
+        '''
+        os.makedirs(dir_path, exist_ok=True)
+        n = len(self._cuis)
+        for context_type, matrix in self._matrices.items():
+            np.save(os.path.join(dir_path, context_type + ".npy"), matrix[:n])
+
+    def load_matrices(self, dir_path: str, mmap_mode: Optional[MmapMode] = 'c') -> None:
+        r''' Load the matrices saved with `save_matrices`. With `mmap_mode` set the matrices are memory-mapped,
+        so processes that load the same files share the physical pages. The default mode `c` is copy-on-write,
+        updates stay in memory and never change the files.
+
+        Args:
+            dir_path (`str`):
+                Directory with the `.npy` files.
+            mmap_mode (`str`, optional, defaults to `c`):
+                Passed to `numpy.load`, use None to read everything into memory.
+        '''
+        for context_type in self._norms:
+            # asarray keeps the mapping, but row access returns plain ndarrays instead of np.memmap
+            self._matrices[context_type] = np.asarray(np.load(os.path.join(dir_path, context_type + ".npy"), mmap_mode=mmap_mode))
+        self.matrices_dir = None
+
+    def _add_row(self, cui: str) -> int:
+        row = len(self._cuis)
+        if row >= self._capacity:
+            self._grow(max(64, self._capacity * 2))
+        self._cuis.append(cui)
+        self._cui2row[cui] = row
+
+        return row
+
+    def _grow(self, capacity: int) -> None:
+        for context_type, matrix in self._matrices.items():
+            new_matrix = np.zeros((capacity, matrix.shape[1]), dtype=self.dtype)
+            new_matrix[:len(matrix)] = matrix
+            self._matrices[context_type] = new_matrix
+
+            new_norms = np.zeros(capacity, dtype=self.dtype)
+            new_norms[:len(matrix)] = self._norms[context_type]
+            self._norms[context_type] = new_norms
+
+            new_mask = np.zeros(capacity, dtype=bool)
+            new_mask[:len(matrix)] = self._masks[context_type]
+            self._masks[context_type] = new_mask
+        self._capacity = capacity
+
+    def _unset(self, row: int, context_type: str) -> None:
+        self._matrices[context_type][row] = 0
+        self._norms[context_type][row] = 0
+        self._masks[context_type][row] = False
+
+    def __getstate__(self) -> Dict:
+        # Only the used rows are saved and each array as raw bytes, this is compact and does not depend
+        #on numpy object identities (the CDB hash is calculated from the pickled data).
+        n = len(self._cuis)
+        return {'dtype': self.dtype.str,
+                'cuis': self._cuis,
+                'matrices_dir': self.matrices_dir,
+                'dims': {ct: m.shape[1] for ct, m in self._matrices.items()},
+                'matrices': {ct: m[:n].tobytes() for ct, m in self._matrices.items()} if self.matrices_dir is None else {},
+                'norms': {ct: m[:n].tobytes() for ct, m in self._norms.items()},
+                'masks': {ct: m[:n].tobytes() for ct, m in self._masks.items()}}
+
+    def __setstate__(self, state: Dict) -> None:
+        self.dtype = np.dtype(state['dtype'])
+        self._cuis = list(state['cuis'])
+        self._cui2row = {cui: row for row, cui in enumerate(self._cuis)}
+        n = len(self._cuis)
+        self._matrices = {ct: np.frombuffer(b, dtype=self.dtype).reshape(n, state['dims'][ct]).copy() for ct, b in state['matrices'].items()}
+        self._norms = {ct: np.frombuffer(b, dtype=self.dtype).copy() for ct, b in state['norms'].items()}
+        self._masks = {ct: np.frombuffer(b, dtype=bool).copy() for ct, b in state['masks'].items()}
+        self._capacity = n
+        self.matrices_dir = state.get('matrices_dir')
+
+
+class CUIContextVectors(MutableMapping):
+    r''' Dict-like view on the context vectors of one CUI in a `ContextVectorStore`.
+    '''
+
+    def __init__(self, store: ContextVectorStore, cui: str) -> None:
+        self.store = store
+        self.cui = cui
+
+    def __getitem__(self, context_type: str) -> np.ndarray:
+        return self.store.get_vector(self.cui, context_type)
+
+    def __setitem__(self, context_type: str, vector: np.ndarray) -> None:
+        self.store.set_vector(self.cui, context_type, vector)
+
+    def __delitem__(self, context_type: str) -> None:
+        self.store.del_vector(self.cui, context_type)
+
+    def __contains__(self, context_type: object) -> bool:
+        return isinstance(context_type, str) and self.store.has_vector(self.cui, context_type)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter([context_type for context_type in self.store.context_types if self.store.has_vector(self.cui, context_type)])
+
+    def __len__(self) -> int:
+        return len(list(iter(self)))
+
+    def __repr__(self) -> str:
+        return repr(dict(self.items()))
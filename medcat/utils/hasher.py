@@ -1,5 +1,7 @@
 import xxhash
 import dill
+import numpy as np
+from collections.abc import Mapping
 from io import BytesIO as StringIO
 
 
@@ -12,6 +14,54 @@ def dumps(obj, length=False):
         return file.getvalue()
 
 
+def _len(n: int) -> bytes:
+    return n.to_bytes(8, 'little')
+
+
+def update_structure(m, obj) -> None:
+    r''' Feed a value into the xxhash state `m` without serializing it first. Containers are walked, strings and
+    numbers are hashed as they are and numpy arrays from their buffers. The result does not depend on the order
+    of items in sets, but does on the order of items in dicts and lists. Other objects are hashed via dill.
+    '''
+    if isinstance(obj, str):
+        b = obj.encode('utf-8', 'surrogatepass')
+        m.update(b's' + _len(len(b)))
+        m.update(b)
+    elif obj is None or isinstance(obj, (bool, int, float)):
+        r = repr(obj).encode()
+        m.update(type(obj).__name__.encode() + _len(len(r)) + r)
+    elif isinstance(obj, (np.ndarray, np.generic)) and np.asarray(obj).dtype != object:
+        a = np.ascontiguousarray(obj)
+        m.update(b'a' + a.dtype.str.encode() + repr(a.shape).encode())
+        m.update(a.data if a.size > 0 else b'')
+    elif isinstance(obj, (dict, Mapping)):
+        m.update(b'd' + _len(len(obj)))
+        for k, v in obj.items():
+            update_structure(m, k)
+            update_structure(m, v)
+    elif isinstance(obj, (list, tuple, np.ndarray)):
+        m.update((b't' if isinstance(obj, tuple) else b'l') + _len(len(obj)))
+        for v in obj:
+            update_structure(m, v)
+    elif isinstance(obj, (set, frozenset)):
+        # Iteration order of a set changes between processes, the sum of the item hashes does not
+        total = 0
+        for v in obj:
+            if isinstance(v, str):
+                total += xxhash.xxh64_intdigest(v.encode('utf-8', 'surrogatepass'))
+            else:
+                item = xxhash.xxh64()
+                update_structure(item, v)
+                total += item.intdigest()
+        m.update(b'S' + _len(len(obj)) + _len(total % 2**64))
+    elif isinstance(obj, bytes):
+        m.update(b'b' + _len(len(obj)))
+        m.update(obj)
+    else:
+        m.update(b'o' + type(obj).__name__.encode())
+        m.update(dumps(obj))
+
+
 class Hasher(object):
     def __init__(self):
         self.m = xxhash.xxh64()
@@ -19,6 +69,9 @@ class Hasher(object):
     def update(self, obj, length=False):
         self.m.update(dumps(obj, length=length))
 
+    def update_structure(self, obj):
+        update_structure(self.m, obj)
+
     def update_bytes(self, b):
         self.m.update(b)
 
@@ -0,0 +1,56 @@
+from typing import Any, Collection, FrozenSet, Hashable, Optional
+
+
+class LexemeCache(dict):
+    r''' Results computed from the lexical attributes of a token (text, tag, lemma), keyed on the spacy hash
+    ids of those attributes. Corpora have few distinct words compared to the number of tokens, so most tokens
+    cost a dict lookup instead of regex matching and string operations.
+
+    The results usually depend on the config, so the cache is emptied when the `signature` passed to `check`
+    changes. It is also emptied once it has `maxsize` entries.
+
+    Args:
+        maxsize (`int`, defaults to 1000000):
+            Maximum number of entries, 0 disables the cache.
+    '''
+
+    def __init__(self, maxsize: int = 1000000) -> None:
+        super().__init__()
+        self.maxsize = maxsize
+        self.signature: Any = None
+
+    def check(self, signature: Hashable) -> None:
+        r''' Empty the cache if the `signature` is not the same as the one from the previous call.
+        '''
+        if signature != self.signature:
+            self.clear()
+            self.signature = signature
+
+    def add(self, key: Hashable, value: Any) -> Any:
+        if len(self) >= self.maxsize:
+            self.clear()
+        if self.maxsize > 0:
+            self[key] = value
+        return value
+
+
+class FrozenValues(object):
+    r''' Hashable copy of a collection from the config (e.g. the stopwords) for cache signatures. The copy is only
+    made again if the collection was replaced or its size changed, so checking a signature for every document or
+    name does not cost a pass over the whole collection. The same object is returned while nothing changed, which
+    also makes comparing signatures cheap.
+    '''
+
+    def __init__(self) -> None:
+        self._values: Optional[Collection] = None
+        self._size = 0
+        self._frozen: Optional[FrozenSet] = None
+
+    def __call__(self, values: Optional[Collection]) -> Optional[FrozenSet]:
+        if values is None:
+            return None
+        if values is not self._values or len(values) != self._size:
+            self._values = values
+            self._size = len(values)
+            self._frozen = frozenset(values)
+        return self._frozen
@@ -0,0 +1,71 @@
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+
+_MISSING = object()
+
+
+class LRUCache(object):
+    r''' Size bounded mapping that drops the least recently used entry once `maxsize` is reached. It
+    counts hits and misses, None is a valid value (use `contains` or `get` with a default to tell them apart).
+
+    Args:
+        maxsize (`int`, optional, defaults to 100000):
+            Maximum number of entries, 0 disables the cache (nothing is stored) and None means no limit.
+    '''
+
+    def __init__(self, maxsize: Optional[int] = 100000) -> None:
+        self.maxsize = maxsize
+        self._data: OrderedDict = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        value = self._data.get(key, _MISSING)
+        if value is _MISSING:
+            self.misses += 1
+            return default
+        self.hits += 1
+        self._data.move_to_end(key)
+        return value
+
+    def put(self, key: Hashable, value: Any) -> None:
+        if self.maxsize == 0:
+            return
+        self._data[key] = value
+        self._data.move_to_end(key)
+        if self.maxsize is not None and len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def get_or_compute(self, key: Hashable, compute: Callable[[Hashable], Any]) -> Any:
+        r''' The cached value for `key`, or if there is none `compute(key)` which is then cached.
+        '''
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            value = compute(key)
+            self.put(key, value)
+        return value
+
+    def contains(self, key: Hashable) -> bool:
+        r''' Same as `key in cache`, neither changes the counters nor the order.
+        '''
+        return key in self._data
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.contains(key)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def clear(self) -> None:
+        self._data.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def info(self) -> Dict:
+        total = self.hits + self.misses
+        return {'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / total if total else 0.0,
+                'size': len(self._data),
+                'maxsize': self.maxsize}
@@ -1,9 +1,18 @@
 import re
 import spacy
+from collections import Counter
+from typing import Iterable, List, Optional, Tuple
+from spacy.language import Language
+from spacy.tokens import Doc, Token
 from medcat.pipeline.pipe_runner import PipeRunner
+from medcat.utils.symspell import DeleteIndex
+from medcat.utils.lru_cache import LRUCache
+from medcat.utils.lexeme_cache import LexemeCache
 
 
 CONTAINS_NUMBER = re.compile('[0-9]+')
+LETTERS = 'abcdefghijklmnopqrstuvwxyz'
+DIACRITICS = 'àáâãäåæçèéêëìíîïðñòóôõöøùúûüýþÿ'
 
 
 class BasicSpellChecker(object):
@@ -53,12 +62,13 @@ class BasicSpellChecker(object):
         "The subset of `words` that appear in the dictionary of WORDS."
         return set(w for w in words if w in self.vocab)
 
+    def letters(self):
+        "Characters that can be inserted or used as a replacement."
+        return LETTERS + DIACRITICS if self.config.general['diacritics'] else LETTERS
+
     def edits1(self, word):
         "All edits that are one edit away from `word`."
-        letters    = 'abcdefghijklmnopqrstuvwxyz'
-
-        if self.config.general['diacritics']:
-            letters += 'àáâãäåæçèéêëìíîïðñòóôõöøùúûüýþÿ'
+        letters    = self.letters()
 
         splits     = [(word[:i], word[i:])    for i in range(len(word) + 1)]
         deletes    = [L + R[1:]               for L, R in splits if R]
@@ -77,47 +87,198 @@ class BasicSpellChecker(object):
         pass
 
 
+class SymSpellChecker(BasicSpellChecker):
+    r''' Same as the BasicSpellChecker, but instead of generating all edits of a word the candidates are
+    looked up in a `medcat.utils.symspell.DeleteIndex` of the CDB vocab. Corrections are the same: the
+    closest words first (edit distance 1, or 2 if `spell_check_deep`) and from those the most frequent one.
+
+    The index is built on first use and rebuilt if the CDB vocab changes, it can be saved with the model pack.
+
+    Args:
+        cdb_vocab
+        config
+        data_vocab
+        index (`medcat.utils.symspell.DeleteIndex`, optional):
+            A prebuilt index for `cdb_vocab`.
+    '''
+    def __init__(self, cdb_vocab, config, data_vocab=None, index: Optional[DeleteIndex] = None):
+        super().__init__(cdb_vocab=cdb_vocab, config=config, data_vocab=data_vocab)
+        self.index = index
+
+    def get_index(self) -> DeleteIndex:
+        max_distance = 2 if self.config.general['spell_check_deep'] else 1
+        if self.index is None or not self.index.is_compiled_for(self.vocab, max_distance):
+            self.index = DeleteIndex(self.vocab.keys(), max_distance=max_distance)
+        return self.index
+
+    def fix(self, word):
+        "Most probable spelling correction for word, ties are broken alphabetically."
+        fix = max(sorted(self.candidates(word)), key=self.P)
+        if fix != word:
+            return fix
+        else:
+            return None
+
+    def candidates(self, word):
+        "Possible spelling corrections for word, only the ones with the lowest edit distance."
+        if word in self.vocab:
+            return {word}
+        max_distance = 2 if self.config.general['spell_check_deep'] else 1
+        found = self.get_index().lookup(word, max_distance=max_distance, letters=self.letters())
+        if found:
+            min_distance = min(distance for _, distance in found)
+            return set(candidate for candidate, distance in found if distance == min_distance)
+        return [word]
+
+
 class TokenNormalizer(PipeRunner):
     r''' Will normalize all tokens in a spacy document.
 
+    Spelling fixes are cached: the lowercased token is mapped to its final norm (the lemma of the fix),
+    or None if there is nothing to fix, so each distinct misspelling is corrected and lemmatized only once.
+    The cache is emptied when words are added to the CDB vocab or a setting used for the fixes changes.
+
     Args:
         config
         spell_checker
+        cache (`medcat.utils.lru_cache.LRUCache`, optional):
+            Cache for the spelling fixes, can be shared between normalizers using the same spell checker. If not
+            set a new one with `config.general['spell_check_cache_size']` entries is used.
+        nlp (`spacy.language.Language`, optional):
+            The spacy pipeline used to lemmatize spelling fixes, usually the one this normalizer is part of. If
+            not set `config.general['spacy_model']` is loaded.
+        components (`List[str]`, optional):
+            Names of the components from `nlp` that are run on a fix (the ones needed for the lemma), defaults to
+            all components `nlp` has at this point.
     '''
 
     # Custom pipeline component name
     name = 'token_normalizer'
 
     # Override
-    def __init__(self, config, spell_checker=None):
+    def __init__(self, config, spell_checker=None, cache: Optional[LRUCache] = None, nlp: Optional[Language] = None,
+                 components: Optional[List[str]] = None):
         self.config = config
         self.spell_checker = spell_checker
-        self.nlp = spacy.load(config.general['spacy_model'], disable=config.general['spacy_disabled_components'])
+        self.cache = cache if cache is not None else LRUCache(config.general.get('spell_check_cache_size', 100000))
+        if nlp is None:
+            nlp = spacy.load(config.general['spacy_model'], disable=config.general['spacy_disabled_components'])
+        self.nlp = nlp
+        self.components = list(components) if components is not None else list(nlp.pipe_names)
+        # The cache is shared with the other normalizers, what is in it was fixed with the current settings
+        self._cache_signature = self._get_cache_signature()
+        # (text, tag, lemma) to the output of _get_norm
+        self._norms = LexemeCache(config.preprocessing.get('lexeme_cache_size', 1000000))
         super().__init__(self.config.general['workers'])
 
+    def _get_cache_signature(self) -> Optional[Tuple]:
+        if self.spell_checker is None:
+            return None
+        # Words are only ever added to the CDB vocab, so the size is enough to detect a change
+        return (len(self.spell_checker.vocab), self.config.preprocessing['min_len_normalize'],
+                self.config.general['spell_check_deep'], self.config.general['diacritics'])
+
+    def _check_cache(self) -> None:
+        r''' Empty the spelling fix cache if the CDB vocab grew or a setting used for the fixes changed.
+        '''
+        signature = self._get_cache_signature()
+        if signature != self._cache_signature:
+            self.cache.clear()
+            self._cache_signature = signature
+
+    def _lemmatize(self, word: str) -> Token:
+        # A one token doc through the spacy components only, running the whole pipeline would also
+        #run this normalizer and everything after it.
+        doc = Doc(self.nlp.vocab, words=[word])
+        for name in self.components:
+            doc = self.nlp.get_pipe(name)(doc)
+        return doc[0]
+
+    def _needs_spell_check(self, lower: str, is_punct: bool) -> bool:
+        return len(lower) >= self.config.general['spell_check_len_limit'] and not is_punct \
+                and lower not in self.spell_checker and not CONTAINS_NUMBER.search(lower)
+
+    def _fixed_norm(self, lower: str) -> Optional[str]:
+        r''' Norm of the spelling fix for `lower`, None if there is no fix.
+        '''
+        fix = self.spell_checker.fix(lower)
+        if fix is None:
+            return None
+        tmp = self._lemmatize(fix)
+        if len(lower) < self.config.preprocessing['min_len_normalize']:
+            return tmp.lower_
+        else:
+            return tmp.lemma_.lower()
+
+    def prewarm(self, words: Iterable[str]) -> int:
+        r''' Fill the spelling fix cache from a corpus, the most frequent words that would be spell
+        checked are fixed first, until the cache is full.
+
+        Args:
+            words (`Iterable[str]`):
+                Tokens of the corpus, e.g. `token.text` for all tokens of the tokenized documents.
+
+        Returns:
+            The number of words added to the cache.
+        '''
+        self._check_cache()
+        counts = Counter(word.lower() for word in words)
+        added = 0
+        for lower, _ in counts.most_common():
+            if self.cache.maxsize is not None and len(self.cache) >= self.cache.maxsize:
+                break
+            if lower in self.cache:
+                continue
+            is_punct = bool(self.config.punct_checker.match(lower))
+            if self._needs_spell_check(lower, is_punct):
+                self.cache.put(lower, self._fixed_norm(lower))
+                added += 1
+        return added
+
+    def _get_norm(self, token: Token) -> Tuple[str, bool, Optional[str]]:
+        r''' The norm of a token, is it a pronoun and the lowercased text if it is a candidate for spell checking
+        (long enough and without numbers), else None.
+        '''
+        if len(token.lower_) < self.config.preprocessing['min_len_normalize']:
+            norm, is_pron = token.lower_, False
+        elif (self.config.preprocessing.get('do_not_normalize', set())) and token.tag_ is not None and \
+                 token.tag_ in self.config.preprocessing.get('do_not_normalize'):
+            norm, is_pron = token.lower_, False
+        elif token.lemma_ == '-PRON-':
+            norm, is_pron = token.lemma_, True
+        else:
+            norm, is_pron = token.lemma_.lower(), False
+
+        spell_check_candidate = len(token.text) >= self.config.general['spell_check_len_limit'] and \
+            not CONTAINS_NUMBER.search(token.lower_)
+        return norm, is_pron, token.lower_ if spell_check_candidate else None
+
     # Override
     def __call__(self, doc):
+        norms = self._norms
+        norms.check((self.config.preprocessing['min_len_normalize'], self.config.general['spell_check_len_limit'],
+                     tuple(sorted(self.config.preprocessing.get('do_not_normalize') or []))))
+        spell_check = self.config.general['spell_check']
+        if spell_check:
+            self._check_cache()
+
         for token in doc:
-            if len(token.lower_) < self.config.preprocessing['min_len_normalize']:
-                token._.norm = token.lower_
-            elif (self.config.preprocessing.get('do_not_normalize', set())) and token.tag_ is not None and \
-                     token.tag_ in self.config.preprocessing.get('do_not_normalize'):
-                token._.norm = token.lower_
-            elif token.lemma_ == '-PRON-':
-                token._.norm = token.lemma_
+            # The norm only depends on the text, tag and lemma
+            key = (token.orth, token.tag, token.lemma)
+            value = norms.get(key)
+            if value is None:
+                value = norms.add(key, self._get_norm(token))
+            norm, is_pron, lower = value
+            token._.norm = norm
+            if is_pron:
                 token._.to_skip = True
-            else:
-                token._.norm = token.lemma_.lower()
 
-            if self.config.general['spell_check']:
+            if spell_check and lower is not None:
                 # Fix the token if necessary
-                if len(token.text) >= self.config.general['spell_check_len_limit'] and not token._.is_punct \
-                        and token.lower_ not in self.spell_checker and not CONTAINS_NUMBER.search(token.lower_):
-                    fix = self.spell_checker.fix(token.lower_)
-                    if fix is not None:
-                        tmp = self.nlp(fix)[0]
-                        if len(token.lower_) < self.config.preprocessing['min_len_normalize']:
-                            token._.norm = tmp.lower_
-                        else:
-                            token._.norm = tmp.lemma_.lower()
+                if not token._.is_punct and lower not in self.spell_checker:
+                    norm = self.cache.get_or_compute(lower, self._fixed_norm)
+                    if norm is not None:
+                        if self.stats is not None:
+                            self.stats.count('spell_check_fixes')
+                        token._.norm = norm
         return doc
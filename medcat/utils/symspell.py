@@ -0,0 +1,133 @@
+""" Symmetric delete index for spelling correction (the idea behind SymSpell). Every word of the vocabulary
+is indexed under all the strings that can be made by deleting up to `max_distance` characters from it, a lookup
+then only generates the deletes of the input word (no inserts or replaces) and the words found under them are
+the only ones that can be within `max_distance` edits.
+"""
+import pickle
+import logging
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+
+log = logging.getLogger(__name__)
+
+
+def deletes(word: str, max_distance: int) -> Set[str]:
+    r''' All strings made by deleting up to `max_distance` characters from `word`, including the word itself.
+    '''
+    out = {word}
+    current = {word}
+    for _ in range(max_distance):
+        current = set(w[:i] + w[i + 1:] for w in current for i in range(len(w)))
+        out.update(current)
+    return out
+
+
+def edit_distance(word: str, candidate: str, letters: Optional[str] = None, max_distance: int = 2) -> int:
+    r''' Damerau-Levenshtein distance (optimal string alignment) to get from `word` to `candidate` with deletions,
+    transpositions, replacements and insertions. If `letters` is set, only characters from it can be inserted or
+    used as a replacement. If the distance is larger than `max_distance`, `max_distance + 1` is returned.
+    '''
+    too_far = max_distance + 1
+    if abs(len(word) - len(candidate)) > max_distance:
+        return too_far
+
+    n, m = len(word), len(candidate)
+    prev2: List[int] = []
+    prev = list(range(m + 1))
+    if letters is not None:
+        # Inserting a character that is not allowed is impossible
+        for j in range(1, m + 1):
+            prev[j] = prev[j - 1] + 1 if candidate[j - 1] in letters and prev[j - 1] < too_far else too_far
+    for i in range(1, n + 1):
+        row = [i] + [too_far] * m
+        for j in range(1, m + 1):
+            allowed = letters is None or candidate[j - 1] in letters
+            if word[i - 1] == candidate[j - 1]:
+                cost = prev[j - 1]
+            else:
+                cost = prev[j - 1] + 1 if allowed else too_far
+            cost = min(cost, prev[j] + 1)
+            if allowed:
+                cost = min(cost, row[j - 1] + 1)
+            if i > 1 and j > 1 and word[i - 1] == candidate[j - 2] and word[i - 2] == candidate[j - 1]:
+                cost = min(cost, prev2[j - 2] + 1)
+            row[j] = min(cost, too_far)
+        if min(row) >= too_far:
+            return too_far
+        prev2, prev = prev, row
+
+    return prev[m]
+
+
+class DeleteIndex(object):
+    r''' Index of the deletes of all words in a vocabulary.
+
+    Args:
+        words (`Iterable[str]`):
+            The vocabulary, usually `cdb.vocab`.
+        max_distance (`int`, defaults to 1):
+            Maximum edit distance that can be looked up.
+        prefix_length (`int`, defaults to 7):
+            Only the deletes of this many leading characters of a word are indexed, this keeps the index small
+            and does not change the results (candidates are always checked on the full word).
+    '''
+
+    def __init__(self, words: Iterable[str], max_distance: int = 1, prefix_length: int = 7) -> None:
+        if prefix_length <= max_distance:
+            raise ValueError("prefix_length has to be larger than max_distance")
+        self.max_distance = max_distance
+        self.prefix_length = prefix_length
+        self.deletes: Dict[str, List[str]] = {}
+        self.vocab_size = 0
+        for word in words:
+            self.vocab_size += 1
+            for delete in deletes(word[:prefix_length], max_distance):
+                if delete in self.deletes:
+                    self.deletes[delete].append(word)
+                else:
+                    self.deletes[delete] = [word]
+
+    def is_compiled_for(self, vocab: Dict, max_distance: int) -> bool:
+        r''' Check is this index usable for the vocab and distance. Words are only ever added to the
+        CDB vocab, so the size is enough to detect a change.
+        '''
+        return self.vocab_size == len(vocab) and self.max_distance >= max_distance
+
+    def lookup(self, word: str, max_distance: int = 1, letters: Optional[str] = None) -> List[Tuple[str, int]]:
+        r''' All words from the vocabulary that are at most `max_distance` edits away from `word`.
+
+        Args:
+            word (`str`):
+                The word to look up.
+            max_distance (`int`, defaults to 1):
+                Must not be larger than the `max_distance` of the index.
+            letters (`str`, optional):
+                If set, only these characters can be inserted or used as a replacement.
+
+        Returns:
+            A list of tuples (candidate, distance).
+        '''
+        if max_distance > self.max_distance:
+            raise ValueError("The index was built for a max distance of {}".format(self.max_distance))
+
+        candidates: Set[str] = set()
+        for delete in deletes(word[:self.prefix_length], max_distance):
+            candidates.update(self.deletes.get(delete, []))
+
+        out = []
+        for candidate in candidates:
+            distance = edit_distance(word, candidate, letters=letters, max_distance=max_distance)
+            if distance <= max_distance:
+                out.append((candidate, distance))
+        return out
+
+    def save(self, path: str) -> None:
+        with open(path, 'wb') as f:
+            pickle.dump(self.__dict__, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @classmethod
+    def load(cls, path: str) -> "DeleteIndex":
+        index = cls.__new__(cls)
+        with open(path, 'rb') as f:
+            index.__dict__.update(pickle.load(f))
+        return index
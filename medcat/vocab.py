@@ -1,6 +1,9 @@
+import os
 import numpy as np
 import pickle
-from typing import Optional, List, Dict
+from collections.abc import MutableMapping
+from typing import Optional, List, Dict, Tuple, Iterator, Iterable, Mapping, Union
+from medcat.utils.context_vector_store import MmapMode
 
 
 class Vocab(object):
@@ -8,21 +11,43 @@ class Vocab(object):
     calculation. Also used by the spell checker - but not for fixing the spelling
     only for checking is something correct.
 
+    Words are stored in arrays: the index of a word is its row in `vectors` and `counts`. The `vocab`
+    property is a dict-like view on them that works the same as the old dict of dicts.
+
     Properties:
         vocab (dict):
             Map from word to attributes, e.g. {'house': {'vec': <np.array>, 'cnt': <int>, ...}, ...}
+        word2index (dict):
+            From word to its index
         index2word (dict):
-            From word to an index - used for negative sampling
+            From index to a word - used for negative sampling
         vec_index2word (dict):
             Same as index2word but only words that have vectors
-        unigram_table (dict):
+        vectors (numpy.ndarray):
+            float32 matrix with one row per word, rows of words without a vector are zeros. It can have
+            more rows than there are words (the rest is space for new words).
+        counts (numpy.ndarray):
+            Count of each word.
+        has_vector (numpy.ndarray):
+            Does the word have a vector.
+        unigram_table (numpy.ndarray):
             Negative sampling.
+        alias_table (Tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray], optional):
+            Negative sampling with less memory, used instead of the unigram table if set (see `make_alias_table`).
     '''
     def __init__(self) -> None:
-        self.vocab: Dict = {}
+        self.word2index: Dict[str, int] = {}
         self.index2word: Dict = {}
         self.vec_index2word: Dict = {}
+        self.vectors: np.ndarray = np.zeros((0, 0), dtype=np.float32)
+        self.counts: np.ndarray = np.zeros(0, dtype=np.int64)
+        self.has_vector: np.ndarray = np.zeros(0, dtype=bool)
         self.unigram_table: np.ndarray = np.array([])
+        self.alias_table: Optional[Tuple[np.ndarray, np.ndarray, np.ndarray]] = None
+
+    @property
+    def vocab(self) -> "VocabItems":
+        return VocabItems(self)
 
     def inc_or_add(self, word: str, cnt: int = 1, vec: Optional[np.ndarray] = None):
         r''' Add a word or incrase its count.
@@ -36,7 +61,7 @@ class Vocab(object):
             vec (numpy.ndarray):
                 Word vector
         '''
-        if word not in self.vocab:
+        if word not in self.word2index:
             self.add_word(word, cnt, vec)
         else:
             self.inc_wc(word, cnt)
@@ -45,9 +70,8 @@ class Vocab(object):
         r''' Remove all stored vector representations
         '''
         self.vec_index2word = {}
-
-        for word in self.vocab:
-            self.vocab[word]['vec'] = None
+        self.has_vector[:] = False
+        self.vectors[:] = 0
 
     def remove_words_below_cnt(self, cnt: int) -> None:
         r''' Remove all words with frequency below cnt.
@@ -56,22 +80,26 @@ class Vocab(object):
             cnt (int):
                 Word count limit.
         '''
-        print("Words before removal: " + str(len(self.vocab)))
-        for word in list(self.vocab.keys()):
-            if self.vocab[word]['cnt'] < cnt:
-                del self.vocab[word]
-        print("Words after removal : " + str(len(self.vocab)))
-
-        # Rebuild index2word and vec_index2word
-        self.index2word = {}
-        self.vec_index2word = {}
-        for word in self.vocab.keys():
-            ind = len(self.index2word)
-            self.index2word[ind] = word
-            self.vocab[word]['ind'] = ind
+        print("Words before removal: " + str(len(self.word2index)))
+        self._keep(np.flatnonzero(self.counts[:len(self.word2index)] >= cnt))
+        print("Words after removal : " + str(len(self.word2index)))
 
-            if self.vocab[word]['vec'] is not None:
-                self.vec_index2word[ind] = word
+    def remove_words(self, words: Iterable[str]) -> None:
+        r''' Remove words from the vocab, the remaining words get new (contiguous) indices.
+        '''
+        remove = set(self.word2index[word] for word in words)
+        self._keep(np.array([ind for ind in range(len(self.word2index)) if ind not in remove], dtype=np.int64))
+
+    def _keep(self, inds: np.ndarray) -> None:
+        words = [self.index2word[ind] for ind in inds]
+        self.vectors = self.vectors[inds]
+        self.counts = self.counts[inds]
+        self.has_vector = self.has_vector[inds]
+
+        # Rebuild the indices
+        self.word2index = {word: ind for ind, word in enumerate(words)}
+        self.index2word = dict(enumerate(words))
+        self.vec_index2word = {ind: word for ind, word in enumerate(words) if self.has_vector[ind]}
 
     def inc_wc(self, word: str, cnt: int = 1):
         r''' Incraese word count by cnt.
@@ -82,7 +110,7 @@ class Vocab(object):
             cnt (int):
                 By how muhc to incrase the count
         '''
-        self.item(word)['cnt'] += cnt
+        self.counts[self.word2index[word]] += cnt
 
     def add_vec(self, word: str, vec: np.ndarray) -> None:
         r''' Add vector to a word.
@@ -93,9 +121,9 @@ class Vocab(object):
             vec (numpy.ndarray):
                 The vector to add.
         '''
-        self.vocab[word]['vec'] = vec
+        ind = self.word2index[word]
+        self._set_vec(ind, vec)
 
-        ind = self.vocab[word]['ind']
         if ind not in self.vec_index2word:
             self.vec_index2word[ind] = word
 
@@ -106,8 +134,7 @@ class Vocab(object):
             cnt (int):
                 New count for all words in the vocab.
         '''
-        for word in self.vocab.keys():
-            self.vocab[word]['cnt'] = cnt
+        self.counts[:] = cnt
 
     def update_counts(self, tokens: List[str]) -> None:
         r''' Given a list of tokens update counts for words in the vocab.
@@ -133,23 +160,54 @@ class Vocab(object):
             replace (bool):
                 will replace old vector representation
         """
-        if word not in self.vocab:
+        if word not in self.word2index:
             ind = len(self.index2word)
+            if ind >= len(self.counts):
+                self._grow(max(64, len(self.counts) * 2))
             self.index2word[ind] = word
-            item = {'vec': vec, 'cnt': cnt, 'ind': ind}
-            self.vocab[word] = item
+            self.word2index[word] = ind
+            self.counts[ind] = cnt
 
             if vec is not None:
+                self._set_vec(ind, vec)
                 self.vec_index2word[ind] = word
         elif replace and vec is not None:
-            self.vocab[word]['vec'] = vec
-            self.vocab[word]['cnt'] = cnt
+            ind = self.word2index[word]
+            self._set_vec(ind, vec)
+            self.counts[ind] = cnt
 
             # If this word didn't have a vector before
-            ind = self.vocab[word]['ind']
             if ind not in self.vec_index2word:
                 self.vec_index2word[ind] = word
 
+    def _grow(self, capacity: int) -> None:
+        n = len(self.counts)
+        vectors = np.zeros((capacity, self.vectors.shape[1]), dtype=np.float32)
+        vectors[:n] = self.vectors
+        self.vectors = vectors
+        counts = np.zeros(capacity, dtype=np.int64)
+        counts[:n] = self.counts
+        self.counts = counts
+        has_vector = np.zeros(capacity, dtype=bool)
+        has_vector[:n] = self.has_vector
+        self.has_vector = has_vector
+
+    def _set_vec(self, ind: int, vec: Optional[np.ndarray]) -> None:
+        if vec is None:
+            self.has_vector[ind] = False
+            self.vectors[ind] = 0
+            return
+
+        vec = np.asarray(vec, dtype=np.float32)
+        if vec.shape[0] != self.vectors.shape[1]:
+            if self.has_vector.any():
+                raise ValueError("All vectors in the vocab must have the same size, expected {} got {}".format(
+                                 self.vectors.shape[1], vec.shape[0]))
+            # No vectors yet (or all were removed), the first one sets the size
+            self.vectors = np.zeros((len(self.counts), vec.shape[0]), dtype=np.float32)
+        self.vectors[ind] = vec
+        self.has_vector[ind] = True
+
     def add_words(self, path: str, replace: bool = True) -> None:
         """Adds words to the vocab from a file, the file
         is required to have the following format (vec being optional):
@@ -177,26 +235,59 @@ class Vocab(object):
 
     def make_unigram_table(self, table_size: int = 100000000) -> None:
         r''' Make unigram table for negative sampling, look at the paper if interested
-        in details.
+        in details. Replaces the alias table if there was one.
         '''
-        freqs = []
-        unigram_table = []
-
-        words = list(self.vec_index2word.values())
-        for word in words:
-            freqs.append(self[word])
-
-        freqs = np.array(freqs)
-        freqs = np.power(freqs, 3/4)
+        inds = np.fromiter(self.vec_index2word.keys(), dtype=np.int64, count=len(self.vec_index2word))
+        freqs = np.power(self._vec_counts(), 3/4)
         sm = np.sum(freqs)
 
-        for ind in self.vec_index2word.keys():
-            word = self.vec_index2word[ind]
-            f_ind = words.index(word)
-            p = freqs[f_ind] / sm
-            unigram_table.extend([ind] * int(p * table_size))
+        # Every index repeated in proportion to its frequency, truncated the same way as int()
+        repeats = (freqs / sm * table_size).astype(np.int64)
+        self.unigram_table = np.repeat(inds, repeats)
+        self.alias_table = None
 
-        self.unigram_table = np.array(unigram_table)
+    def make_alias_table(self) -> None:
+        r''' Make an alias table (Walker/Vose) for negative sampling. Samples come from the same
+        distribution as with `make_unigram_table`, but it needs three arrays the size of the vocabulary
+        instead of a table with up to `table_size` entries. Replaces the unigram table if there was one.
+        '''
+        inds = np.fromiter(self.vec_index2word.keys(), dtype=np.int64, count=len(self.vec_index2word))
+        freqs = np.power(self._vec_counts(), 3/4)
+        n = len(freqs)
+        scaled = freqs / np.sum(freqs) * n if n > 0 else freqs
+
+        prob = np.ones(n)
+        alias = np.arange(n)
+        small = list(np.flatnonzero(scaled < 1))
+        large = list(np.flatnonzero(scaled >= 1))
+        while small and large:
+            less = small.pop()
+            more = large.pop()
+            prob[less] = scaled[less]
+            alias[less] = more
+            scaled[more] = scaled[more] + scaled[less] - 1
+            if scaled[more] < 1:
+                small.append(more)
+            else:
+                large.append(more)
+        # Whatever is left has a probability of 1 (up to rounding errors)
+
+        self.alias_table = (inds, prob, alias)
+        self.unigram_table = np.array([])
+
+    def _vec_counts(self) -> np.ndarray:
+        inds = np.fromiter(self.vec_index2word.keys(), dtype=np.int64, count=len(self.vec_index2word))
+        return self.counts[inds].astype(np.float64)
+
+    def _sample(self, n: int) -> np.ndarray:
+        if self.alias_table is not None:
+            inds, prob, alias = self.alias_table
+            columns = np.random.randint(0, len(inds), n)
+            keep = np.random.random(n) < prob[columns]
+            return inds[np.where(keep, columns, alias[columns])]
+        if len(self.unigram_table) == 0:
+            raise Exception("No unigram table present, please run the function vocab.make_unigram_table() first.")
+        return self.unigram_table[np.random.randint(0, len(self.unigram_table), n)]
 
     def get_negative_samples(self, n: int = 6, ignore_punct_and_num: bool = False) -> List[int]:
         r''' Get N negative samples.
@@ -210,10 +301,7 @@ class Vocab(object):
             inds (List[int]):
                 Indices for words in this vocabulary.
         '''
-        if len(self.unigram_table) == 0:
-            raise Exception("No unigram table present, please run the function vocab.make_unigram_table() first.")
-        inds = np.random.randint(0, len(self.unigram_table), n)
-        inds = self.unigram_table[inds]
+        inds = self._sample(n).tolist()
 
         if ignore_punct_and_num:
             # Do not return anything that does not have letters in it
@@ -221,31 +309,191 @@ class Vocab(object):
 
         return inds
 
+    def get_negative_samples_batch(self, sizes: List[int], ignore_punct_and_num: bool = False) -> List[List[int]]:
+        r''' Same as calling `get_negative_samples` for each of the `sizes`, but all samples are drawn at once.
+
+        Args:
+            sizes (List[int]):
+                How many words to return for each set, e.g. one set per CUI or per context type.
+            ignore_punct_and_num (bool):
+                When returing words shold we skip punctuation and numbers.
+        Returns:
+            sets (List[List[int]]):
+                For each of the sizes the indices for words in this vocabulary.
+        '''
+        inds = self._sample(int(np.sum(sizes)))
+        out = [part.tolist() for part in np.split(inds, np.cumsum(sizes)[:-1])] if len(sizes) > 0 else []
+
+        if ignore_punct_and_num:
+            out = [[ind for ind in part if self.index2word[ind].upper().isupper()] for part in out]
+
+        return out
+
     def __getitem__(self, word: str) -> int:
         return self.count(word)
 
-    def vec(self, word: str) -> np.ndarray:
-        return self.vocab[word]['vec']
+    def vec(self, word: str) -> Optional[np.ndarray]:
+        ind = self.word2index[word]
+        return self.vectors[ind] if self.has_vector[ind] else None
+
+    def vec_index(self, word: str) -> Optional[int]:
+        r''' Row of the word in `vectors`, None if the word is not in the vocab or has no vector.
+        '''
+        ind = self.word2index.get(word)
+        if ind is None or not self.has_vector[ind]:
+            return None
+        return ind
 
     def count(self, word: str) -> int:
-        return self.vocab[word]['cnt']
+        return int(self.counts[self.word2index[word]])
 
-    def item(self, word: str) -> Dict:
+    def item(self, word: str) -> "VocabItem":
         return self.vocab[word]
 
     def __contains__(self, word: str) -> bool:
-        if word in self.vocab:
-            return True
+        return word in self.word2index
+
+    def __getstate__(self) -> Dict:
+        n = len(self.word2index)
+        return {'index2word': self.index2word,
+                'vec_index2word': self.vec_index2word,
+                'vectors': self.vectors[:n],
+                'counts': self.counts[:n],
+                'has_vector': self.has_vector[:n],
+                'unigram_table': self.unigram_table,
+                'alias_table': self.alias_table}
+
+    def __setstate__(self, state: Dict) -> None:
+        self.__init__()  # type: ignore
+        if 'vocab' in state:
+            # Saved before the vocab was array based, every word is a dict with 'vec', 'cnt' and 'ind'
+            state = dict(state)
+            items = state.pop('vocab')
+            self.__dict__.update(state)
+            self.index2word = {}
+            self.vec_index2word = {}
+            self._grow(len(items))
+            for word, item in sorted(items.items(), key=lambda word_item: word_item[1]['ind']):
+                self.add_word(word, cnt=item['cnt'], vec=item['vec'])
+            # Keep the order of vec_index2word, it is the order of the unigram table
+            self.vec_index2word = {ind: word for ind, word in state['vec_index2word'].items() if ind in self.index2word}
+        else:
+            self.__dict__.update(state)
+            self.word2index = {word: ind for ind, word in self.index2word.items()}
 
-        return False
+    def save(self, path: str, mmap_vectors: bool = False) -> None:
+        r''' Save the vocab to a file.
+
+        Args:
+            path (str):
+                Path to the file where the vocab will be saved.
+            mmap_vectors (bool):
+                If True the word vectors are saved as one matrix in `<path without extension>_vectors.npy`,
+                next to `path`. On load they are memory-mapped, so that all processes using the same
+                files share one copy of the vectors.
+        '''
+        to_save = self.__getstate__()
+        if mmap_vectors:
+            vectors_path = os.path.splitext(path)[0] + "_vectors.npy"
+            np.save(vectors_path, to_save['vectors'])
+            to_save['vectors'] = None
+            to_save['_vectors_file'] = os.path.basename(vectors_path)
 
-    def save(self, path: str) -> None:
         with open(path, 'wb') as f:
-            pickle.dump(self.__dict__, f)
+            pickle.dump(to_save, f)
 
     @classmethod
-    def load(cls, path: str) -> "Vocab":
+    def load(cls, path: str, mmap_mode: Optional[MmapMode] = 'c') -> "Vocab":
+        r''' Load a vocab from a file.
+
+        Args:
+            path (str):
+                Path to the saved vocab.
+            mmap_mode (str, optional):
+                Only used if the vocab was saved with `mmap_vectors=True`, the mode used for memory-mapping the
+                vectors. The default is copy-on-write, None loads the vectors into memory.
+        '''
         with open(path, 'rb') as f:
-            vocab = cls()
-            vocab.__dict__ = pickle.load(f)
+            state = pickle.load(f)
+
+        vectors_file = state.pop('_vectors_file', None)
+        if vectors_file is not None:
+            # asarray keeps the mapping, but row access returns plain ndarrays instead of np.memmap
+            state['vectors'] = np.asarray(np.load(os.path.join(os.path.dirname(path), vectors_file), mmap_mode=mmap_mode))
+
+        vocab = cls.__new__(cls)
+        vocab.__setstate__(state)
+
         return vocab
+
+
+class VocabItems(MutableMapping):
+    r''' Dict-like view on the words of a `Vocab`, `items[word]` is a `VocabItem`.
+    '''
+
+    def __init__(self, vocab: Vocab) -> None:
+        self._vocab = vocab
+
+    def __getitem__(self, word: str) -> "VocabItem":
+        if word not in self._vocab.word2index:
+            raise KeyError(word)
+        return VocabItem(self._vocab, word)
+
+    def __setitem__(self, word: str, item: Mapping) -> None:
+        if word in self._vocab.word2index:
+            self[word]['cnt'] = item.get('cnt', 1)
+            self[word]['vec'] = item.get('vec')
+        else:
+            self._vocab.add_word(word, cnt=item.get('cnt', 1), vec=item.get('vec'))
+
+    def __delitem__(self, word: str) -> None:
+        self._vocab.remove_words([word])
+
+    def __contains__(self, word: object) -> bool:
+        return word in self._vocab.word2index
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._vocab.word2index)
+
+    def __len__(self) -> int:
+        return len(self._vocab.word2index)
+
+
+class VocabItem(MutableMapping):
+    r''' Dict-like view on one word of a `Vocab` with the keys `vec`, `cnt` and `ind`. Setting `vec` or `cnt`
+    updates the vocab, `ind` can not be changed.
+    '''
+    KEYS = ('vec', 'cnt', 'ind')
+
+    def __init__(self, vocab: Vocab, word: str) -> None:
+        self._vocab = vocab
+        self._ind = vocab.word2index[word]
+
+    def __getitem__(self, key: str) -> Union[Optional[np.ndarray], int]:
+        if key == 'vec':
+            return self._vocab.vectors[self._ind] if self._vocab.has_vector[self._ind] else None
+        elif key == 'cnt':
+            return int(self._vocab.counts[self._ind])
+        elif key == 'ind':
+            return self._ind
+        raise KeyError(key)
+
+    def __setitem__(self, key: str, value) -> None:
+        if key == 'vec':
+            self._vocab._set_vec(self._ind, value)
+        elif key == 'cnt':
+            self._vocab.counts[self._ind] = value
+        else:
+            raise KeyError("Only 'vec' and 'cnt' can be set, not: {}".format(key))
+
+    def __delitem__(self, key: str) -> None:
+        raise KeyError("Vocab items have fixed keys")
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.KEYS)
+
+    def __len__(self) -> int:
+        return len(self.KEYS)
+
+    def __repr__(self) -> str:
+        return repr(dict(self.items()))
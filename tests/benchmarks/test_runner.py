@@ -0,0 +1,35 @@
+import unittest
+from medcat.cat import CAT
+from medcat.benchmarks.synthetic import make_vocab, make_cdb, make_texts
+from medcat.benchmarks.runner import run_benchmarks
+
+
+class RunnerTests(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        vocab = make_vocab(n_words=500, vector_size=20)
+        cdb = make_cdb(vocab, n_concepts=100)
+        cls.texts = make_texts(cdb, vocab, n_docs=10, doc_length=50)
+        cls.cat = CAT(cdb=cdb, config=cdb.config, vocab=vocab)
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        cls.cat.destroy_pipe()
+
+    def test_run_benchmarks(self):
+        results = run_benchmarks(self.cat, self.texts, modes=['call', 'multiprocessing'], nproc=1)
+        self.assertEqual(['call', 'multiprocessing'], list(results.keys()))
+        self.assertEqual(10, results['call']['docs'])
+        self.assertGreater(results['call']['tokens_per_sec'], 0)
+        self.assertLessEqual(results['call']['latency_p50_ms'], results['call']['latency_p99_ms'])
+        self.assertIsNone(results['multiprocessing']['latency_p50_ms'])
+        self.assertGreater(results['multiprocessing']['peak_rss_mb'], 0)
+
+    def test_unknown_mode(self):
+        with self.assertRaises(ValueError):
+            run_benchmarks(self.cat, self.texts, modes=['unknown'])
+
+
+if __name__ == '__main__':
+    unittest.main()
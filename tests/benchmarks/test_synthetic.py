@@ -0,0 +1,31 @@
+import unittest
+from medcat.benchmarks.synthetic import make_vocab, make_cdb, make_texts
+
+
+class SyntheticTests(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.vocab = make_vocab(n_words=500, vector_size=20)
+        cls.cdb = make_cdb(cls.vocab, n_concepts=100, ambiguity=0.5)
+
+    def test_make_vocab(self):
+        self.assertEqual(500, len(self.vocab.vocab))
+        self.assertEqual(20, len(self.vocab.vec(next(iter(self.vocab.vocab)))))
+        self.assertEqual(list(self.vocab.vocab.keys()), list(make_vocab(n_words=500, vector_size=20).vocab.keys()))
+
+    def test_make_cdb(self):
+        self.assertEqual(100, len(self.cdb.cui2names))
+        self.assertTrue(any(len(cuis) > 1 for cuis in self.cdb.name2cuis.values()))
+        for cui in self.cdb.cui2names:
+            self.assertEqual(set(self.cdb.config.linking['context_vector_sizes'].keys()), set(self.cdb.cui2context_vectors[cui].keys()))
+
+    def test_make_texts(self):
+        texts = make_texts(self.cdb, self.vocab, n_docs=5, doc_length=50)
+        self.assertEqual(5, len(texts))
+        self.assertTrue(all(len(text.split(" ")) >= 50 for text in texts))
+        self.assertEqual(texts, make_texts(self.cdb, self.vocab, n_docs=5, doc_length=50))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+import unittest
+import unittest.mock
+from medcat.config import Config
+from medcat.pipe import Pipe
+from medcat.preprocessing import cleaners
+from medcat.preprocessing.cleaners import prepare_name, PreparedNameCache
+from medcat.preprocessing.taggers import tag_skip_and_punct
+from medcat.preprocessing.tokenizers import spacy_split_all
+
+
+class PreparedNameCacheTests(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.config = Config()
+        cls.config.general['log_level'] = 0
+        cls.config.general["spacy_model"] = "en_core_web_md"
+        cls.pipe = Pipe(tokenizer=spacy_split_all, config=cls.config)
+        cls.pipe.add_tagger(tagger=tag_skip_and_punct, name="skip_and_punct", additional_fields=["is_punct"])
+
+    def setUp(self) -> None:
+        self.cache = PreparedNameCache()
+
+    def tearDown(self) -> None:
+        self.config.cdb_maker['name_versions'] = ['LOWER', 'CLEAN']
+        self.config.preprocessing['stopwords'] = None
+
+    def test_same_as_prepare_name(self):
+        expected = prepare_name("Kidney Failures", self.pipe.spacy_nlp, {}, self.config)
+        for _ in range(2):
+            self.assertEqual(expected, self.cache.prepare_name("Kidney Failures", self.pipe.spacy_nlp, {}, self.config))
+
+    def test_raw_name_is_prepared_once(self):
+        with unittest.mock.patch.object(cleaners, 'prepare_name', wraps=cleaners.prepare_name) as prepare:
+            for _ in range(3):
+                self.cache.prepare_name("Kidney Failures", self.pipe.spacy_nlp, {}, self.config)
+        self.assertEqual(1, prepare.call_count)
+
+    def test_existing_names_are_kept(self):
+        names = self.cache.prepare_name("Kidney Failures", self.pipe.spacy_nlp, {}, self.config)
+        names = self.cache.prepare_name("kidney failures", self.pipe.spacy_nlp, names, self.config)
+        self.assertEqual("Kidney Failures", names['kidney~failures']['raw_name'])
+
+    def test_outputs_are_copies(self):
+        names = self.cache.prepare_name("Kidney Failures", self.pipe.spacy_nlp, {}, self.config)
+        names['kidney~failures']['snames'].add('other')
+        names = self.cache.prepare_name("Kidney Failures", self.pipe.spacy_nlp, {}, self.config)
+        self.assertNotIn('other', names['kidney~failures']['snames'])
+
+    def test_config_change_empties_the_cache(self):
+        self.cache.prepare_name("Kidney Failures", self.pipe.spacy_nlp, {}, self.config)
+        self.config.cdb_maker['name_versions'] = ['LOWER']
+        names = self.cache.prepare_name("Kidney Failures", self.pipe.spacy_nlp, {}, self.config)
+        self.assertEqual(['kidney~failures'], list(names))
+        self.assertEqual(1, len(self.cache))
+
+    def test_stopwords_change_empties_the_cache(self):
+        self.config.preprocessing['stopwords'] = {'kidney'}
+        self.cache.prepare_name("Kidney Failures", self.pipe.spacy_nlp, {}, self.config)
+        self.cache.prepare_name("Kidney Failures", self.pipe.spacy_nlp, {}, self.config)
+        self.assertEqual(1, len(self.cache))
+        self.config.preprocessing['stopwords'].add('failures')
+        self.cache.check(self.config)
+        self.assertEqual(0, len(self.cache))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,48 @@
+import unittest
+from medcat.config import Config
+from medcat.pipe import Pipe
+from medcat.preprocessing.taggers import tag_skip_and_punct
+from medcat.preprocessing.tokenizers import spacy_split_all
+
+
+class TagSkipAndPunctTests(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.config = Config()
+        cls.config.general['log_level'] = 0
+        cls.pipe = Pipe(tokenizer=spacy_split_all, config=cls.config)
+        cls.pipe.add_tagger(tagger=tag_skip_and_punct, name="skip_and_punct", additional_fields=["is_punct"])
+        # spacy gives the tagger its own copy of the config
+        cls.tagger_config = cls.pipe.spacy_nlp.get_pipe("skip_and_punct").config
+
+    def tearDown(self) -> None:
+        self.tagger_config.preprocessing['words_to_skip'] = {'nos'}
+        self.tagger_config.rebuild_re()
+        self.tagger_config.preprocessing['skip_stopwords'] = False
+        self.tagger_config.preprocessing['stopwords'] = None
+
+    def _flags(self, text):
+        return [(token.text, token._.is_punct, token._.to_skip) for token in self.pipe(text)]
+
+    def test_repeated_words_are_tagged_the_same(self):
+        expected = [('Fever', False, False), (',', True, True), ('nos', False, True), ('.', False, False)]
+        self.assertEqual(expected, self._flags("Fever, nos."))
+        self.assertEqual(expected + expected[:3], self._flags("Fever, nos. Fever, nos"))
+
+    def test_config_change_is_picked_up(self):
+        self.assertEqual([('fever', False, False)], self._flags("fever"))
+        self.tagger_config.preprocessing['words_to_skip'] = {'nos', 'fever'}
+        self.tagger_config.rebuild_re()
+        self.assertEqual([('fever', False, True)], self._flags("fever"))
+
+    def test_stopwords_change_is_picked_up(self):
+        self.tagger_config.preprocessing['skip_stopwords'] = True
+        self.tagger_config.preprocessing['stopwords'] = {'nos'}
+        self.assertEqual([('fever', False, False)], self._flags("fever"))
+        self.tagger_config.preprocessing['stopwords'].add('fever')
+        self.assertEqual([('fever', False, True)], self._flags("fever"))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,14 +1,23 @@
+import copy
 import json
 import os
 import sys
+import types
 import unittest
+import unittest.mock
 import tempfile
+import numpy as np
 from medcat.vocab import Vocab
 from medcat.cdb import CDB
 from medcat.cat import CAT
 from medcat.utils.checkpoint import Checkpoint
 
 
+def _kill_worker(batch, only_cui, addl_info):
+    # As if the worker was killed by the OOM killer
+    os._exit(137)
+
+
 class CATTests(unittest.TestCase):
 
     @classmethod
@@ -57,6 +66,39 @@ class CATTests(unittest.TestCase):
         self.assertEqual(0, len(out[2]['entities']))
         self.assertEqual(0, len(out[3]['entities']))
 
+    def test_multiprocessing_with_small_batches(self):
+        in_data = [(i, "The dog is sitting outside the house and second csv.") for i in range(10)]
+        out = self.undertest.multiprocessing(in_data, nproc=2, batch_size_chars=100, max_in_flight=1)
+
+        self.assertEqual(10, len(out))
+        for i in range(10):
+            self.assertEqual('second csv', list(out[i]['entities'].values())[0]['source_value'])
+
+    def test_mp_imap_keeps_order(self):
+        batches = [[(i, "The dog is sitting outside the house.")] for i in range(6)]
+        out = list(self.undertest._mp_imap(batches, nproc=2))
+        self.assertEqual(batches, [batch for batch, _ in out])
+        self.assertEqual(list(range(6)), [list(docs.keys())[0] for _, docs in out])
+
+    def test_mp_imap_consumes_input_lazily(self):
+        consumed = []
+
+        def batches():
+            for i in range(10):
+                consumed.append(i)
+                yield [(i, "The dog is sitting outside the house.")]
+
+        results = self.undertest._mp_imap(batches(), nproc=1, max_in_flight=2)
+        next(results)
+        self.assertLessEqual(len(consumed), 3)
+        results.close()
+
+    def test_mp_imap_fails_if_a_worker_dies(self):
+        batches = [[(i, "The dog is sitting outside the house.")] for i in range(2)]
+        with unittest.mock.patch('medcat.cat._mp_annotate', _kill_worker):
+            with self.assertRaisesRegex(RuntimeError, "exited unexpectedly"):
+                list(self.undertest._mp_imap(batches, nproc=2))
+
     def test_multiprocessing_pipe(self):
         in_data = [
             (1, "The dog is sitting outside the house and second csv."),
@@ -102,6 +144,26 @@ class CATTests(unittest.TestCase):
         self.assertEqual({'entities': {}, 'tokens': []}, out[2])
         self.assertEqual({'entities': {}, 'tokens': []}, out[3])
 
+    def test_multiprocessing_pipe_stream(self):
+        in_data = [
+            (1, "The dog is sitting outside the house and second csv."),
+            (2, "The dog is sitting outside the house."),
+            (3, ""),
+            (4, None)
+        ]
+        out = self.undertest.multiprocessing_pipe_stream(iter(in_data), nproc=2, batch_size=1)
+        self.assertTrue(isinstance(out, types.GeneratorType))
+        out = list(out)
+        self.assertEqual([1, 2, 3, 4], [i for i, _ in out])
+        self.assertEqual('second csv', list(out[0][1]['entities'].values())[0]['source_value'])
+        for _, doc in out[1:]:
+            self.assertEqual({'entities': {}, 'tokens': []}, doc)
+
+    def test_multiprocessing_pipe_stream_unordered(self):
+        in_data = [(i, "The dog is sitting outside the house and second csv.") for i in range(10)]
+        out = dict(self.undertest.multiprocessing_pipe_stream(in_data, nproc=2, batch_size=3, ordered=False))
+        self.assertEqual(set(range(10)), set(out.keys()))
+
     def test_train(self):
         ckpt_steps = 2
         nepochs = 3
@@ -147,6 +209,21 @@ class CATTests(unittest.TestCase):
         self.assertTrue("checkpoint-%s-36" % ckpt_steps in checkpoints)
         self.assertTrue("checkpoint-%s-39" % ckpt_steps in checkpoints)
 
+    def test_resume_training_from_delta_checkpoint(self):
+        ckpt_dir_path = tempfile.TemporaryDirectory().name
+        checkpoint = Checkpoint(dir_path=ckpt_dir_path, steps=3, max_to_keep=sys.maxsize, full_every=2)
+        self.undertest.train(["The dog is not a house"] * 20, checkpoint=checkpoint)
+        checkpoints = [f for f in os.listdir(ckpt_dir_path) if "checkpoint-" in f]
+        self.assertEqual(6, len(checkpoints))
+        self.assertTrue("checkpoint-3-18-delta" in checkpoints)
+
+        checkpoint = Checkpoint(dir_path=ckpt_dir_path, steps=3, max_to_keep=sys.maxsize, full_every=2)
+        self.undertest.train(["The dog is not a house"] * 20, nepochs=2, checkpoint=checkpoint, is_resumed=True)
+        checkpoints = [f for f in os.listdir(ckpt_dir_path) if "checkpoint-" in f]
+        self.assertEqual(13, len(checkpoints))
+        self.assertTrue("checkpoint-3-21" in checkpoints)
+        self.assertTrue("checkpoint-3-24-delta" in checkpoints)
+
     def test_resume_training_on_absent_checkpoints(self):
         ckpt_dir_path = tempfile.TemporaryDirectory().name
         checkpoint = Checkpoint(dir_path=ckpt_dir_path)
@@ -166,6 +243,38 @@ class CATTests(unittest.TestCase):
         self.assertTrue("checkpoint-%s-18" % ckpt_steps in checkpoints)
         self.assertTrue("checkpoint-%s-20" % ckpt_steps in checkpoints)
 
+    def test_train_multiprocessing(self):
+        ckpt_steps = 7
+        ckpt_dir_path = tempfile.TemporaryDirectory().name
+        checkpoint = Checkpoint(dir_path=ckpt_dir_path, steps=ckpt_steps, max_to_keep=sys.maxsize)
+        self.undertest.train(["The dog is not a house"] * 20, checkpoint=checkpoint, nproc=2, sync_every=5)
+        checkpoints = [f for f in os.listdir(ckpt_dir_path) if "checkpoint-" in f]
+
+        self.assertEqual({"checkpoint-%s-10" % ckpt_steps, "checkpoint-%s-15" % ckpt_steps},
+                         set(checkpoints))
+        self.assertFalse(self.undertest.config.linking['train'])
+
+    def test_train_multiprocessing_counts(self):
+        before = copy.deepcopy(self.cdb)
+        # Negative sampling needs a unigram table, the example vocab has none
+        before.config.linking['negative_probability'] = 0
+        trained = []
+        for nproc in (1, 2):
+            cdb = copy.deepcopy(before)
+            cat = CAT(cdb=cdb, config=cdb.config, vocab=self.vocab)
+            cat.train(["The dog is sitting outside the house and second csv."] * 8, nproc=nproc, sync_every=4)
+            cat.destroy_pipe()
+            trained.append(cdb)
+        single, multi = trained
+
+        self.assertEqual(before.cui2count_train.get('C0000239', 0) + 8, single.cui2count_train['C0000239'])
+        self.assertEqual(single.cui2count_train, multi.cui2count_train)
+        vectors = multi.cui2context_vectors['C0000239']
+        self.assertEqual(set(single.cui2context_vectors['C0000239'].keys()), set(vectors.keys()))
+        for context_type, vector in vectors.items():
+            old = before.cui2context_vectors.get('C0000239', {}).get(context_type)
+            self.assertTrue(old is None or not np.allclose(old, vector), context_type)
+
     def test_get_entities(self):
         text = "The dog is sitting outside the house."
         out = self.undertest.get_entities(text)
@@ -189,6 +298,15 @@ class CATTests(unittest.TestCase):
         self.assertFalse("text" in out[1])
         self.assertFalse("text" in out[2])
 
+    def test_get_entities_multi_texts_inner_parallel(self):
+        self.undertest.config.linking['train'] = False
+        in_data = [(i, "The dog is sitting outside the house and second csv.") for i in range(5)] + [(5, ""), (6, None)]
+        expected = self.undertest.get_entities_multi_texts(in_data, n_process=1)
+        out = self.undertest.get_entities_multi_texts(in_data, n_process=-1, batch_size=2)
+        self.assertEqual(7, len(out))
+        self.assertEqual(expected, out)
+        self.assertEqual('second csv', list(out[0]['entities'].values())[0]['source_value'])
+
     def test_get_entities_multi_texts_including_text(self):
         self.cdb.config.annotation_output['include_text_in_output'] = True
         in_data = [(1, "The dog is sitting outside the house."), (2, ""), (3, None)]
@@ -220,6 +338,27 @@ class CATTests(unittest.TestCase):
         for step in range(1, nepochs * num_of_documents + 1):
             self.assertTrue(f"checkpoint-1-{step}" in checkpoints)
 
+    def test_preprocess_and_annotate(self):
+        text = "The dog is sitting outside the house and second csv."
+        preprocessed = self.undertest.pipe.preprocess(text)
+        self.assertEqual([], list(preprocessed._.ents))
+        expected = self.undertest._doc_to_out(self.undertest(text), only_cui=False, addl_info=[])
+        self.assertTrue(expected['entities'])
+        for _ in range(2):
+            doc = self.undertest.pipe.annotate(preprocessed)
+            self.assertEqual(expected, self.undertest._doc_to_out(doc, only_cui=False, addl_info=[]))
+        self.assertEqual([], list(preprocessed._.ents))
+
+    def test_train_supervised_cache_docs(self):
+        data_path = os.path.join(os.path.dirname(__file__), "resources", "medcat_trainer_export.json")
+        with unittest.mock.patch.object(self.undertest.pipe, 'preprocess', wraps=self.undertest.pipe.preprocess) as preprocess:
+            fp, fn, tp, p, r, f1, cui_counts, examples = self.undertest.train_supervised(data_path, nepochs=2, print_stats=1,
+                                                                                         cache_docs=True)
+        with open(data_path) as f:
+            texts = set(doc['text'] for project in json.load(f)['projects'] for doc in project['documents'])
+        self.assertEqual(len(texts), preprocess.call_count)
+        self.assertTrue(tp)
+
     def test_resume_supervised_training(self):
         nepochs_train = 1
         nepochs_retrain = 2
@@ -323,6 +462,36 @@ class CATTests(unittest.TestCase):
         self.assertTrue(isinstance(cat, CAT))
         self.assertIsNotNone(cat.config.version['medcat_version'])
 
+    def test_load_model_pack_with_mmap_vectors(self):
+        save_dir_path = tempfile.TemporaryDirectory()
+        cdb = copy.deepcopy(self.cdb)
+        cat = CAT(cdb=cdb, config=cdb.config, vocab=self.vocab)
+        full_model_pack_name = cat.create_model_pack(save_dir_path.name, model_pack_name="mp_name", mmap_vectors=True)
+        contents = os.listdir(os.path.join(save_dir_path.name, full_model_pack_name))
+        self.assertIn("cdb_vectors", contents)
+        self.assertIn("vocab_vectors.npy", contents)
+
+        cat = self.undertest.load_model_pack(os.path.join(save_dir_path.name, f"{full_model_pack_name}.zip"))
+        self.assertEqual(cat.get_hash(), cat.config.version['id'])
+        text = "The dog is sitting outside the house and second csv."
+        self.assertEqual([ent['cui'] for ent in self.undertest.get_entities(text)['entities'].values()],
+                         [ent['cui'] for ent in cat.get_entities(text)['entities'].values()])
+
+    def test_load_model_pack_with_symspell(self):
+        save_dir_path = tempfile.TemporaryDirectory()
+        cdb = copy.deepcopy(self.cdb)
+        cdb.config.general['spell_checker'] = 'symspell'
+        cat = CAT(cdb=cdb, config=cdb.config, vocab=self.vocab)
+        full_model_pack_name = cat.create_model_pack(save_dir_path.name, model_pack_name="mp_name")
+        self.assertIn("spell_check_index.dat", os.listdir(os.path.join(save_dir_path.name, full_model_pack_name)))
+
+        cat = self.undertest.load_model_pack(os.path.join(save_dir_path.name, f"{full_model_pack_name}.zip"))
+        self.assertIsNotNone(cat._spell_checker.index)
+        self.assertTrue(cat._spell_checker.index.is_compiled_for(cat.cdb.vocab, max_distance=1))
+        text = "The dog is sitting outside the house and second csv."
+        self.assertEqual([ent['cui'] for ent in self.undertest.get_entities(text)['entities'].values()],
+                         [ent['cui'] for ent in cat.get_entities(text)['entities'].values()])
+
     def test_hashing(self):
         save_dir_path = tempfile.TemporaryDirectory()
         full_model_pack_name = self.undertest.create_model_pack(save_dir_path.name, model_pack_name="mp_name")
@@ -1,10 +1,15 @@
 import os
+import copy
 import shutil
 import unittest
 import tempfile
 import asyncio
+import numpy as np
 from medcat.config import Config
 from medcat.cdb_maker import CDBMaker
+from medcat.cdb import CDB
+from medcat.utils.context_vector_store import ContextVectorStore
+from medcat.utils import cdb_sections
 
 
 class CDBTests(unittest.TestCase):
@@ -52,6 +57,138 @@ class CDBTests(unittest.TestCase):
             self.undertest.save(f.name)
             self.undertest.load(f.name)
 
+    def test_compact_context_vectors(self):
+        self.undertest.update_context_vector('C0000039', {'long': np.array([1.0, 2.0, 3.0]), 'short': np.array([0.5, 0.5, 0.5])})
+        self.undertest.update_context_vector('C0000039', {'long': np.array([3.0, 2.0, 1.0])})
+        expected = {ct: np.array(vector) for ct, vector in self.undertest.cui2context_vectors['C0000039'].items()}
+
+        self.undertest.compact_context_vectors()
+        self.assertIsInstance(self.undertest.cui2context_vectors, ContextVectorStore)
+        with tempfile.NamedTemporaryFile() as f:
+            self.undertest.save(f.name)
+            cdb = CDB.load(f.name)
+        self.assertIsInstance(cdb.cui2context_vectors, ContextVectorStore)
+        for ct, vector in expected.items():
+            np.testing.assert_allclose(vector, cdb.cui2context_vectors['C0000039'][ct], rtol=1e-6)
+
+        cdb.update_context_vector('C0000039', {'long': np.array([3.0, 2.0, 1.0])})
+        self.assertAlmostEqual(np.linalg.norm(cdb.cui2context_vectors['C0000039']['long']),
+                               cdb.cui2context_vectors.get_norm('C0000039', 'long'), places=5)
+
+    def test_save_and_load_mmap_vectors(self):
+        self.undertest.update_context_vector('C0000039', {'long': np.array([1.0, 2.0, 3.0]), 'short': np.array([0.5, 0.5, 0.5])})
+        expected = np.array(self.undertest.cui2context_vectors['C0000039']['long'])
+        cnt = self.undertest.cui2count_train['C0000039']
+        cdb_path = os.path.join(self.tmp_dir, "cdb.dat")
+        self.undertest.save(cdb_path, mmap_vectors=True)
+        self.assertTrue(os.path.exists(os.path.join(self.tmp_dir, "cdb_vectors", "long.npy")))
+
+        cdb = CDB.load(cdb_path)
+        np.testing.assert_allclose(expected, cdb.cui2context_vectors['C0000039']['long'])
+        # Updates stay in memory
+        cdb.update_context_vector('C0000039', {'long': np.array([3.0, 2.0, 1.0])})
+        self.assertEqual(cnt, CDB.load(cdb_path).cui2count_train['C0000039'])
+        np.testing.assert_allclose(expected, CDB.load(cdb_path).cui2context_vectors['C0000039']['long'])
+
+        # Saving the loaded CDB without mmap_vectors keeps the vectors in the file
+        cdb.save(os.path.join(self.tmp_dir, "cdb2.dat"))
+        cdb = CDB.load(os.path.join(self.tmp_dir, "cdb2.dat"))
+        self.assertEqual(cnt + 1, cdb.cui2count_train['C0000039'])
+        self.assertIsNone(cdb.cui2context_vectors.matrices_dir)
+
+    def test_save_and_load_sections(self):
+        self.undertest.update_context_vector('C0000039', {'long': np.array([1.0, 2.0, 3.0])})
+        dir_path = os.path.join(self.tmp_dir, "cdb")
+        self.undertest.save_sections(dir_path)
+        self.assertTrue(os.path.exists(os.path.join(dir_path, "manifest.json")))
+
+        cdb = CDB.load(dir_path)
+        self.assertNotIn('cui2context_vectors', cdb.__dict__)
+        self.assertEqual(self.undertest.name2cuis, cdb.name2cuis)
+        self.assertNotIn('cui2context_vectors', cdb.__dict__)
+        np.testing.assert_allclose(self.undertest.cui2context_vectors['C0000039']['long'], cdb.cui2context_vectors['C0000039']['long'])
+        cdb_sections.load_all(cdb)
+        self.assertEqual(list(self.undertest.__dict__.keys()), list(cdb.__dict__.keys()))
+
+    def test_reset_training_on_lazy_load(self):
+        self.undertest.update_context_vector('C0000039', {'long': np.array([1.0, 2.0, 3.0])})
+        dir_path = os.path.join(self.tmp_dir, "cdb")
+        self.undertest.save_sections(dir_path)
+
+        cdb = CDB.load(dir_path)
+        cdb.reset_training()
+        self.assertEqual(self.undertest.cui2names, cdb.cui2names)
+        self.assertEqual({}, cdb.cui2count_train)
+        self.assertEqual(0, len(cdb.cui2context_vectors))
+        cdb_sections.load_all(cdb)
+        self.assertEqual({}, cdb.cui2count_train)
+        self.assertEqual(0, len(cdb.cui2context_vectors))
+
+    def test_convert_to_sections(self):
+        cdb_path = os.path.join(self.tmp_dir, "cdb.dat")
+        dir_path = os.path.join(self.tmp_dir, "cdb")
+        self.undertest.save(cdb_path)
+        cdb_sections.convert(cdb_path, dir_path)
+        self.assertEqual(CDB.load(cdb_path).get_hash(), CDB.load(dir_path).get_hash())
+        cdb = CDB.load(dir_path, lazy=False, config_dict={'general': {'separator': '|'}})
+        self.assertEqual(self.undertest.cui2names, cdb.cui2names)
+        self.assertEqual('|', cdb.config.general['separator'])
+        with self.assertRaises(AttributeError):
+            cdb.not_an_attribute
+
+    def test_merge_training_deltas(self):
+        merged = CDB(config=Config())
+        copies = []
+        for vector, n in ((np.array([1.0, 0.0]), 1), (np.array([0.0, 1.0]), 3)):
+            cdb = copy.deepcopy(merged)
+            for _ in range(n):
+                cdb.update_context_vector('C0000039', {'long': vector})
+            cdb.name2count_train['virus'] = n
+            copies.append(cdb)
+        deltas = [cdb.get_training_delta({}, {}) for cdb in copies]
+        self.assertEqual({'C0000039'}, set(deltas[0]['cuis'].keys()))
+        self.assertEqual(3, deltas[1]['cuis']['C0000039']['count'])
+
+        merged.merge_training_deltas(deltas)
+        expected = (copies[0].cui2context_vectors['C0000039']['long'] + 3 * copies[1].cui2context_vectors['C0000039']['long']) / 4
+        np.testing.assert_allclose(expected, merged.cui2context_vectors['C0000039']['long'])
+        self.assertEqual(4, merged.cui2count_train['C0000039'])
+        self.assertEqual(4, merged.name2count_train['virus'])
+
+    def test_merge_training_deltas_with_devalued_copy(self):
+        merged = CDB(config=Config())
+        merged.update_context_vector('C0000039', {'long': np.array([1.0, 0.0])})
+        copies = []
+        for vector, negative in ((np.array([1.0, 1.0]), False), (np.array([1.0, 0.0]), True)):
+            cdb = copy.deepcopy(merged)
+            cdb.track_updates()
+            cdb.update_context_vector('C0000039', {'long': vector}, negative=negative)
+            copies.append(cdb)
+        deltas = [cdb.get_training_delta(dict(merged.cui2count_train), {}) for cdb in copies]
+        self.assertEqual(0, deltas[1]['cuis']['C0000039']['count'])
+        self.assertEqual(1, deltas[1]['cuis']['C0000039']['updates'])
+
+        merged.merge_training_deltas(deltas)
+        expected = (copies[0].cui2context_vectors['C0000039']['long'] + copies[1].cui2context_vectors['C0000039']['long']) / 2
+        np.testing.assert_allclose(expected, merged.cui2context_vectors['C0000039']['long'])
+        self.assertEqual(2, merged.cui2count_train['C0000039'])
+
+    def test_training_state(self):
+        trained = CDB(config=Config())
+        trained.update_context_vector('C0000039', {'long': np.array([1.0, 0.0])})
+        trained.name2count_train['virus'] = 2
+        cdb = CDB(config=Config())
+        cdb.set_training_state(trained.get_training_state(['C0000039'], ['virus']))
+        np.testing.assert_allclose(trained.cui2context_vectors['C0000039']['long'], cdb.cui2context_vectors['C0000039']['long'])
+        self.assertEqual(1, cdb.cui2count_train['C0000039'])
+        self.assertEqual(2, cdb.name2count_train['virus'])
+
+    def test_hash_changes_with_training(self):
+        before = self.undertest.get_hash()
+        self.assertEqual(before, self.undertest.get_hash())
+        self.undertest.cui2count_train['C0000039'] = self.undertest.cui2count_train.get('C0000039', 0) + 1
+        self.assertNotEqual(before, self.undertest.get_hash())
+
     def test_save_async_and_load(self):
         with tempfile.NamedTemporaryFile() as f:
             asyncio.run(self.undertest.save_async(f.name))
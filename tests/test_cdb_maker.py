@@ -198,5 +198,59 @@ class B_CDBMakerEditTests(unittest.TestCase):
         self.assertEqual(self.cdb.cui2context_vectors, target_result)
 
 
+class C_CDBMakerBatchTests(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.config = Config()
+        cls.config.general["spacy_model"] = "en_core_web_md"
+        cls.csvs = [
+            os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'examples', 'cdb.csv'),
+            os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'examples', 'cdb_2.csv')
+        ]
+        cls.maker = CDBMaker(cls.config)
+        cls.cdb = cls.maker.prepare_csvs(cls.csvs, full_build=True)
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        cls.maker.destroy_pipe()
+
+    def test_ca_same_as_prepare_name(self):
+        names = {}
+        for raw_name in ['Virus M', 'Virus K', 'Virus Z']:
+            prepare_name(raw_name, self.maker.pipe.spacy_nlp, names, self.config)
+        prepared = self.maker._prepare_raw_names(['Virus M', 'Virus K', 'Virus Z'], batch_size=2)
+        self.assertEqual(names, {name: name_info for raw_name in ['Virus M', 'Virus K', 'Virus Z']
+                                 for name, name_info in prepared[raw_name].items()})
+
+    def test_cb_multiprocess_build_is_the_same(self):
+        maker = CDBMaker(self.config)
+        cdb = maker.prepare_csvs(self.csvs, full_build=True, n_process=2, batch_size=1)
+        maker.destroy_pipe()
+        self.assertEqual(self.cdb.name2cuis, cdb.name2cuis)
+        self.assertEqual(self.cdb.cui2names, cdb.cui2names)
+        self.assertEqual(self.cdb.cui2snames, cdb.cui2snames)
+        self.assertEqual(self.cdb.name2cuis2status, cdb.name2cuis2status)
+        self.assertEqual(self.cdb.cui2preferred_name, cdb.cui2preferred_name)
+        self.assertEqual(self.cdb.addl_info, cdb.addl_info)
+
+    def test_cc_chunked_build_is_the_same(self):
+        for chunk_size in (1, None):
+            maker = CDBMaker(self.config)
+            cdb = maker.prepare_csvs(self.csvs, full_build=True, chunk_size=chunk_size)
+            maker.destroy_pipe()
+            self.assertEqual(self.cdb.cui2names, cdb.cui2names)
+            self.assertEqual(self.cdb.cui2snames, cdb.cui2snames)
+            self.assertEqual(self.cdb.name2cuis2status, cdb.name2cuis2status)
+            self.assertEqual(self.cdb.addl_info, cdb.addl_info)
+
+    def test_cd_only_existing_cuis(self):
+        maker = CDBMaker(self.config)
+        maker.prepare_csvs(self.csvs[:1], chunk_size=2)
+        cdb = maker.prepare_csvs(self.csvs[1:], chunk_size=2, only_existing_cuis=True)
+        maker.destroy_pipe()
+        self.assertEqual({'C0000039', 'C0000139'}, set(cdb.cui2names))
+
+
 if __name__ == '__main__':
     unittest.main()
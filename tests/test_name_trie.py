@@ -0,0 +1,123 @@
+import random
+import unittest
+from spacy.lang.en import English
+from spacy.tokens import Token, Doc, Span
+from medcat.ner.name_trie import NameTrie
+from medcat.ner.vocab_based_ner import NER
+from medcat.config import Config
+from medcat.cdb import CDB
+
+
+def _names(*raw_names):
+    names = {}
+    for raw_name in raw_names:
+        tokens = raw_name.lower().split(" ")
+        snames = set("~".join(tokens[:i]) for i in range(1, len(tokens) + 1))
+        names["~".join(tokens)] = {'tokens': tokens, 'snames': snames, 'raw_name': raw_name, 'is_upper': raw_name.isupper()}
+    return names
+
+
+class NameTrieTests(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.snames = {'heart', 'heart~attack', 'heart~attack~acute', 'attack', 'attack~heart'}
+
+    def test_root(self):
+        trie = NameTrie(self.snames, separator='~')
+        self.assertEqual('heart', trie.names[trie.root('heart')])
+        self.assertIsNone(trie.root('acute'))
+
+    def test_child(self):
+        trie = NameTrie(self.snames, separator='~')
+        node = trie.child(trie.root('heart'), 'attack')
+        self.assertEqual('heart~attack', trie.names[node])
+        self.assertEqual('heart~attack~acute', trie.names[trie.child(node, 'acute')])
+        self.assertIsNone(trie.child(node, 'heart'))
+
+    def test_reverse_child(self):
+        trie = NameTrie(self.snames, separator='~', reverse=True)
+        node = trie.reverse_child(trie.root('heart'), 'attack')
+        self.assertEqual('attack~heart', trie.names[node])
+
+    def test_is_compiled_for(self):
+        snames = set(self.snames)
+        trie = NameTrie(snames, separator='~')
+        self.assertTrue(trie.is_compiled_for(snames))
+        self.assertFalse(trie.is_compiled_for(snames, reverse=True))
+        snames.add('new')
+        self.assertFalse(trie.is_compiled_for(snames))
+
+
+class NERWithNameTrieTests(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        Token.set_extension('to_skip', default=False, force=True)
+        Token.set_extension('norm', default=None, force=True)
+        Doc.set_extension('ents', default=[], force=True)
+        for ext, default in [('confidence', -1), ('id', 0), ('detected_name', None), ('link_candidates', None)]:
+            Span.set_extension(ext, default=default, force=True)
+
+        cls.config = Config()
+        cls.config.ner['min_name_len'] = 2
+        cls.config.ner['upper_case_limit_len'] = 2
+        cls.cdb = CDB(config=cls.config)
+        cls.cdb.add_concept(cui='C1', names=_names('heart attack', 'heart attack acute'), ontologies=set(),
+                            name_status='A', type_ids=set(), description='')
+        cls.cdb.add_concept(cui='C2', names=_names('attack heart', 'kidney', 'kidney failure chronic'), ontologies=set(),
+                            name_status='A', type_ids=set(), description='')
+        cls.nlp = English()
+        cls.text = "Heart attack acute and kidney , , failure chronic with attack heart and kidney failure"
+
+    def _detect(self, use_name_trie, try_reverse_word_order=False, text=None, cdb=None):
+        self.config.ner['use_name_trie'] = use_name_trie
+        self.config.ner['try_reverse_word_order'] = try_reverse_word_order
+        doc = self.nlp.make_doc(text if text is not None else self.text)
+        for tkn in doc:
+            tkn._.norm = tkn.lower_
+            tkn._.to_skip = tkn.is_punct
+        doc._.ents = []
+        doc = NER(cdb if cdb is not None else self.cdb, self.config)(doc)
+        return [(ent._.id, ent.start, ent.end, ent._.detected_name) for ent in doc._.ents]
+
+    def tearDown(self) -> None:
+        self.config.ner['use_name_trie'] = False
+        self.config.ner['try_reverse_word_order'] = False
+
+    def test_same_output_as_default(self):
+        expected = self._detect(use_name_trie=False)
+        self.assertTrue(expected)
+        self.assertEqual(expected, self._detect(use_name_trie=True))
+
+    def test_same_output_as_default_with_reverse_word_order(self):
+        expected = self._detect(use_name_trie=False, try_reverse_word_order=True)
+        self.assertEqual(expected, self._detect(use_name_trie=True, try_reverse_word_order=True))
+
+    def test_max_skip_tokens(self):
+        self.config.ner['max_skip_tokens'] = 1
+        try:
+            self.assertEqual(self._detect(use_name_trie=False), self._detect(use_name_trie=True))
+        finally:
+            self.config.ner['max_skip_tokens'] = 2
+
+    def test_same_output_on_random_texts(self):
+        rng = random.Random(7)
+        words = ['heart', 'attack', 'acute', 'kidney', 'failure', 'chronic', ',']
+        cdb = CDB(config=self.config)
+        for i in range(30):
+            raw_name = " ".join(rng.choice(words[:-1]) for _ in range(rng.randint(1, 4)))
+            cdb.add_concept(cui='C{}'.format(i), names=_names(raw_name), ontologies=set(), name_status='A',
+                            type_ids=set(), description='')
+        found = 0
+        for _ in range(50):
+            text = " ".join(rng.choice(words) for _ in range(rng.randint(1, 30)))
+            for reverse in (False, True):
+                expected = self._detect(use_name_trie=False, try_reverse_word_order=reverse, text=text, cdb=cdb)
+                found += len(expected)
+                self.assertEqual(expected, self._detect(use_name_trie=True, try_reverse_word_order=reverse, text=text, cdb=cdb), text)
+        self.assertGreater(found, 100)
+
+
+if __name__ == '__main__':
+    unittest.main()
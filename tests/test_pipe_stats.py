@@ -0,0 +1,102 @@
+import os
+import unittest
+from spacy.language import Language
+from medcat.vocab import Vocab
+from medcat.cdb import CDB
+from medcat.cat import CAT
+from medcat.pipeline.pipe_stats import PipeStats
+
+
+class PipeStatsTests(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.calls = []
+        self.undertest = PipeStats(hooks=[lambda *args: self.calls.append(args)])
+        for seconds in [0.001, 0.002, 0.003]:
+            self.undertest.record_time('cat_ner', None, seconds)
+        self.undertest.count('disambiguations', 2)
+        for value in [1, 1, 3]:
+            self.undertest.observe('candidates_per_entity', value)
+
+    def test_summary(self):
+        summary = self.undertest.summary()
+        self.assertEqual(3, summary['components']['cat_ner']['docs'])
+        self.assertAlmostEqual(6, summary['components']['cat_ner']['total_ms'])
+        self.assertAlmostEqual(3, summary['components']['cat_ner']['max_ms'])
+        self.assertEqual({'disambiguations': 2}, summary['counters'])
+        self.assertEqual({'1': 2, '3': 1}, summary['histograms']['candidates_per_entity']['values'])
+        self.assertEqual(3, len(self.calls))
+
+    def test_to_prometheus(self):
+        text = self.undertest.to_prometheus()
+        self.assertIn('medcat_component_seconds_count{component="cat_ner"} 3', text)
+        self.assertIn('medcat_disambiguations_total 2', text)
+        self.assertIn('medcat_candidates_per_entity_bucket{le="1"} 2', text)
+        self.assertIn('medcat_candidates_per_entity_bucket{le="+Inf"} 3', text)
+
+    def test_failing_hook(self):
+        self.undertest.hooks.append(lambda *args: 1 / 0)
+        self.undertest.record_time('cat_ner', None, 0.001)
+        self.assertEqual(4, self.undertest.calls['cat_ner'])
+
+    def test_max_samples(self):
+        stats = PipeStats(max_samples=2)
+        for seconds in [0.1, 0.002, 0.001]:
+            stats.record_time('cat_ner', None, seconds)
+        self.assertAlmostEqual(2, stats.summary()['components']['cat_ner']['max_ms'])
+
+
+class PipeWithStatsTests(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        cdb = CDB.load(os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "examples", "cdb.dat"))
+        vocab = Vocab.load(os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "examples", "vocab.dat"))
+        cdb.config.general["spacy_model"] = "en_core_web_md"
+        cdb.config.ner['min_name_len'] = 2
+        cdb.config.ner['upper_case_limit_len'] = 3
+        cdb.config.general['spell_check'] = True
+        cdb.config.general['spell_check_len_limit'] = 5
+        cdb.config.linking['disamb_length_limit'] = 5
+        cls.cat = CAT(cdb=cdb, config=cdb.config, vocab=vocab)
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        cls.cat.destroy_pipe()
+
+    def tearDown(self) -> None:
+        self.cat.pipe.disable_stats()
+
+    def test_enable_stats(self):
+        stats = self.cat.pipe.enable_stats()
+        doc = self.cat("The dog is sitting outside the house and second csv, the virsus.")
+        self.assertGreaterEqual(len(doc.ents), 1)
+
+        self.assertEqual(['tokenizer'] + self.cat.pipe.spacy_nlp.pipe_names, list(stats.calls.keys()))
+        self.assertTrue(all(calls == 1 for calls in stats.calls.values()))
+        self.assertEqual(1, stats.counters['docs'])
+        self.assertEqual(len(doc), stats.counters['tokens'])
+        self.assertEqual(1, stats.counters['spell_check_fixes'])
+        self.assertGreaterEqual(stats.counters['entities'], 1)
+        self.assertGreaterEqual(stats.counters['disambiguations'], 1)
+
+    def test_disable_stats(self):
+        stats = self.cat.pipe.enable_stats()
+        self.cat.pipe.disable_stats()
+        self.cat("The dog is sitting outside the house and second csv.")
+        self.assertIsNone(self.cat.pipe.stats)
+        self.assertEqual(0, len(stats.calls))
+
+    def test_component_returning_none(self):
+        Language.component("return_none", func=lambda doc: None)
+        self.cat.pipe.spacy_nlp.add_pipe("return_none", after="skip_and_punct")
+        try:
+            self.cat.pipe.enable_stats()
+            with self.assertRaisesRegex(ValueError, "'return_none' returned"):
+                self.cat("The dog is sitting outside the house and second csv.")
+        finally:
+            self.cat.pipe.spacy_nlp.remove_pipe("return_none")
+
+
+if __name__ == '__main__':
+    unittest.main()
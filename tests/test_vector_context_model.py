@@ -0,0 +1,154 @@
+import copy
+import unittest
+from unittest.mock import patch
+import numpy as np
+from spacy.lang.en import English
+from spacy.tokens import Token
+from medcat.linking.vector_context_model import ContextModel
+from medcat.config import Config
+from medcat.vocab import Vocab
+from medcat.cdb import CDB
+
+
+class ContextModelTests(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        Token.set_extension('to_skip', default=False, force=True)
+        rng = np.random.RandomState(11)
+
+        cls.config = Config()
+        cls.config.linking['train_count_threshold'] = 2
+        cls.vocab = Vocab()
+        cls.text = "patient with ca of the lung and ms was seen in clinic yesterday"
+        for word in cls.text.split(" "):
+            cls.vocab.add_word(word, cnt=10, vec=rng.rand(30) - 0.5)
+
+        cls.cdb = CDB(config=cls.config)
+        cuis = ['C{}'.format(i) for i in range(12)]
+        for i, cui in enumerate(cuis):
+            cls.cdb.add_concept(cui=cui, names={'ca' if i % 2 else 'ms': {'tokens': [], 'snames': set(), 'raw_name': '', 'is_upper': False}},
+                                ontologies=set(), name_status='P' if i in (3, 4) else 'A', type_ids=set(), description='')
+            # C0 has no vectors and C1 too few training examples, both get a similarity of -1
+            if i > 0:
+                for _ in range(i * 2 if i > 1 else 1):
+                    cls.cdb.update_context_vector(cui=cui, vectors={ct: rng.rand(30) - 0.5 for ct in ['long', 'medium', 'short']})
+        cls.cuis = cuis
+
+        cls.doc = English()(cls.text)
+        cls.cm = ContextModel(cls.cdb, cls.vocab, cls.config)
+
+    def _entities(self):
+        return [(self.cuis[1::2], self.doc[2:3], 'ca'),
+                (self.cuis[0::2], self.doc[7:8], 'ms'),
+                (self.cuis[:2], self.doc[10:11], 'unk-unk'),
+                ([], self.doc[0:1], 'ms')]
+
+    def test_similarities(self):
+        vectors_list = [self.cm.get_context_vectors(entity, self.doc) for _, entity, _ in self._entities()]
+        sims = self.cm.similarities(self.cuis, vectors_list)
+        for row, vectors in enumerate(vectors_list):
+            for col, cui in enumerate(self.cuis):
+                self.assertAlmostEqual(self.cm._similarity(cui, vectors), sims[row, col])
+        self.assertTrue((sims[:, :2] == -1).all())
+
+    def test_disambiguate_batch(self):
+        entities = self._entities()
+        expected = [self.cm.disambiguate(cuis, entity, name, self.doc) for cuis, entity, name in entities]
+        out = self.cm.disambiguate_batch(entities, self.doc)
+
+        self.assertEqual([cui for cui, _ in expected], [cui for cui, _ in out])
+        for (_, sim), (_, expected_sim) in zip(out, expected):
+            self.assertAlmostEqual(expected_sim, sim)
+
+    def test_disambiguate_batch_filter_before_disamb(self):
+        self.config.linking['filter_before_disamb'] = True
+        self.config.linking['filters']['cuis'] = {'C3', 'C4'}
+        try:
+            entities = self._entities()
+            expected = [self.cm.disambiguate(cuis, entity, name, self.doc) for cuis, entity, name in entities]
+            out = self.cm.disambiguate_batch(entities, self.doc)
+            self.assertEqual([cui for cui, _ in expected], [cui for cui, _ in out])
+            for (_, sim), (_, expected_sim) in zip(out, expected):
+                self.assertAlmostEqual(expected_sim, sim)
+        finally:
+            self.config.linking['filter_before_disamb'] = False
+            self.config.linking['filters']['cuis'] = set()
+
+    def _token_context_vectors(self, entity, doc):
+        # Context vectors calculated token by token
+        vectors = {}
+        wf = self.config.linking['weighted_average_function']
+        vec = lambda tkn: self.vocab.vec(tkn.lower_).astype(np.float64)
+        for context_type, size in self.config.linking['context_vector_sizes'].items():
+            left, center, right = self.cm.get_context_tokens(entity, doc, size)
+            values = [wf(step) * vec(tkn) for step, tkn in enumerate(left) if self.vocab.vec_index(tkn.lower_) is not None]
+            values += [vec(tkn) for tkn in center if self.vocab.vec_index(tkn.lower_) is not None]
+            values += [wf(step) * vec(tkn) for step, tkn in enumerate(right) if self.vocab.vec_index(tkn.lower_) is not None]
+            if values:
+                vectors[context_type] = np.average(values, axis=0)
+        return vectors
+
+    def test_get_context_vectors_same_as_token_by_token(self):
+        doc = English()("Patient, with unknown ca of the lung and ms, was seen in the clinic 3 times yesterday with ms.")
+        doc[4]._.to_skip = True
+        for entity in [doc[0:1], doc[4:5], doc[9:10], doc[3:7], doc[-2:-1]]:
+            expected = self._token_context_vectors(entity, doc)
+            vectors = self.cm.get_context_vectors(entity, doc)
+            self.assertEqual(sorted(expected.keys()), sorted(vectors.keys()))
+            for context_type in expected:
+                np.testing.assert_allclose(expected[context_type], vectors[context_type], rtol=1e-6)
+
+    def test_doc_index_is_reused(self):
+        index = self.cm.get_doc_index(self.doc)
+        self.assertIs(index, self.cm.get_doc_index(self.doc))
+        self.assertIsNot(index, self.cm.get_doc_index(English()(self.text)))
+
+    def test_context_vectors_are_memoized(self):
+        doc = English()(self.text)
+        cm = ContextModel(self.cdb, self.vocab, self.config)
+        with patch.object(cm, '_context_vector', wraps=cm._context_vector) as context_vector:
+            vectors = cm.get_context_vectors(doc[2:3], doc)
+            cm.similarity('C3', doc[2:3], doc)
+            self.assertEqual(len(self.config.linking['context_vector_sizes']), context_vector.call_count)
+            # Changing the returned vectors does not change the memo
+            expected = vectors['long'].copy()
+            vectors['long'] += 1
+            np.testing.assert_array_equal(expected, cm.get_context_vectors(doc[2:3], doc)['long'])
+
+    def test_random_replacement_is_not_memoized(self):
+        doc = English()(self.text)
+        cm = ContextModel(self.cdb, self.vocab, self.config)
+        expected = cm.get_context_vectors(doc[2:3], doc)
+        try:
+            # Never replaced, the memoized vectors are used
+            self.config.linking['random_replacement_unsupervised'] = 1
+            with patch.object(cm, '_context_vector', wraps=cm._context_vector) as context_vector:
+                vectors = cm.get_context_vectors(doc[2:3], doc, cui='C3')
+                self.assertEqual(0, context_vector.call_count)
+            for context_type in expected:
+                np.testing.assert_array_equal(expected[context_type], vectors[context_type])
+
+            # Always replaced with a name of the CUI
+            self.config.linking['random_replacement_unsupervised'] = 0
+            with patch.object(cm, '_context_vector', wraps=cm._context_vector) as context_vector:
+                cm.get_context_vectors(doc[2:3], doc, cui='C3')
+                cm.get_context_vectors(doc[2:3], doc, cui='C3')
+                self.assertEqual(2 * len(self.config.linking['context_vector_sizes']), context_vector.call_count)
+        finally:
+            self.config.linking['random_replacement_unsupervised'] = 0.80
+
+    def test_similarities_with_context_vector_store(self):
+        cdb = copy.deepcopy(self.cdb)
+        cdb.compact_context_vectors()
+        cm = ContextModel(cdb, self.vocab, self.config)
+
+        vectors_list = [self.cm.get_context_vectors(entity, self.doc) for _, entity, _ in self._entities()]
+        np.testing.assert_allclose(self.cm.similarities(self.cuis, vectors_list), cm.similarities(self.cuis, vectors_list), rtol=1e-5)
+        for vectors in vectors_list:
+            for cui in self.cuis:
+                self.assertAlmostEqual(self.cm._similarity(cui, vectors), cm._similarity(cui, vectors), places=5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,6 +1,8 @@
 import os
+import pickle
 import shutil
 import unittest
+import numpy as np
 from medcat.vocab import Vocab
 
 
@@ -35,6 +37,102 @@ class CATTests(unittest.TestCase):
         vocab = Vocab.load(vocab_path)
         self.assertEqual(["house", "dog", "test"], list(vocab.vocab.keys()))
 
+    def test_save_and_load_mmap_vectors(self):
+        self.undertest.add_words(os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "examples", "vocab_data.txt"))
+        self.undertest.add_word("test", cnt=31)
+        vocab_path = f"{self.tmp_dir}/vocab.dat"
+        self.undertest.save(vocab_path, mmap_vectors=True)
+        self.assertTrue(os.path.exists(f"{self.tmp_dir}/vocab_vectors.npy"))
+        vocab = Vocab.load(vocab_path)
+        self.assertEqual(["house", "dog", "test"], list(vocab.vocab.keys()))
+        self.assertIsNone(vocab.vec("test"))
+        self.assertEqual(list(self.undertest.vec("dog")), list(vocab.vec("dog")))
+        self.assertIsNotNone(self.undertest.vec("dog"))
+
+    def _add_sampling_words(self):
+        self.undertest.add_word("a", cnt=16, vec=np.array([1.0]))
+        self.undertest.add_word("b", cnt=1)
+        self.undertest.add_word("c", cnt=81, vec=np.array([2.0]))
+        self.undertest.add_word("d", cnt=1, vec=np.array([3.0]))
+
+    def test_make_unigram_table(self):
+        self._add_sampling_words()
+        self.undertest.make_unigram_table(table_size=36)
+        # Counts to the power of 3/4 are 8, 27 and 1 out of 36, "b" has no vector
+        self.assertEqual([0] * 8 + [2] * 27 + [3], list(self.undertest.unigram_table))
+        self.assertIsNone(self.undertest.alias_table)
+
+    def test_alias_table_has_the_same_distribution(self):
+        self._add_sampling_words()
+        self.undertest.make_alias_table()
+        self.assertEqual(0, len(self.undertest.unigram_table))
+        np.random.seed(11)
+        inds = self.undertest.get_negative_samples(n=36000)
+        frequencies = np.bincount(inds, minlength=4) / len(inds)
+        np.testing.assert_allclose([8 / 36, 0, 27 / 36, 1 / 36], frequencies, atol=0.01)
+
+    def test_get_negative_samples_batch(self):
+        self._add_sampling_words()
+        self.undertest.make_unigram_table(table_size=36)
+        np.random.seed(5)
+        expected = self.undertest.get_negative_samples(n=9)
+        np.random.seed(5)
+        batch = self.undertest.get_negative_samples_batch([2, 3, 4])
+        self.assertIsInstance(expected, list)
+        self.assertTrue(all(isinstance(part, list) for part in batch))
+        self.assertEqual([2, 3, 4], [len(part) for part in batch])
+        self.assertEqual(expected, [ind for part in batch for ind in part])
+
+    def test_load_dict_based_vocab(self):
+        vocab_path = f"{self.tmp_dir}/vocab.dat"
+        # The format before the vocab was array based
+        state = {'vocab': {'house': {'vec': np.array([1.0, 2.0]), 'cnt': 3, 'ind': 0},
+                           'dog': {'vec': None, 'cnt': 5, 'ind': 1}},
+                 'index2word': {0: 'house', 1: 'dog'},
+                 'vec_index2word': {0: 'house'},
+                 'unigram_table': np.array([0, 0])}
+        with open(vocab_path, 'wb') as f:
+            pickle.dump(state, f)
+        vocab = Vocab.load(vocab_path)
+        self.assertIsNone(vocab.alias_table)
+        self.assertEqual(["house", "dog"], list(vocab.vocab.keys()))
+        self.assertEqual([1.0, 2.0], list(vocab.vec("house")))
+        self.assertIsNone(vocab.vec("dog"))
+        self.assertEqual(5, vocab.count("dog"))
+        self.assertEqual({0: 'house'}, vocab.vec_index2word)
+        self.assertEqual([0, 0], list(vocab.unigram_table))
+
+    def test_load_examples_vocab(self):
+        vocab = Vocab.load(os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "examples", "vocab.dat"))
+        self.assertEqual(["house", "dog"], list(vocab.vocab.keys()))
+        self.assertEqual(34444, vocab.count("house"))
+
+    def test_items_view(self):
+        self._add_sampling_words()
+        self.assertEqual({'vec': None, 'cnt': 1, 'ind': 1}, dict(self.undertest.vocab['b']))
+        self.undertest.vocab['a']['vec'] = None
+        self.undertest.vocab['b']['cnt'] = 7
+        self.assertIsNone(self.undertest.vec('a'))
+        self.assertEqual(7, self.undertest.count('b'))
+        self.undertest.inc_wc('b', 2)
+        self.assertEqual(9, self.undertest.item('b')['cnt'])
+
+    def test_vectors_are_one_matrix(self):
+        self._add_sampling_words()
+        self.assertEqual(np.float32, self.undertest.vectors.dtype)
+        self.assertEqual([2.0], list(self.undertest.vectors[self.undertest.vec_index('c')]))
+        self.assertIsNone(self.undertest.vec_index('b'))
+        self.assertIsNone(self.undertest.vec_index('unknown'))
+        with self.assertRaises(ValueError):
+            self.undertest.add_vec('b', np.array([1.0, 2.0]))
+
+    def test_remove_words_below_cnt(self):
+        self._add_sampling_words()
+        self.undertest.remove_words_below_cnt(2)
+        self.assertEqual(["a", "c"], list(self.undertest.vocab.keys()))
+        self.assertEqual({0: 'a', 1: 'c'}, self.undertest.vec_index2word)
+        self.assertEqual([2.0], list(self.undertest.vec('c')))
+        self.assertEqual(81, self.undertest.count('c'))
 
 if __name__ == '__main__':
     unittest.main()
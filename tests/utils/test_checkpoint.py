@@ -2,10 +2,13 @@ import os
 import unittest
 import tempfile
 import json
+import dill
+import numpy as np
 from unittest.mock import patch
 from tests.helper import AsyncMock
 from medcat.utils.checkpoint import Checkpoint, CheckpointConfig, CheckpointManager
 from medcat.cdb import CDB
+from medcat.config import Config
 
 
 class CheckpointTest(unittest.TestCase):
@@ -100,3 +103,68 @@ class CheckpointTest(unittest.TestCase):
         ckpt_dir_path = CheckpointManager.get_latest_training_dir(ckpt_out_dir_path)
 
         self.assertTrue("1643823460" in ckpt_dir_path)
+
+
+class DeltaCheckpointTest(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.config = Config()
+        self.cdb = CDB(config=self.config)
+        for cui, name in (('C1', 'fever'), ('C2', 'kidney~failure'), ('C3', 'cold')):
+            self.cdb.add_concept(cui=cui, names={name: {'tokens': name.split('~'), 'snames': {name}, 'raw_name': name, 'is_upper': False}},
+                                 ontologies=set(), name_status='A', type_ids=set(), description='', full_build=False)
+            self.cdb.update_context_vector(cui, {'long': np.random.rand(4), 'short': np.random.rand(4)})
+        self.dir_path = tempfile.TemporaryDirectory()
+
+    def _train(self):
+        self.cdb.update_context_vector('C1', {'long': np.random.rand(4)})
+        self.cdb.update_context_vector('C4', {'long': np.random.rand(4)})
+        self.cdb.name2cuis2status['fever']['C1'] = 'P'
+        self.cdb.remove_names(cui='C3', names={'cold': {}})
+        self.cdb.add_names(cui='C2', names={'renal~failure': {'tokens': ['renal', 'failure'], 'snames': {'renal', 'renal~failure'},
+                                                              'raw_name': 'renal failure', 'is_upper': False}})
+
+    def test_deltas_between_full_checkpoints(self):
+        checkpoint = Checkpoint(dir_path=self.dir_path.name, steps=1, max_to_keep=1, full_every=3)
+        for count in range(1, 6):
+            checkpoint.save(self.cdb, count)
+
+        self.assertEqual({"checkpoint-1-4", "checkpoint-1-5-delta"}, set(os.listdir(self.dir_path.name)))
+
+    def test_restore_from_delta(self):
+        checkpoint = Checkpoint(dir_path=self.dir_path.name, steps=1, max_to_keep=5, full_every=10)
+        checkpoint.save(self.cdb, 1)
+        self._train()
+        checkpoint.save(self.cdb, 2)
+        with open(os.path.join(self.dir_path.name, "checkpoint-1-2-delta"), 'rb') as f:
+            delta = dill.load(f)['delta']
+        self.assertEqual({'C1', 'C2', 'C4'}, set(delta['cuis']))
+        self.assertEqual({'fever', 'renal~failure', 'cold'}, set(delta['names']))
+        self.assertNotIn('name2cuis', delta['names']['cold'])
+
+        cdb = Checkpoint(dir_path=self.dir_path.name, steps=1).restore_latest_cdb()
+        self.assertEqual(self.cdb.get_hash(), cdb.get_hash())
+        self.assertEqual(self.cdb.cui2names, cdb.cui2names)
+        np.testing.assert_array_equal(self.cdb.cui2context_vectors['C4']['long'], cdb.cui2context_vectors['C4']['long'])
+
+    def test_delta_without_private_fields(self):
+        sections_dir = tempfile.TemporaryDirectory()
+        self.cdb.save_sections(sections_dir.name)
+        self.cdb = CDB.load(sections_dir.name)
+        self.assertIn('_cdb_sections', self.cdb.__dict__)
+        self.cdb.track_updates()
+
+        checkpoint = Checkpoint(dir_path=self.dir_path.name, steps=1, max_to_keep=5, full_every=10)
+        checkpoint.save(self.cdb, 1)
+        self._train()
+        checkpoint.save(self.cdb, 2)
+        with open(os.path.join(self.dir_path.name, "checkpoint-1-2-delta"), 'rb') as f:
+            delta = dill.load(f)['delta']
+        self.assertEqual([], [field for field in delta['other'] if field.startswith('_')])
+
+        cdb = Checkpoint(dir_path=self.dir_path.name, steps=1).restore_latest_cdb()
+        self.assertNotIn('_cdb_sections', cdb.__dict__)
+        self.assertNotIn('_cui2updates', cdb.__dict__)
+        self.assertEqual(self.cdb.cui2names, cdb.cui2names)
+        self.assertEqual(self.cdb.name2cuis2status, cdb.name2cuis2status)
+        np.testing.assert_array_equal(self.cdb.cui2context_vectors['C4']['long'], cdb.cui2context_vectors['C4']['long'])
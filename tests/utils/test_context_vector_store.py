@@ -0,0 +1,75 @@
+import pickle
+import unittest
+import numpy as np
+from medcat.utils.context_vector_store import ContextVectorStore
+from medcat.utils.matutils import unitvec
+
+
+class ContextVectorStoreTest(unittest.TestCase):
+
+    def setUp(self) -> None:
+        rng = np.random.RandomState(3)
+        self.cui2context_vectors = {
+            'C{}'.format(i): {ct: rng.rand(5) for ct in (['long', 'short'] if i % 2 else ['long'])} for i in range(100)
+        }
+        self.undertest = ContextVectorStore(self.cui2context_vectors)
+
+    def test_dict_like_access(self):
+        self.assertEqual(100, len(self.undertest))
+        self.assertEqual(list(self.cui2context_vectors.keys()), list(self.undertest.keys()))
+        self.assertEqual(['long'], list(self.undertest['C0'].keys()))
+        self.assertEqual({'long', 'short'}, set(self.undertest['C1']))
+        self.assertIn('short', self.undertest['C1'])
+        self.assertNotIn('short', self.undertest['C0'])
+        self.assertEqual({}, dict(self.undertest.get('C100', {})))
+        np.testing.assert_allclose(self.cui2context_vectors['C7']['short'], self.undertest['C7']['short'], rtol=1e-6)
+
+    def test_set_vector_updates_norm(self):
+        self.undertest['C0']['long'] = np.array([3, 4, 0, 0, 0])
+        self.undertest['C0']['short'] = np.array([0, 0, 0, 0, 2])
+        self.assertAlmostEqual(5, self.undertest.get_norm('C0', 'long'))
+        np.testing.assert_allclose([0.6, 0.8, 0, 0, 0], self.undertest.unit_vector('C0', 'long'), rtol=1e-6)
+        np.testing.assert_allclose([0, 0, 0, 0, 1], self.undertest.unit_vector('C0', 'short'), rtol=1e-6)
+
+    def test_new_cui(self):
+        self.undertest['C100'] = {}
+        self.assertEqual(0, len(self.undertest['C100']))
+        self.undertest['C100']['medium'] = np.ones(5)
+        self.assertEqual(['medium'], list(self.undertest['C100'].keys()))
+        self.assertEqual(['long', 'short', 'medium'], self.undertest.context_types)
+
+    def test_unit_matrix(self):
+        cuis = ['C1', 'C5', 'C3']
+        expected = np.array([unitvec(self.cui2context_vectors[cui]['short']) for cui in cuis])
+        np.testing.assert_allclose(expected, self.undertest.unit_matrix(cuis, 'short'), rtol=1e-6)
+        with self.assertRaises(KeyError):
+            self.undertest.unit_matrix(['C1', 'C2'], 'short')
+
+    def test_delete(self):
+        del self.undertest['C10']
+        del self.undertest['C1']['short']
+        self.assertEqual(99, len(self.undertest))
+        self.assertNotIn('C10', self.undertest)
+        self.assertEqual(['long'], list(self.undertest['C1'].keys()))
+        # The last CUI was moved into the free row
+        np.testing.assert_allclose(self.cui2context_vectors['C99']['short'], self.undertest['C99']['short'], rtol=1e-6)
+
+    def test_vectors_are_read_only(self):
+        with self.assertRaises(ValueError):
+            self.undertest['C1']['long'][0] = 1
+
+    def test_pickle(self):
+        store = pickle.loads(pickle.dumps(self.undertest))
+        self.assertEqual(list(self.undertest.keys()), list(store.keys()))
+        for cui in self.cui2context_vectors:
+            for context_type, vector in self.undertest[cui].items():
+                np.testing.assert_array_equal(vector, store[cui][context_type])
+                self.assertEqual(self.undertest.get_norm(cui, context_type), store.get_norm(cui, context_type))
+
+    def test_to_dict(self):
+        for cui, vectors in self.undertest.to_dict().items():
+            self.assertEqual(set(self.cui2context_vectors[cui].keys()), set(vectors.keys()))
+
+
+if __name__ == '__main__':
+    unittest.main()
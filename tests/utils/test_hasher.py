@@ -0,0 +1,34 @@
+import unittest
+import numpy as np
+from medcat.utils.hasher import Hasher
+
+
+def _hash(obj):
+    hasher = Hasher()
+    hasher.update_structure(obj)
+    return hasher.hexdigest()
+
+
+class UpdateStructureTests(unittest.TestCase):
+
+    def test_values_change_the_hash(self):
+        value = {'a': {'x', 'y'}, 'b': [1, 2.5, None], 'c': np.arange(3, dtype=np.float32)}
+        self.assertEqual(_hash(value), _hash({'a': {'y', 'x'}, 'b': [1, 2.5, None], 'c': np.arange(3, dtype=np.float32)}))
+        self.assertNotEqual(_hash(value), _hash({'a': {'x', 'z'}, 'b': [1, 2.5, None], 'c': np.arange(3, dtype=np.float32)}))
+        self.assertNotEqual(_hash(value), _hash({'a': {'x', 'y'}, 'b': [1, 2.6, None], 'c': np.arange(3, dtype=np.float32)}))
+        self.assertNotEqual(_hash(value), _hash({'a': {'x', 'y'}, 'b': [1, 2.5, None], 'c': np.arange(3, dtype=np.float64)}))
+
+    def test_types_are_not_mixed_up(self):
+        self.assertNotEqual(_hash(['ab']), _hash(['a', 'b']))
+        self.assertNotEqual(_hash([1]), _hash(['1']))
+        self.assertNotEqual(_hash([1]), _hash((1,)))
+        self.assertNotEqual(_hash({'a': 1}), _hash([('a', 1)]))
+
+    def test_arrays_are_hashed_by_content(self):
+        a = np.arange(6, dtype=np.float32).reshape(2, 3)
+        self.assertEqual(_hash(a[:, 1]), _hash(np.array([1, 4], dtype=np.float32)))
+        self.assertNotEqual(_hash(a), _hash(a.reshape(3, 2)))
+
+
+if __name__ == '__main__':
+    unittest.main()
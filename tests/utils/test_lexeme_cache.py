@@ -0,0 +1,44 @@
+import unittest
+from medcat.utils.lexeme_cache import LexemeCache, FrozenValues
+
+
+class LexemeCacheTests(unittest.TestCase):
+
+    def test_cleared_when_signature_changes(self):
+        cache = LexemeCache()
+        cache.check(('a', 1))
+        cache.add(1, 'x')
+        cache.check(('a', 1))
+        self.assertEqual('x', cache.get(1))
+        cache.check(('a', 2))
+        self.assertIsNone(cache.get(1))
+
+    def test_cleared_when_full(self):
+        cache = LexemeCache(maxsize=2)
+        cache.add(1, 'x')
+        cache.add(2, 'y')
+        self.assertEqual('z', cache.add(3, 'z'))
+        self.assertEqual({3: 'z'}, dict(cache))
+
+    def test_disabled(self):
+        cache = LexemeCache(maxsize=0)
+        self.assertEqual('x', cache.add(1, 'x'))
+        self.assertEqual(0, len(cache))
+
+
+class FrozenValuesTests(unittest.TestCase):
+
+    def test_copied_again_only_on_change(self):
+        frozen = FrozenValues()
+        values = {'a', 'b'}
+        first = frozen(values)
+        self.assertEqual(frozenset(['a', 'b']), first)
+        self.assertIs(first, frozen(values))
+        values.add('c')
+        self.assertEqual(frozenset(['a', 'b', 'c']), frozen(values))
+        self.assertEqual(frozenset(['x', 'y', 'z']), frozen({'x', 'y', 'z'}))
+        self.assertIsNone(frozen(None))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,40 @@
+import unittest
+from medcat.utils.lru_cache import LRUCache
+
+
+class LRUCacheTests(unittest.TestCase):
+
+    def test_evicts_least_recently_used(self):
+        cache = LRUCache(maxsize=2)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        cache.get('a')
+        cache.put('c', 3)
+        self.assertIn('a', cache)
+        self.assertNotIn('b', cache)
+        self.assertIn('c', cache)
+        self.assertEqual(2, len(cache))
+
+    def test_counts_hits_and_misses(self):
+        cache = LRUCache(maxsize=10)
+        cache.put('a', None)
+        self.assertIsNone(cache.get('a', 'default'))
+        self.assertEqual('default', cache.get('b', 'default'))
+        self.assertEqual({'hits': 1, 'misses': 1, 'hit_rate': 0.5, 'size': 1, 'maxsize': 10}, cache.info())
+
+    def test_get_or_compute(self):
+        cache = LRUCache(maxsize=10)
+        calls = []
+        compute = lambda key: calls.append(key) or key.upper()
+        self.assertEqual('A', cache.get_or_compute('a', compute))
+        self.assertEqual('A', cache.get_or_compute('a', compute))
+        self.assertEqual(['a'], calls)
+
+    def test_disabled(self):
+        cache = LRUCache(maxsize=0)
+        cache.put('a', 1)
+        self.assertEqual(0, len(cache))
+
+
+if __name__ == '__main__':
+    unittest.main()
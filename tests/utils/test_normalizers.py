@@ -0,0 +1,129 @@
+import random
+import unittest
+import spacy
+from unittest.mock import patch
+from medcat.config import Config
+from medcat.pipe import Pipe
+from medcat.preprocessing.taggers import tag_skip_and_punct
+from medcat.preprocessing.tokenizers import spacy_split_all
+from medcat.utils.normalizers import BasicSpellChecker, SymSpellChecker, TokenNormalizer
+
+
+class SymSpellCheckerTests(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        rng = random.Random(3)
+        cls.config = Config()
+        cls.vocab = {}
+        for _ in range(3000):
+            cls.vocab["".join(rng.choice("abcdefghij") for _ in range(rng.randint(3, 9)))] = rng.randint(1, 1000)
+        cls.words = list(cls.vocab.keys())
+
+        # Misspell words from the vocab with one or two random edits
+        cls.misspelled = []
+        for word in rng.sample(cls.words, 300):
+            for _ in range(rng.randint(1, 2)):
+                i = rng.randrange(len(word))
+                word = rng.choice([word[:i] + word[i + 1:], word[:i] + rng.choice("abcdefghijk") + word[i:],
+                                   word[:i] + rng.choice("abcdefghijk") + word[i + 1:]])
+            cls.misspelled.append(word)
+
+    def tearDown(self) -> None:
+        self.config.general['spell_check_deep'] = False
+
+    def test_candidates_same_as_basic(self):
+        basic = BasicSpellChecker(cdb_vocab=self.vocab, config=self.config)
+        undertest = SymSpellChecker(cdb_vocab=self.vocab, config=self.config)
+        for word in self.misspelled:
+            self.assertEqual(set(basic.candidates(word)), set(undertest.candidates(word)), word)
+
+    def test_fix_deep(self):
+        self.config.general['spell_check_deep'] = True
+        basic = BasicSpellChecker(cdb_vocab=self.vocab, config=self.config)
+        undertest = SymSpellChecker(cdb_vocab=self.vocab, config=self.config)
+        for word in self.misspelled[:100]:
+            expected = basic.fix(word)
+            fix = undertest.fix(word)
+            # Ties in count can be broken differently
+            self.assertEqual(basic.P(expected) if expected else None, basic.P(fix) if fix else None, word)
+
+    def test_index_rebuilt_when_vocab_changes(self):
+        vocab = dict(self.vocab)
+        undertest = SymSpellChecker(cdb_vocab=vocab, config=self.config)
+        index = undertest.get_index()
+        self.assertIsNone(undertest.fix('zzzzzzzy'))
+        vocab['zzzzzzzz'] = 10
+        self.assertEqual('zzzzzzzz', undertest.fix('zzzzzzzy'))
+        self.assertIsNot(index, undertest.index)
+
+
+class TokenNormalizerCacheTests(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.config = Config()
+        cls.config.general['log_level'] = 0
+        cls.config.general['spell_check_len_limit'] = 5
+        cls.spell_checker = BasicSpellChecker(cdb_vocab={'virus': 10, 'kidney': 10, 'running': 10, 'failure': 10}, config=cls.config)
+        cls.pipe = Pipe(tokenizer=spacy_split_all, config=cls.config)
+        cls.pipe.add_tagger(tagger=tag_skip_and_punct, name="skip_and_punct", additional_fields=["is_punct"])
+        cls.pipe.add_token_normalizer(spell_checker=cls.spell_checker, config=cls.config)
+        cls.normalizer = [c for _, c in cls.pipe.spacy_nlp.pipeline if isinstance(c, TokenNormalizer)][0]
+
+    def setUp(self) -> None:
+        self.normalizer.cache.clear()
+
+    def tearDown(self) -> None:
+        self.spell_checker.vocab.pop('fever', None)
+        self.config.general['spell_check_deep'] = False
+
+    def test_fixes_are_cached(self):
+        doc = self.pipe("kidnney virsus and kidnney failture")
+        self.assertEqual(['kidney', 'virus', 'and', 'kidney', 'failure'], [token._.norm for token in doc])
+        # Both kidnney tokens and the correct words are looked up, but only the misspellings are computed
+        self.assertEqual(3, len(self.normalizer.cache))
+        self.assertEqual(1, self.normalizer.cache.hits)
+        self.assertEqual(3, self.normalizer.cache.misses)
+
+    def test_unfixable_words_are_cached(self):
+        self.pipe("zzzzzzz zzzzzzz")
+        self.assertIn('zzzzzzz', self.normalizer.cache)
+        self.assertIsNone(self.normalizer.cache.get('zzzzzzz', 'missing'))
+
+    def test_prewarm(self):
+        added = self.pipe.prewarm_spell_check_cache(["Kidnney virsus, kidney 12345678", "kidnney"])
+        self.assertEqual(2, added)
+        self.assertEqual('kidney', self.normalizer.cache.get('kidnney'))
+        self.pipe("kidnney virsus")
+        self.assertEqual(2, len(self.normalizer.cache))
+        self.assertEqual(0, self.normalizer.cache.misses)
+
+    def test_fixes_are_updated_when_the_vocab_changes(self):
+        self.assertEqual(['feverr'], [token._.norm for token in self.pipe("feverr")])
+        self.spell_checker.vocab['fever'] = 10
+        self.assertEqual(['fever'], [token._.norm for token in self.pipe("feverr")])
+
+    def test_cache_emptied_when_settings_change(self):
+        self.pipe("zzzzzzz")
+        self.assertIn('zzzzzzz', self.normalizer.cache)
+        self.config.general['spell_check_deep'] = True
+        self.pipe("virus")
+        self.assertNotIn('zzzzzzz', self.normalizer.cache)
+
+    def test_fixes_are_lemmatized_with_the_pipe_nlp(self):
+        self.assertIs(self.pipe.spacy_nlp, self.normalizer.nlp)
+        self.assertNotIn(TokenNormalizer.name, self.normalizer.components)
+        doc = self.pipe("runnning")
+        self.assertEqual(['run'], [token._.norm for token in doc])
+
+    def test_spacy_is_loaded_once(self):
+        with patch('spacy.load', wraps=spacy.load) as load:
+            pipe = Pipe(tokenizer=spacy_split_all, config=self.config)
+            pipe.add_tagger(tagger=tag_skip_and_punct, name="skip_and_punct", additional_fields=["is_punct"])
+            pipe.add_token_normalizer(spell_checker=self.spell_checker, config=self.config)
+        self.assertEqual(1, load.call_count)
+
+
+if __name__ == '__main__':
+    unittest.main()
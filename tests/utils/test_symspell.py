@@ -0,0 +1,58 @@
+import os
+import random
+import tempfile
+import unittest
+from medcat.utils.symspell import DeleteIndex, deletes, edit_distance
+
+
+class SymSpellTests(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        rng = random.Random(7)
+        cls.words = list(set("".join(rng.choice("abcdef") for _ in range(rng.randint(2, 10))) for _ in range(2000)))
+        cls.index = DeleteIndex(cls.words, max_distance=2, prefix_length=4)
+
+    def test_deletes(self):
+        self.assertEqual({'abc', 'bc', 'ac', 'ab'}, deletes('abc', 1))
+        self.assertEqual({'abc', 'bc', 'ac', 'ab', 'a', 'b', 'c'}, deletes('abc', 2))
+
+    def test_edit_distance(self):
+        self.assertEqual(0, edit_distance('kidney', 'kidney'))
+        self.assertEqual(1, edit_distance('kidnye', 'kidney'))
+        self.assertEqual(1, edit_distance('kidny', 'kidney'))
+        self.assertEqual(2, edit_distance('kidn', 'kidney'))
+        self.assertEqual(3, edit_distance('kid', 'kidney'))
+        self.assertEqual(3, edit_distance('kid', 'kidney', max_distance=2))
+        # '-' can not be inserted or used as a replacement, but can be deleted
+        self.assertEqual(3, edit_distance('covid19', 'covid-19', letters='abcdefghijklmnopqrstuvwxyz', max_distance=2))
+        self.assertEqual(1, edit_distance('covid-19', 'covid19', letters='abcdefghijklmnopqrstuvwxyz'))
+
+    def test_lookup_same_as_brute_force(self):
+        rng = random.Random(11)
+        for word in rng.sample(self.words, 50) + ["".join(rng.choice("abcdefg") for _ in range(6)) for _ in range(50)]:
+            for max_distance in (1, 2):
+                expected = set((w, d) for w in self.words for d in [edit_distance(word, w, max_distance=max_distance)] if d <= max_distance)
+                self.assertEqual(expected, set(self.index.lookup(word, max_distance=max_distance)), word)
+
+    def test_lookup_over_max_distance(self):
+        with self.assertRaises(ValueError):
+            DeleteIndex(self.words, max_distance=1).lookup('abc', max_distance=2)
+
+    def test_is_compiled_for(self):
+        vocab = {word: 1 for word in self.words}
+        self.assertTrue(self.index.is_compiled_for(vocab, max_distance=1))
+        vocab['new'] = 1
+        self.assertFalse(self.index.is_compiled_for(vocab, max_distance=1))
+
+    def test_save_and_load(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "index.dat")
+            self.index.save(path)
+            index = DeleteIndex.load(path)
+        self.assertEqual(self.index.deletes, index.deletes)
+        self.assertEqual(sorted(self.index.lookup('abcd', 2)), sorted(index.lookup('abcd', 2)))
+
+
+if __name__ == '__main__':
+    unittest.main()